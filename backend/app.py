@@ -1,21 +1,40 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, send_from_directory
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, stream_with_context
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from flask_cors import CORS
-from models import db, User, Crop, Transaction, Price, ChatMessage
+from models import db, User, Crop, Transaction, BuyOrder, Price, LatestPrice, ChatMessage, upgrade_schema, price_history, decrement_stock, release_stock, crops_near, record_sale, sales_summary, PRICE_BUCKETS
 from config import Config
+from ingest import ingest_price_stream, detect_format
+from cache import ResponseCache
+from llm import LLMClient, LLMUnavailable, LLMAuthError
+from chat_cache import ChatResponseCache
+from intents import intent_matcher, FALLBACK_RESPONSES
+from chat_log import ChatLogWriter, archive_chat_messages
+from search import search_crops
+from geo import parse_point
+from metrics import Metrics
+from bulk import parse_items, bulk_create, bulk_update, bulk_delete, clean_number, BulkError
+from assets import AssetPipeline
+from events import EventBroker
+from forecast import run_forecasts, price_forecast, describe_forecast, forecast_index
+from matching import MatchingEngine
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, timedelta
+import base64
+import click
+import json
 import os
 import sys
+import time
 import openai
 
-# Get the frontend directory path
-FRONTEND_DIR = os.path.join(os.path.dirname(__file__), '..', 'frontend')
-
-# Initialize Flask app
-app = Flask(__name__, static_folder=FRONTEND_DIR, static_url_path='')
+# Initialize Flask app; frontend files are served by the asset pipeline, not Flask's static route
+app = Flask(__name__, static_folder=None)
 app.config.from_object(Config)
 
 # Initialize OpenAI API
 openai.api_key = app.config['OPENAI_API_KEY']
+if app.config['OPENAI_API_BASE']:
+    openai.api_base = app.config['OPENAI_API_BASE']
 
 # Initialize extensions
 db.init_app(app)
@@ -23,6 +42,22 @@ login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'index'  # type: ignore
 CORS(app)
+response_cache = ResponseCache(app)
+llm_client = LLMClient(app)
+chat_cache = ChatResponseCache(app)
+chat_log = ChatLogWriter(app)
+metrics = Metrics(app)
+assets = AssetPipeline(app)
+events = EventBroker(app)
+matching_engine = MatchingEngine(app)
+metrics.add_gauge('kisan_chat_cache_entries', 'Answers held in the chatbot cache.', lambda: len(chat_cache.entries))
+metrics.add_gauge('kisan_chat_cache_hit_ratio', 'Share of chat lookups answered from the cache.',
+                  lambda: chat_cache.stats()['hit_rate'])
+metrics.add_gauge('kisan_llm_circuit_open', '1 while the LLM circuit breaker is refusing calls.',
+                  lambda: int(llm_client.breaker.state == 'open'))
+metrics.add_gauge('kisan_event_subscribers', 'Open /api/events streams.', lambda: events.subscribers)
+metrics.add_gauge('kisan_open_buy_orders', 'Buy orders resting in the order books.',
+                  lambda: len(matching_engine.orders))
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -38,6 +73,72 @@ def init_db():
         # Add default prices
         init_default_prices()
 
+@app.cli.command()
+def migrate_db():
+    """Upgrade an existing database to the current schema."""
+    with app.app_context():
+        upgrade_schema()
+        print("Database migrated!")
+
+@app.cli.command()
+@click.argument('username')
+@click.option('--email', help='Required when creating a new account.')
+@click.option('--password', prompt=True, hide_input=True, confirmation_prompt=True)
+def create_admin(username, email, password):
+    """Create an admin account, or make an existing user an admin."""
+    with app.app_context():
+        user = User.query.filter_by(username=username).first()
+        if user is None:
+            if not email:
+                raise click.UsageError('--email is required for a new account')
+            user = User(username=username, email=email)
+            db.session.add(user)
+        user.role = 'admin'
+        user.set_password(password)
+        db.session.commit()
+        print(f"{username} is an admin")
+
+@app.cli.command()
+def build_assets():
+    """Minify, hash and pre-compress the frontend into the asset build directory."""
+    manifest = assets.build()
+    print(f"Built {len(manifest['files'])} assets into {assets.build_dir}")
+
+@app.cli.command()
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), help='Defaults to the file extension.')
+@click.option('--source', default='agmarknet', help='Source recorded on rows that do not name one.')
+@click.option('--batch-size', default=5000, show_default=True)
+def ingest_prices(path, fmt, source, batch_size):
+    """Bulk-load a CSV/JSONL mandi price dump."""
+    with app.app_context():
+        with open(path, encoding='utf-8-sig', newline='') as f:
+            report = ingest_price_stream(f, fmt or detect_format(path), source, batch_size)
+        response_cache.invalidate('prices')
+        print(f"Loaded {report['rows']} rows ({report['skipped']} skipped) "
+              f"in {report['seconds']}s - {report['rows_per_sec']} rows/sec")
+
+@app.cli.command()
+def forecast_prices():
+    """Refit the price forecast for every crop and location (run daily, e.g. from cron)."""
+    with app.app_context():
+        report = run_forecasts(app.config['FORECAST_HORIZON'], app.config['FORECAST_MIN_MONTHS'],
+                               app.config['FORECAST_HISTORY_MONTHS'])
+        response_cache.invalidate('prices')
+        print(f"Forecast {report['series']} series ({report['skipped']} skipped, too little history) "
+              f"in {report['seconds']}s, {report['fit_seconds']}s fitting")
+
+@app.cli.command()
+@click.option('--days', type=int, help='Archive messages older than this many days (default CHAT_RETENTION_DAYS).')
+@click.option('--out-dir', type=click.Path(file_okay=False), help='Where to write the .jsonl.gz archive.')
+def archive_chats(days, out_dir):
+    """Move old chat messages out of the database into a compressed archive."""
+    with app.app_context():
+        days = days if days is not None else app.config['CHAT_RETENTION_DAYS']
+        out_dir = out_dir or os.path.join(app.instance_path, app.config['CHAT_ARCHIVE_DIR'])
+        count, path = archive_chat_messages(datetime.utcnow() - timedelta(days=days), out_dir)
+        print(f"Archived {count} chat messages" + (f" to {path}" if path else ""))
+
 def init_default_prices():
     """Initialize demo prices"""
     demo_prices = [
@@ -51,13 +152,32 @@ def init_default_prices():
         if not Price.query.filter_by(crop_name=price.crop_name).first():
             db.session.add(price)
     db.session.commit()
+    response_cache.invalidate('prices')
+
+def prepare_database():
+    """Migrate the schema and seed demo prices; run once per start, before serving"""
+    with app.app_context():
+        upgrade_schema()
+        # Ensure demo price data exists on startup for local development
+        try:
+            init_default_prices()
+        except Exception:
+            # If DB already has data or migrations are not ready, ignore
+            db.session.rollback()
 
 # ==================== AUTHENTICATION ROUTES ====================
+# Roles anyone may sign up for; admins are made with 'flask create-admin'
+SIGNUP_ROLES = ('farmer', 'buyer')
+
 @app.route('/api/signup', methods=['POST'])
 def signup():
     """User signup endpoint"""
     data = request.get_json()
     
+    role = data.get('role', 'farmer')
+    if role not in SIGNUP_ROLES:
+        return jsonify({'error': 'Role must be farmer or buyer'}), 400
+    
     if User.query.filter_by(username=data.get('username')).first():
         return jsonify({'error': 'Username already exists'}), 400
     
@@ -67,7 +187,7 @@ def signup():
     user = User(  # type: ignore
         username=data.get('username'),  # type: ignore
         email=data.get('email'),  # type: ignore
-        role=data.get('role', 'farmer'),  # type: ignore
+        role=role,  # type: ignore
         phone=data.get('phone'),  # type: ignore
         location=data.get('location')  # type: ignore
     )
@@ -107,26 +227,150 @@ def get_user():
     return jsonify(current_user.to_dict()), 200
 
 # ==================== MARKETPLACE ROUTES ====================
+# Sort keys accepted by /api/crops; every sort is made stable by Crop.id
+CROP_SORT_COLUMNS = {
+    'created_at': Crop.created_at,
+    'price_per_unit': Crop.price_per_unit,
+    'quantity': Crop.quantity,
+}
+
+def encode_cursor(value, row_id):
+    """Encode the last row's (sort value, id) as an opaque cursor"""
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([value, row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def decode_cursor(cursor, sort):
+    """Decode a cursor produced by encode_cursor, or raise ValueError"""
+    try:
+        value, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if sort == 'created_at':
+            value = datetime.fromisoformat(value)
+        return value, int(row_id)
+    except (TypeError, ValueError, json.JSONDecodeError) as e:
+        raise ValueError('Invalid cursor') from e
+
+def stream_json_array(rows, fields=None):
+    """Serialize crops one at a time instead of building the whole list"""
+    yield '['
+    for i, crop in enumerate(rows):
+        yield (',' if i else '') + app.json.dumps(crop.to_dict(fields))
+    yield ']'
+
 @app.route('/api/crops', methods=['GET'])
+@response_cache.cached('crops')
 def get_crops():
-    """Get all available crops"""
+    """Get available crops, optionally paginated with ?limit=&cursor=
+
+    Supports ?sort=created_at|price_per_unit|quantity, ?order=asc|desc,
+    ?fields=id,crop_name,... to return slim listings and
+    ?near=lat,lon&radius_km= for the closest listings first.
+    """
     category = request.args.get('category')
     location = request.args.get('location')
+    sort = request.args.get('sort', 'created_at')
+    order = request.args.get('order', 'desc')
+    
+    if sort not in CROP_SORT_COLUMNS or order not in ('asc', 'desc'):
+        return jsonify({'error': 'Invalid sort or order'}), 400
+    
+    fields = None
+    if request.args.get('fields'):
+        fields = [f.strip() for f in request.args['fields'].split(',') if f.strip()]
+        if not fields or any(f not in Crop.FIELDS for f in fields):
+            return jsonify({'error': 'Invalid fields'}), 400
     
     query = Crop.query.filter_by(status='available')
+    if fields is None or 'seller' in fields:
+        # Load sellers in the same SELECT so to_dict() doesn't issue one query per row
+        query = query.options(db.joinedload(Crop.seller))
     
     if category:
         query = query.filter_by(category=category)
     if location:
         query = query.filter_by(location=location)
+
+    if request.args.get('near'):
+        # Nearest listings first; replaces sort and cursor paging
+        try:
+            lat, lon = parse_point(request.args['near'])
+            radius_km = float(request.args.get('radius_km', app.config['GEO_DEFAULT_RADIUS_KM']))
+            limit = int(request.args.get('limit', app.config['CROPS_PAGE_SIZE']))
+        except ValueError:
+            return jsonify({'error': 'near must be lat,lon and radius_km/limit numbers'}), 400
+        radius_km = max(0.0, min(radius_km, app.config['GEO_MAX_RADIUS_KM']))
+        limit = max(1, min(limit, app.config['CROPS_PAGE_MAX']))
+        return jsonify({
+            'crops': [dict(crop.to_dict(fields), distance_km=distance)
+                      for crop, distance in crops_near(query, lat, lon, radius_km, limit)],
+            'next_cursor': None
+        }), 200
+
+    column = CROP_SORT_COLUMNS[sort]
+    key = db.tuple_(column, Crop.id)
+    if order == 'desc':
+        query = query.order_by(column.desc(), Crop.id.desc())
+    else:
+        query = query.order_by(column.asc(), Crop.id.asc())
+    
+    cursor = request.args.get('cursor')
+    if 'limit' not in request.args and not cursor:
+        # Unpaginated feed: stream rows out in batches rather than materializing them
+        rows = query.yield_per(500)
+        return app.response_class(stream_with_context(stream_json_array(rows, fields)),
+                                  mimetype='application/json'), 200
     
-    crops = query.all()
-    return jsonify([crop.to_dict() for crop in crops]), 200
+    try:
+        limit = int(request.args.get('limit', app.config['CROPS_PAGE_SIZE']))
+        if cursor:
+            last = decode_cursor(cursor, sort)
+            query = query.filter(key < last if order == 'desc' else key > last)
+    except ValueError:
+        return jsonify({'error': 'Invalid limit or cursor'}), 400
+    limit = max(1, min(limit, app.config['CROPS_PAGE_MAX']))
+    
+    # Fetch one extra row to know whether another page exists
+    crops = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(crops) > limit:
+        crops = crops[:limit]
+        last_crop = crops[-1]
+        next_cursor = encode_cursor(getattr(last_crop, sort), last_crop.id)
+    
+    return jsonify({
+        'crops': [crop.to_dict(fields) for crop in crops],
+        'next_cursor': next_cursor
+    }), 200
+
+@app.route('/api/crops/search', methods=['GET'])
+@response_cache.cached('crops')
+def search_crop_listings():
+    """Full-text search over available crops, tolerant of prefixes and typos
+
+    ?q=tomat&min_price=&max_price=&min_quantity=&max_quantity=&category=&location=&limit=
+    """
+    filters = {'category': request.args.get('category'), 'location': request.args.get('location')}
+    try:
+        for name in ('min_price', 'max_price', 'min_quantity', 'max_quantity'):
+            if request.args.get(name):
+                filters[name] = float(request.args[name])
+        limit = int(request.args.get('limit', app.config['CROPS_PAGE_SIZE']))
+    except ValueError:
+        return jsonify({'error': 'Invalid number in price, quantity or limit'}), 400
+    limit = max(1, min(limit, app.config['CROPS_PAGE_MAX']))
+
+    crops, corrected = search_crops(request.args.get('q', ''), filters, limit)
+    return jsonify({
+        'crops': [crop.to_dict() for crop in crops],
+        'corrected': corrected
+    }), 200
 
 @app.route('/api/crops/<int:crop_id>', methods=['GET'])
+@response_cache.cached('crops')
 def get_crop(crop_id):
     """Get single crop details"""
-    crop = Crop.query.get(crop_id)
+    crop = db.session.get(Crop, crop_id, options=[db.joinedload(Crop.seller)])
     if not crop:
         return jsonify({'error': 'Crop not found'}), 404
     return jsonify(crop.to_dict()), 200
@@ -152,6 +396,9 @@ def create_crop():
     
     db.session.add(crop)
     db.session.commit()
+    match_listings([crop.id])
+    response_cache.invalidate('crops')
+    publish_crop(crop, 'crop.created')
     
     return jsonify({'message': 'Crop listed successfully', 'crop_id': crop.id}), 201
 
@@ -170,6 +417,9 @@ def update_crop(crop_id):
     crop.status = data.get('status', crop.status)
     
     db.session.commit()
+    match_listings([crop.id])
+    response_cache.invalidate('crops')
+    publish_crop(crop)
     return jsonify({'message': 'Crop updated successfully'}), 200
 
 @app.route('/api/crops/<int:crop_id>', methods=['DELETE'])
@@ -179,18 +429,181 @@ def delete_crop(crop_id):
     crop = Crop.query.get(crop_id)
     if not crop or crop.farmer_id != current_user.id:
         return jsonify({'error': 'Unauthorized'}), 403
+    if Transaction.query.filter_by(crop_id=crop_id).first():
+        return jsonify({'error': 'Listing has transactions'}), 409
     
     db.session.delete(crop)
     db.session.commit()
+    matching_engine.remove_listings([crop_id])
+    response_cache.invalidate('crops')
+    events.publish('crops', 'crop.deleted', {'id': crop_id})
     return jsonify({'message': 'Crop deleted successfully'}), 200
 
+def publish_crop(crop, event_type=None):
+    """Push a committed listing change to /api/events subscribers"""
+    if event_type is None:
+        event_type = 'crop.sold' if crop.status == 'sold' else 'crop.updated'
+    events.publish('crops', event_type, crop.to_dict())
+
+def match_listings(crop_ids):
+    """Fill resting buy orders from just-committed new or changed listings"""
+    trades = matching_engine.update_listings(crop_ids)
+    if trades:
+        # Stock was taken off with UPDATEs; reload the listings before they are published
+        db.session.expire_all()
+    return trades
+
+def publish_crops(crop_ids, event_type=None):
+    """publish_crop() for many listings; past EVENTS_MAX_BATCH clients are told to refetch instead"""
+    if len(crop_ids) > app.config['EVENTS_MAX_BATCH']:
+        events.publish('crops', 'reset', {})
+        return
+    crops = Crop.query.options(db.joinedload(Crop.seller)).filter(Crop.id.in_(crop_ids)).all()
+    by_id = {crop.id: crop for crop in crops}
+    for crop_id in crop_ids:
+        if crop_id in by_id:
+            publish_crop(by_id[crop_id], event_type)
+
+def bulk_listing_request(operation):
+    """Shared handling for the /api/crops/bulk endpoints"""
+    if current_user.role != 'farmer':
+        return None, (jsonify({'error': 'Only farmers can manage listings'}), 403)
+    try:
+        items = parse_items(request, app.config['CROPS_BULK_MAX'])
+    except BulkError as e:
+        return None, (jsonify({'error': str(e)}), 400)
+    result, errors = operation(current_user, items)
+    if errors:
+        db.session.rollback()
+        return None, (jsonify({'error': 'Validation failed', 'errors': errors}), 400)
+    if operation is bulk_delete:
+        matching_engine.remove_listings(result)
+    else:
+        match_listings(result)
+    response_cache.invalidate('crops')
+    return result, None
+
+@app.route('/api/crops/bulk', methods=['POST'])
+@login_required
+def bulk_create_crops():
+    """Create many listings at once from a JSON array or CSV; all or nothing"""
+    crop_ids, error = bulk_listing_request(bulk_create)
+    if error:
+        return error
+    publish_crops(crop_ids, 'crop.created')
+    return jsonify({'message': f'{len(crop_ids)} crops listed', 'crop_ids': crop_ids}), 201
+
+@app.route('/api/crops/bulk', methods=['PUT'])
+@login_required
+def bulk_update_crops():
+    """Update many of your listings; each item needs an id plus the fields to change"""
+    crop_ids, error = bulk_listing_request(bulk_update)
+    if error:
+        return error
+    publish_crops(crop_ids)
+    return jsonify({'message': f'{len(crop_ids)} crops updated', 'updated': len(crop_ids)}), 200
+
+@app.route('/api/crops/bulk', methods=['DELETE'])
+@login_required
+def bulk_delete_crops():
+    """Delete many of your listings, given items with an id"""
+    crop_ids, error = bulk_listing_request(bulk_delete)
+    if error:
+        return error
+    if len(crop_ids) > app.config['EVENTS_MAX_BATCH']:
+        events.publish('crops', 'reset', {})
+    else:
+        for crop_id in crop_ids:
+            events.publish('crops', 'crop.deleted', {'id': crop_id})
+    return jsonify({'message': f'{len(crop_ids)} crops deleted', 'deleted': len(crop_ids)}), 200
+
 # ==================== PRICING ROUTES ====================
 @app.route('/api/prices', methods=['GET'])
+@response_cache.cached('prices')
 def get_prices():
     """Get current crop prices"""
     prices = Price.query.order_by(Price.date.desc()).all()
     return jsonify([price.to_dict() for price in prices]), 200
 
+@app.route('/api/prices/latest', methods=['GET'])
+@response_cache.cached('prices')
+def get_latest_prices():
+    """Get the most recent price per crop and location"""
+    crop = request.args.get('crop')
+    location = request.args.get('location')
+    
+    query = LatestPrice.query
+    if crop:
+        query = query.filter_by(crop_name=crop)
+    if location:
+        query = query.filter_by(location=location)
+    
+    prices = query.order_by(LatestPrice.crop_name, LatestPrice.location).all()
+    return jsonify([price.to_dict() for price in prices]), 200
+
+def publish_prices(rows):
+    """Push new latest prices (Price-like dicts) to /api/events subscribers"""
+    if len(rows) > app.config['EVENTS_MAX_BATCH']:
+        events.publish('prices', 'reset', {})
+        return
+    events.publish('prices', 'prices.updated', [{
+        'crop_name': row['crop_name'],
+        'location': row['location'] or None,
+        'price': row['price'],
+        'date': str(row['date'])
+    } for row in rows])
+
+@app.route('/api/admin/prices/ingest', methods=['POST'])
+@login_required
+def admin_ingest_prices():
+    """Admin bulk upload of a CSV/JSONL price dump (multipart 'file' or raw body)"""
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Only admins can ingest prices'}), 403
+    
+    upload = request.files.get('file')
+    if upload:
+        stream, filename = upload.stream, upload.filename
+    else:
+        stream, filename = request.stream, None
+    fmt = request.args.get('format') or detect_format(filename)
+    if fmt not in ('csv', 'jsonl'):
+        return jsonify({'error': 'Unsupported format'}), 400
+    
+    report = ingest_price_stream(stream, fmt, request.args.get('source', 'agmarknet'), on_latest=publish_prices)
+    response_cache.invalidate('prices')
+    return jsonify(report), 200
+
+@app.route('/api/prices/forecast', methods=['GET'])
+@response_cache.cached('prices')
+def get_price_forecast():
+    """Monthly price forecast for a crop (?crop=&location=) with the best month to sell"""
+    crop = request.args.get('crop')
+    if not crop:
+        return jsonify({'error': 'crop is required'}), 400
+    return jsonify({'crop': crop, 'series': price_forecast(crop, request.args.get('location'))}), 200
+
+@app.route('/api/prices/history', methods=['GET'])
+@response_cache.cached('prices')
+def get_price_history():
+    """Price trend for a crop, aggregated per day, week or month"""
+    crop = request.args.get('crop')
+    bucket = request.args.get('bucket', 'day')
+    if not crop:
+        return jsonify({'error': 'crop is required'}), 400
+    if bucket not in PRICE_BUCKETS:
+        return jsonify({'error': 'bucket must be day, week or month'}), 400
+    
+    try:
+        start = request.args.get('from')
+        end = request.args.get('to')
+        start = datetime.strptime(start, '%Y-%m-%d').date() if start else None
+        end = datetime.strptime(end, '%Y-%m-%d').date() if end else None
+    except ValueError:
+        return jsonify({'error': 'from/to must be YYYY-MM-DD'}), 400
+    
+    series = price_history(crop, request.args.get('location'), bucket, start, end)
+    return jsonify({'crop': crop, 'bucket': bucket, 'series': series}), 200
+
 # ==================== PAYMENT ROUTES ====================
 @app.route('/api/transactions', methods=['POST'])
 @login_required
@@ -202,6 +615,13 @@ def create_transaction():
     if not crop:
         return jsonify({'error': 'Crop not found'}), 404
     
+    quantity = data.get('quantity')
+    if not isinstance(quantity, (int, float)) or isinstance(quantity, bool) or quantity <= 0:
+        return jsonify({'error': 'Quantity must be a positive number'}), 400
+    # Advisory check only; the stock is actually claimed when payment completes
+    if crop.status != 'available' or quantity > crop.quantity:
+        return jsonify({'error': 'Insufficient quantity available'}), 409
+    
     transaction = Transaction(
         buyer_id=current_user.id,
         crop_id=data.get('crop_id'),
@@ -219,6 +639,49 @@ def create_transaction():
         'total_price': transaction.total_price
     }), 201
 
+@app.route('/api/transactions', methods=['GET'])
+@login_required
+def list_transactions():
+    """The current user's transactions, newest first, paginated with ?limit=&cursor=
+
+    ?role=buyer lists purchases, ?role=seller orders for the user's listings
+    (defaults by account role); ?status= filters on payment status.
+    """
+    role = request.args.get('role') or ('seller' if current_user.role == 'farmer' else 'buyer')
+    if role not in ('buyer', 'seller'):
+        return jsonify({'error': 'role must be buyer or seller'}), 400
+    
+    # Crop and seller come in the same SELECT; to_dict() nests both
+    query = Transaction.query.options(db.joinedload(Transaction.crop).joinedload(Crop.seller))
+    if role == 'buyer':
+        query = query.filter(Transaction.buyer_id == current_user.id)
+    else:
+        query = query.join(Transaction.crop).filter(Crop.farmer_id == current_user.id)
+    if request.args.get('status'):
+        query = query.filter(Transaction.payment_status == request.args['status'])
+    query = query.order_by(Transaction.created_at.desc(), Transaction.id.desc())
+    
+    cursor = request.args.get('cursor')
+    try:
+        limit = int(request.args.get('limit', app.config['CROPS_PAGE_SIZE']))
+        if cursor:
+            last = decode_cursor(cursor, 'created_at')
+            query = query.filter(db.tuple_(Transaction.created_at, Transaction.id) < last)
+    except ValueError:
+        return jsonify({'error': 'Invalid limit or cursor'}), 400
+    limit = max(1, min(limit, app.config['CROPS_PAGE_MAX']))
+    
+    transactions = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(transactions) > limit:
+        transactions = transactions[:limit]
+        next_cursor = encode_cursor(transactions[-1].created_at, transactions[-1].id)
+    
+    return jsonify({
+        'transactions': [transaction.to_dict() for transaction in transactions],
+        'next_cursor': next_cursor
+    }), 200
+
 @app.route('/api/transactions/<int:transaction_id>', methods=['GET'])
 @login_required
 def get_transaction(transaction_id):
@@ -231,201 +694,477 @@ def get_transaction(transaction_id):
 @app.route('/api/transactions/<int:transaction_id>/payment', methods=['POST'])
 @login_required
 def update_payment(transaction_id):
-    """Update payment status"""
+    """Update payment status
+
+    Completing a payment is idempotent: only the first completion of a
+    transaction takes stock off the listing, and it fails with 409 instead
+    of overselling when the listing no longer has enough left. Sales made
+    by the matching engine hold their stock while pending (stock_held); it
+    goes back on the listing if they move to any other status than
+    completed, after which completing them takes stock like any other sale.
+    """
     data = request.get_json()
     transaction = Transaction.query.get(transaction_id)
     
     if not transaction:
         return jsonify({'error': 'Transaction not found'}), 404
     
-    transaction.payment_status = data.get('status', 'completed')
-    transaction.payment_method = data.get('method', 'razorpay')
-    transaction.razorpay_order_id = data.get('razorpay_order_id')
+    status = data.get('status', 'completed')
+    values = {
+        'payment_status': status,
+        'payment_method': data.get('method', 'razorpay'),
+        'razorpay_order_id': data.get('razorpay_order_id'),
+        'updated_at': datetime.utcnow()
+    }
+    
+    def claim(condition, **extra):
+        return db.session.execute(
+            db.update(Transaction)
+            .where(Transaction.id == transaction_id, Transaction.payment_status != 'completed', condition)
+            .values(**values, **extra)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+    
+    # Claim the transaction: the WHERE clause lets exactly one request move it to completed
+    # (or release a matched sale's held stock)
+    try:
+        held = claim(Transaction.stock_held.is_(True), stock_held=status == 'pending') == 1
+        claimed = held or claim(Transaction.stock_held.isnot(True))
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': 'Razorpay order already used for another transaction'}), 409
+    
+    if not claimed:
+        db.session.rollback()
+        if status == 'completed':
+            return jsonify({'message': 'Payment already completed'}), 200
+        return jsonify({'error': 'Payment already completed'}), 409
     
-    if transaction.payment_status == 'completed':
-        transaction.crop.quantity -= transaction.quantity
-        if transaction.crop.quantity <= 0:
-            transaction.crop.status = 'sold'
+    released = held and status not in ('pending', 'completed')
+    if released:
+        release_stock(transaction.crop_id, transaction.quantity)
+    if status == 'completed' and not held and not decrement_stock(transaction.crop_id, transaction.quantity):
+        db.session.rollback()
+        db.session.execute(
+            db.update(Transaction)
+            .where(Transaction.id == transaction_id, Transaction.payment_status != 'completed')
+            .values(payment_status='failed', updated_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        return jsonify({'error': 'Insufficient quantity available'}), 409
+    if status == 'completed':
+        record_sale(db.session.connection(), transaction)
     
     db.session.commit()
+    db.session.expire_all()
+    if status == 'completed' or released:
+        match_listings([transaction.crop_id])
+    response_cache.invalidate('crops')
+    if status == 'completed' or released:
+        publish_crop(db.session.get(Crop, transaction.crop_id))
     return jsonify({'message': 'Payment updated'}), 200
 
+# ==================== ORDER MATCHING ROUTES ====================
+@app.route('/api/orders', methods=['POST'])
+@login_required
+def create_buy_order():
+    """Buyer posts demand: {crop_name, quantity, max_price, location (optional, any market if omitted)}
+
+    The order is filled at once from the cheapest available listings at
+    or below max_price; whatever is left stays open and is filled as
+    matching listings are created or repriced. Every fill becomes a
+    pending Transaction with the listing's stock held for it.
+    """
+    if current_user.role != 'buyer':
+        return jsonify({'error': 'Only buyers can post orders'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    errors = {}
+    values = {}
+    for field in ('quantity', 'max_price'):
+        try:
+            values[field] = clean_number(data.get(field))
+        except (TypeError, ValueError):
+            errors[field] = 'Must be a positive number'
+    for field, required in (('crop_name', True), ('location', False)):
+        value = data.get(field)
+        if value is None and not required:
+            continue
+        if not isinstance(value, str) or not value.strip():
+            errors[field] = 'Must be a non-empty string'
+        elif len(value) > 100:
+            errors[field] = 'At most 100 characters'
+        else:
+            values[field] = value.strip()
+    if errors:
+        return jsonify({'error': 'Validation failed', 'errors': errors}), 400
+    
+    order_id, trades = matching_engine.place(current_user.id, values['crop_name'], values.get('location'),
+                                             values['quantity'], values['max_price'])
+    order = db.session.get(BuyOrder, order_id)
+    if trades:
+        response_cache.invalidate('crops')
+        publish_crops(list(dict.fromkeys(trade['crop_id'] for trade in trades)))
+    return jsonify({'message': 'Order placed', 'order': order.to_dict(), 'matches': trades}), 201
+
+@app.route('/api/orders', methods=['GET'])
+@login_required
+def list_buy_orders():
+    """The current buyer's orders, newest first (?status=open|filled|cancelled&limit=&cursor=)"""
+    query = BuyOrder.query.filter(BuyOrder.buyer_id == current_user.id)
+    if request.args.get('status'):
+        query = query.filter(BuyOrder.status == request.args['status'])
+    query = query.order_by(BuyOrder.created_at.desc(), BuyOrder.id.desc())
+    
+    cursor = request.args.get('cursor')
+    try:
+        limit = int(request.args.get('limit', app.config['CROPS_PAGE_SIZE']))
+        if cursor:
+            last = decode_cursor(cursor, 'created_at')
+            query = query.filter(db.tuple_(BuyOrder.created_at, BuyOrder.id) < last)
+    except ValueError:
+        return jsonify({'error': 'Invalid limit or cursor'}), 400
+    limit = max(1, min(limit, app.config['CROPS_PAGE_MAX']))
+    
+    orders = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(orders) > limit:
+        orders = orders[:limit]
+        next_cursor = encode_cursor(orders[-1].created_at, orders[-1].id)
+    
+    return jsonify({'orders': [order.to_dict() for order in orders], 'next_cursor': next_cursor}), 200
+
+@app.route('/api/orders/<int:order_id>', methods=['DELETE'])
+@login_required
+def cancel_buy_order(order_id):
+    """Cancel the unfilled rest of an open order; fills already made stand"""
+    order = db.session.get(BuyOrder, order_id)
+    if not order or order.buyer_id != current_user.id:
+        return jsonify({'error': 'Order not found'}), 404
+    
+    cancelled = db.session.execute(
+        db.update(BuyOrder)
+        .where(BuyOrder.id == order_id, BuyOrder.status == 'open')
+        .values(status='cancelled', updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    if not cancelled:
+        return jsonify({'error': f'Order is already {order.status}'}), 409
+    matching_engine.cancel(order_id)
+    return jsonify({'message': 'Order cancelled'}), 200
+
+# ==================== ANALYTICS ROUTES ====================
+@app.route('/api/analytics/sales', methods=['GET'])
+@login_required
+def sales_analytics():
+    """Completed-sales totals, top farmers, volume by crop and by month
+
+    Farmers see their own sales, admins every farmer's, buyers their
+    purchases. ?from=&to= (YYYY-MM-DD) limit the months included.
+    """
+    try:
+        start = request.args.get('from')
+        end = request.args.get('to')
+        start = datetime.strptime(start, '%Y-%m-%d').date() if start else None
+        end = datetime.strptime(end, '%Y-%m-%d').date() if end else None
+    except ValueError:
+        return jsonify({'error': 'from/to must be YYYY-MM-DD'}), 400
+    
+    if current_user.role == 'admin':
+        summary = sales_summary(start=start, end=end)
+    elif current_user.role == 'farmer':
+        summary = sales_summary(farmer_id=current_user.id, start=start, end=end)
+    else:
+        summary = sales_summary(buyer_id=current_user.id, start=start, end=end)
+    return jsonify(summary), 200
+
+# ==================== LIVE UPDATES ====================
+EVENT_TOPICS = ('crops', 'prices')
+
+@app.route('/api/events', methods=['GET'])
+def event_stream():
+    """Server-sent events for listing and price changes, ?topics=crops,prices
+
+    Events: crop.created, crop.updated, crop.sold (crop object),
+    crop.deleted ({id}), prices.updated (list of latest prices) and reset,
+    after which the client should refetch. EventSource reconnects with
+    Last-Event-ID and receives what it missed.
+    """
+    topics = {topic.strip() for topic in request.args.get('topics', ','.join(EVENT_TOPICS)).split(',')}
+    if not topics or not topics <= set(EVENT_TOPICS):
+        return jsonify({'error': 'topics must be crops and/or prices'}), 400
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    subscription = events.try_subscribe(topics, last_event_id)
+    if subscription is None:
+        response = jsonify({'error': 'Too many live connections, try again later'})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+    
+    response = app.response_class(subscription, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 # ==================== AI & CHATBOT ROUTES ====================
+FORECAST_INTENTS = ('sell_timing', 'weather_selling', 'best_prices', 'prices')
+
+def auth_error_response(user_message):
+    return jsonify({
+        'user_message': user_message,
+        'bot_response': " Authentication error: Invalid OpenAI API key. Please check your configuration.",
+        'error': True
+    }), 401
+
+def save_chat_message(user_message, bot_response, message_type):
+    """Queue chat message for the background writer"""
+    chat_log.write(current_user.id, user_message, bot_response, message_type)
+
+def cached_chat_response(user_message, message_type, context=None):
+    """Answer from earlier LLM replies to the same (or a near-identical) question
+    asked with the same forecast context"""
+    if not chat_cache.enabled:
+        return None
+    if not chat_cache.warmed:
+        # Crops and markets we have prices for never share a cached answer with one another
+        chat_cache.add_domain_terms(name for row in db.session.query(LatestPrice.crop_name, LatestPrice.location)
+                                    for name in row if name)
+        rows = db.session.query(ChatMessage.user_message, ChatMessage.bot_response, ChatMessage.message_type) \
+            .order_by(ChatMessage.id.desc()).limit(chat_cache.warm_limit).all()
+        # Fallback answers are recomputed for free; only LLM replies are worth caching
+        chat_cache.warm([row for row in reversed(rows) if not row.bot_response.endswith(
+                         get_intelligent_fallback_response(row.user_message, row.message_type or 'general'))])
+    return chat_cache.get(user_message, message_type, context)
+
 @app.route('/api/chat', methods=['POST'])
 @login_required
 def chat():
     """AI Chatbot endpoint with OpenAI integration and fallback"""
-    data = request.get_json()
+    data = request.get_json(silent=True) or {}
     user_message = data.get('message')
     message_type = data.get('type', 'general')  # 'agronomy', 'marketplace', 'general'
+    if not isinstance(user_message, str) or not user_message.strip():
+        return jsonify({'error': 'message is required'}), 400
     
     bot_response = None
-    use_fallback = False
+    source, llm_seconds = 'fallback', None
+    context = forecast_context(user_message)
     
-    # Try OpenAI API if configured
-    if app.config['OPENAI_API_KEY']:
-        try:
-            # Create context-aware system prompt based on message type
-            system_prompts = {
-                'agronomy': 'You are an expert agricultural advisor for Indian farmers. Provide practical farming advice considering Indian climate and crops. Keep responses concise and actionable.',
-                'marketplace': 'You are a helpful guide for an agricultural marketplace platform. Help users understand how to buy and sell crops, pricing, and platform features.',
-                'general': 'You are a helpful agricultural assistant for farmers in India. You can answer questions about farming practices, crop prices, market trends, and our Kisan Mandi platform. Keep responses concise and practical.'
-            }
-            
-            system_prompt = system_prompts.get(message_type, system_prompts['general'])
-            
-            # Call OpenAI API
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_message}
-                ],
-                temperature=0.7,
-                max_tokens=500
-            )
-            
-            # Extract bot response from OpenAI response
+    # Try OpenAI API if configured; slow, busy or failing upstreams raise LLMUnavailable
+    if llm_client.enabled:
+        bot_response = cached_chat_response(user_message, message_type, context)
+        if bot_response is not None:
+            source = 'cache'
+        else:
+            started = time.perf_counter()
             try:
-                # Response should be a dict when using openai library
-                response_dict = dict(response)  # type: ignore
-                bot_response = response_dict['choices'][0]['message']['content'].strip()  # type: ignore
-            except (KeyError, IndexError, TypeError, ValueError):
-                try:
-                    # Fallback: try direct access
-                    bot_response = response['choices'][0]['message']['content'].strip()  # type: ignore
-                except:
-                    use_fallback = True
-            
-        except Exception as e:
-            error_str = str(e)
-            
-            # Check if it's an authentication or quota error
-            if 'quota' in error_str.lower() or 'exceeded' in error_str.lower() or 'rate' in error_str.lower():
-                # Use intelligent fallback for quota/rate limit issues
-                use_fallback = True
-            elif 'Authentication' in error_str or 'unauthorized' in error_str or 'api_key' in error_str:
-                bot_response = " Authentication error: Invalid OpenAI API key. Please check your configuration."
-                return jsonify({
-                    'user_message': user_message,
-                    'bot_response': bot_response,
-                    'error': True
-                }), 401
-            else:
-                # Other errors
-                use_fallback = True
-    else:
-        # No API key configured, use fallback
-        use_fallback = True
+                bot_response = llm_client.complete(user_message, message_type, context)
+                source = 'llm'
+                chat_cache.put(user_message, message_type, bot_response, context)
+            except LLMAuthError:
+                metrics.observe_llm('auth_error', time.perf_counter() - started)
+                return auth_error_response(user_message)
+            except LLMUnavailable:
+                bot_response = None
+            llm_seconds = time.perf_counter() - started
     
     # Use intelligent fallback if OpenAI didn't work
-    if bot_response is None or use_fallback:
-        bot_response = get_intelligent_fallback_response(user_message, message_type)
-    
-    # Store chat message in database
-    chat_msg = ChatMessage(
-        user_id=current_user.id,
-        user_message=user_message,
-        bot_response=bot_response,
-        message_type=message_type
-    )
-    db.session.add(chat_msg)
-    db.session.commit()
+    if bot_response is None:
+        bot_response = get_intelligent_fallback_response(user_message, message_type, context)
+    
+    metrics.observe_llm(source, llm_seconds)
+    save_chat_message(user_message, bot_response, message_type)
     
     return jsonify({
         'user_message': user_message,
         'bot_response': bot_response
     }), 200
 
-def get_intelligent_fallback_response(message, msg_type):
-    """Intelligent fallback responses based on keywords"""
-    message_lower = message.lower()
-    
-    # Keywords for selling crops
-    if any(word in message_lower for word in ['sell', 'price', 'market', 'best time', 'when', 'weather']):
-        weather_keywords = ['weather', 'rain', 'season', 'monsoon', 'summer', 'winter']
-        price_keywords = ['price', 'rate', 'market', 'profit']
-        
-        if any(word in message_lower for word in weather_keywords) and any(word in message_lower for word in price_keywords):
-            return " To decide when to sell your crop:\n\n1. **Monitor Weather**: Check monsoon timings, rainfall patterns, and temperature forecasts. Good harvest weather = better quality = higher prices.\n\n2. **Check Market Prices**: Use our Prices section to track commodity rates. Sell when prices are high.\n\n3. **Timing Strategy**: \n   - Wheat: Sell March-April for best prices\n   - Rice: Peak prices June-July\n   - Cotton: October-November highest demand\n   - Vegetables: Post-harvest season (high demand, seasonal gluts)\n\n4. **Use Kisan Mandi**: List your crops when prices are favorable and weather is stable.\n\nWould you like specific advice for a particular crop?"
-        elif any(word in message_lower for word in weather_keywords):
-            return " **Weather & Crop Selling**:\n\nGood weather conditions = Better crop quality = Higher market value\n\nCheck our Prices page to see current market rates and list your crops when conditions are optimal. Use the Marketplace to connect directly with buyers!"
-        elif any(word in message_lower for word in price_keywords):
-            return " **Getting Best Prices**:\n\n1. Visit our Prices page to check current market rates\n2. Harvest crops when market demand is high\n3. List on our marketplace with your best price\n4. Direct buyer connection = No middlemen cost\n\nWhat crop are you planning to sell?"
-    
-    # Keywords for farming/crops advice
-    if any(word in message_lower for word in ['plant', 'grow', 'farm', 'crop', 'seed', 'soil', 'fertilizer']):
-        return " **Farming & Crop Advice**:\n\nFor best results:\n\n1. **Soil Preparation**: Test soil pH before planting\n2. **Organic Methods**: Use natural fertilizers (compost, vermicompost)\n3. **Water Management**: Proper irrigation based on weather and crop type\n4. **Pest Control**: Use integrated pest management techniques\n5. **Timing**: Plant according to your region's crop season\n\nWhich crop would you like guidance on? (Wheat, Rice, Cotton, etc.)"
-    
-    # Keywords for marketplace/selling
-    if any(word in message_lower for word in ['sell', 'list', 'buyer', 'marketplace', 'trade']):
-        return " **Selling on Kisan Mandi Marketplace**:\n\n1. **Create Listing**: Add crop details, quantity, quality grade\n2. **Upload Photos**: Show your produce clearly\n3. **Set Your Price**: You control pricing - no middlemen\n4. **Connect with Buyers**: Buyers browse and contact directly\n5. **Payment**: Secure payment through our platform\n\nReady to list your crops? Go to Marketplace → Add New Listing!"
-    
-    # Keywords for prices
-    if any(word in message_lower for word in ['price', 'rate', 'cost', 'expensive', 'cheap', 'rate']):
-        return " **Current Market Prices**:\n\nVisit our Prices page to see live commodity rates for:\n- Wheat\n- Rice\n- Cotton\n- Sugarcane\n- Tomato\n- And more!\n\nPrices vary by location and season. Check regularly to time your sales optimally!"
-    
-    # General greeting
-    return " I'm your Kisan Mandi Agricultural Advisor! I can help you with:\n\n **Selling Tips**: When & how to sell crops for best prices\n🌾 **Farming Advice**: Crop growing, soil care, pest management\n💰 **Market Prices**: Current rates for all crops\n🏪 **Marketplace Guide**: How to use our platform\n🌤️ **Weather Impact**: How weather affects crop price & quality\n\nWhat would you like to know?"
+def sse_event(data, event=None):
+    """Format one server-sent event"""
+    prefix = f'event: {event}\n' if event else ''
+    return f'{prefix}data: {json.dumps(data)}\n\n'
+
+@app.route('/api/chat/stream', methods=['POST'])
+@login_required
+def chat_stream():
+    """Streaming variant of /api/chat as server-sent events
+
+    Emits 'token' events as the model produces text, then a final 'done'
+    event carrying the complete bot_response.
+    """
+    data = request.get_json(silent=True) or {}
+    user_message = data.get('message')
+    message_type = data.get('type', 'general')
+    if not isinstance(user_message, str) or not user_message.strip():
+        return jsonify({'error': 'message is required'}), 400
+    
+    context = forecast_context(user_message)
+    cached = cached_chat_response(user_message, message_type, context) if llm_client.enabled else None
+    tokens = first = llm_seconds = None
+    if llm_client.enabled and cached is None:
+        started = time.perf_counter()
+        try:
+            tokens = llm_client.stream(user_message, message_type, context)
+            # Pull the first fragment now so errors still become a normal HTTP response
+            first = next(tokens, None)
+        except LLMAuthError:
+            metrics.observe_llm('auth_error', time.perf_counter() - started)
+            return auth_error_response(user_message)
+        except LLMUnavailable:
+            tokens = None
+        if first is None:
+            tokens = None
+        llm_seconds = time.perf_counter() - started  # time to first token
+    source = 'cache' if cached is not None else 'fallback' if tokens is None else 'llm'
+    metrics.observe_llm(source, llm_seconds)
+    
+    def generate():
+        if cached is not None:
+            bot_response = cached
+            yield sse_event({'token': bot_response}, 'token')
+        elif tokens is None:
+            bot_response = get_intelligent_fallback_response(user_message, message_type, context)
+            yield sse_event({'token': bot_response}, 'token')
+        else:
+            parts = [first]
+            yield sse_event({'token': first}, 'token')
+            try:
+                for token in tokens:
+                    parts.append(token)
+                    yield sse_event({'token': token}, 'token')
+            except (LLMAuthError, LLMUnavailable):
+                pass
+            bot_response = ''.join(parts).strip()
+            chat_cache.put(user_message, message_type, bot_response, context)
+        save_chat_message(user_message, bot_response, message_type)
+        yield sse_event({'user_message': user_message, 'bot_response': bot_response}, 'done')
+    
+    response = app.response_class(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/chat/history', methods=['GET'])
+@login_required
+def chat_history():
+    """Current user's chat history, newest first, paginated with ?limit=&cursor="""
+    # Make this user's most recent messages visible before reading
+    chat_log.flush()
+    
+    query = ChatMessage.query.filter_by(user_id=current_user.id) \
+        .order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc())
+    try:
+        limit = int(request.args.get('limit', 20))
+        cursor = request.args.get('cursor')
+        if cursor:
+            query = query.filter(db.tuple_(ChatMessage.created_at, ChatMessage.id) < decode_cursor(cursor, 'created_at'))
+    except ValueError:
+        return jsonify({'error': 'Invalid limit or cursor'}), 400
+    limit = max(1, min(limit, 100))
+    
+    messages = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(messages) > limit:
+        messages = messages[:limit]
+        next_cursor = encode_cursor(messages[-1].created_at, messages[-1].id)
+    
+    return jsonify({
+        'messages': [message.to_dict() for message in messages],
+        'next_cursor': next_cursor
+    }), 200
+
+@app.route('/api/chat/cache', methods=['GET'])
+@login_required
+def chat_cache_stats():
+    """Hit-rate statistics for the chatbot answer cache"""
+    return jsonify(chat_cache.stats()), 200
+
+def forecast_context(user_message):
+    """Price forecasts for the crops a chat message names (at the user's market if
+    forecast there), for the LLM and fallback answers to build on"""
+    location = current_user.location
+    summaries = (describe_forecast(crop, location) for crop in forecast_index.find(user_message)[:3])
+    return '\n'.join(summary for summary in summaries if summary) or None
+
+def get_intelligent_fallback_response(message, msg_type, context=None):
+    """Intelligent fallback responses based on keywords; selling and price
+    answers lead with the forecast context when there is one"""
+    intent = intent_matcher.classify(message)
+    response = FALLBACK_RESPONSES[intent]
+    if context and intent in FORECAST_INTENTS:
+        return f'{context}\n\n{response}'
+    return response
+
+# ==================== MONITORING ====================
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Request, SQL and LLM metrics in Prometheus text format (this process only)"""
+    return app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4'), 200
 
 # ==================== STATIC ROUTES ====================
+def send_asset(filename):
+    """Serve a frontend file from the asset pipeline (compressed, cache headers set)"""
+    response = assets.send(filename)
+    if response is None:
+        return jsonify({'error': 'File not found'}), 404
+    return response
+
 @app.route('/')
 def index():
     """Serve login page"""
-    return send_from_directory(FRONTEND_DIR, 'login.html')
+    return send_asset('login.html')
 
 
 @app.route('/dashboard.html')
 @login_required
 def dashboard():
     """Serve dashboard page"""
-    return send_from_directory(FRONTEND_DIR, 'dashboard.html')
+    return send_asset('dashboard.html')
 
 @app.route('/marketplace.html')
 @login_required
 def marketplace():
     """Serve marketplace page"""
-    return send_from_directory(FRONTEND_DIR, 'marketplace.html')
+    return send_asset('marketplace.html')
 
 @app.route('/advisor.html')
 def advisor():
     """Serve advisor page"""
-    return send_from_directory(FRONTEND_DIR, 'advisor.html')
+    return send_asset('advisor.html')
 
 @app.route('/chatbot.html')
 def chatbot():
     """Serve chatbot page"""
-    return send_from_directory(FRONTEND_DIR, 'chatbot.html')
+    return send_asset('chatbot.html')
 
 @app.route('/prices.html')
 def prices():
     """Serve prices page"""
-    return send_from_directory(FRONTEND_DIR, 'prices.html')
+    return send_asset('prices.html')
 
 @app.route('/payment.html')
 def payment():
     """Serve payment page"""
-    return send_from_directory(FRONTEND_DIR, 'payment.html')
+    return send_asset('payment.html')
 
 # Serve static files (CSS, JS, etc)
 @app.route('/css/<path:filename>')
 def serve_css(filename):
     """Serve CSS files"""
-    return send_from_directory(os.path.join(FRONTEND_DIR, 'css'), filename)
+    return send_asset('css/' + filename)
 
 @app.route('/js/<path:filename>')
 def serve_js(filename):
     """Serve JavaScript files"""
-    return send_from_directory(os.path.join(FRONTEND_DIR, 'js'), filename)
+    return send_asset('js/' + filename)
 
 # Catch-all for any other static files (must be last route)
 @app.route('/<path:filename>')
 def serve_static(filename):
     """Serve any other static file"""
-    filepath = os.path.join(FRONTEND_DIR, filename)
-    if os.path.isfile(filepath):
-        return send_from_directory(FRONTEND_DIR, filename)
-    return jsonify({'error': 'File not found'}), 404
+    return send_asset(filename)
 
 @app.errorhandler(404)
 def not_found(error):
@@ -433,12 +1172,6 @@ def not_found(error):
     return jsonify({'error': 'Page not found'}), 404
 
 if __name__ == '__main__':
-    with app.app_context():
-        db.create_all()
-        # Ensure demo price data exists on startup for local development
-        try:
-            init_default_prices()
-        except Exception:
-            # If DB already has data or migrations are not ready, ignore
-            pass
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    # Development server; in production run: gunicorn -c gunicorn.conf.py wsgi:app
+    prepare_database()
+    app.run(debug=app.config['DEBUG'], host='0.0.0.0', port=int(os.getenv('PORT', 5000)))
@@ -0,0 +1,320 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import threading
+from flask import request
+
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+HASHED_EXTENSIONS = ('.css', '.js', '.svg', '.png', '.jpg', '.jpeg', '.gif', '.webp', '.ico', '.woff', '.woff2')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+# ==================== MINIFIERS ====================
+CSS_TOKEN_RE = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|/\*.*?\*/|[^"\'/]+|/', re.S)
+CSS_SPACE_RE = re.compile(r'\s*([{};,])\s*')
+
+def minify_css(text):
+    """Drop comments and collapse whitespace, leaving strings untouched"""
+    out = []
+    for token in CSS_TOKEN_RE.findall(text):
+        if token.startswith('/*'):
+            continue
+        if token[0] not in '"\'':
+            token = CSS_SPACE_RE.sub(r'\1', re.sub(r'\s+', ' ', token))
+        out.append(token)
+    return ''.join(out).replace(';}', '}').strip()
+
+# A '/' after one of these (or a keyword) starts a regex literal, not a division
+REGEX_PREFIX = set('(,=:[!&|?{};+-*%<>~^')
+REGEX_KEYWORDS = ('return', 'typeof', 'case', 'do', 'else', 'in', 'of', 'void', 'yield', 'await')
+
+def minify_js(text):
+    """Drop comments, indentation and blank lines.
+
+    Line breaks are kept so automatic semicolon insertion still sees the
+    same statements; strings, template literals and regex literals are
+    copied verbatim.
+    """
+    out = []
+    i, n = 0, len(text)
+    depth = []  # brace depth at each open ${ in a template literal
+
+    def last_significant():
+        tail = ''.join(out[-8:]).rstrip()
+        return tail[-1:] if tail else ''
+
+    def skip_string(start, quote):
+        j = start + 1
+        while j < n and text[j] != quote:
+            if text[j] == '\\':
+                j += 1
+            elif text[j] == '\n' and quote != '`':
+                break
+            j += 1
+        return j + 1
+
+    def skip_template(start):
+        """End of a template literal chunk: past the closing ` or just after ${"""
+        j = start
+        while j < n:
+            if text[j] == '\\':
+                j += 2
+            elif text[j] == '`':
+                return j + 1, False
+            elif text.startswith('${', j):
+                return j + 2, True
+            else:
+                j += 1
+        return n, False
+
+    while i < n:
+        c = text[i]
+        if c in '"\'':
+            j = skip_string(i, c)
+            out.append(text[i:j])
+            i = j
+        elif c == '`' or (c == '}' and depth and depth[-1] == 0):
+            if c == '}':
+                depth.pop()
+            j, opened = skip_template(i + 1)
+            out.append(text[i:j])
+            if opened:
+                depth.append(0)
+            i = j
+        elif text.startswith('//', i):
+            while i < n and text[i] != '\n':
+                i += 1
+        elif text.startswith('/*', i):
+            end = text.find('*/', i + 2)
+            i = n if end < 0 else end + 2
+            out.append(' ')
+        elif c == '/':
+            prefix = last_significant()
+            word = re.search(r'(\w+)\s*$', ''.join(out[-8:]))
+            if not prefix or prefix in REGEX_PREFIX or (word and word.group(1) in REGEX_KEYWORDS):
+                j, in_class = i + 1, False
+                while j < n and text[j] != '\n':
+                    if text[j] == '\\':
+                        j += 1
+                    elif text[j] == '[':
+                        in_class = True
+                    elif text[j] == ']':
+                        in_class = False
+                    elif text[j] == '/' and not in_class:
+                        break
+                    j += 1
+                j += 1
+                while j < n and (text[j].isalnum() or text[j] == '_'):
+                    j += 1
+                out.append(text[i:j])
+                i = j
+            else:
+                out.append(c)
+                i += 1
+        else:
+            if depth:
+                if c == '{':
+                    depth[-1] += 1
+                elif c == '}':
+                    depth[-1] -= 1
+            j = i + 1
+            while j < n and text[j] not in '"\'`/{}':
+                j += 1
+            out.append(text[i:j])
+            i = j
+    lines = (line.strip() for line in ''.join(out).split('\n'))
+    return '\n'.join(line for line in lines if line)
+
+HTML_BLOCK_RE = re.compile(r'(<(script|style|pre|textarea)\b[^>]*>)(.*?)(</\2\s*>)', re.S | re.I)
+HTML_COMMENT_RE = re.compile(r'<!--(?!\[if).*?-->', re.S)
+
+def collapse_html(text):
+    text = HTML_COMMENT_RE.sub('', text)
+    text = re.sub(r'[ \t]*\n\s*', '\n', text)
+    return re.sub(r'[ \t]{2,}', ' ', text)
+
+def minify_html(text):
+    """Collapse whitespace between tags and minify inline <style>/<script>;
+    <pre> and <textarea> contents are left alone"""
+    out, pos = [], 0
+    for match in HTML_BLOCK_RE.finditer(text):
+        out.append(collapse_html(text[pos:match.start()]))
+        open_tag, tag, body, close_tag = match.group(1), match.group(2).lower(), match.group(3), match.group(4)
+        if tag == 'style':
+            body = minify_css(body)
+        elif tag == 'script' and not re.search(r'\bsrc=', open_tag, re.I) and \
+                re.search(r'\btype=["\']?(?!text/javascript|module|application/javascript)', open_tag, re.I) is None:
+            body = minify_js(body)
+        out.append(open_tag + body + close_tag)
+        pos = match.end()
+    out.append(collapse_html(text[pos:]))
+    return ''.join(out).strip()
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}  # pages are minified after their links are rewritten
+
+# ==================== PIPELINE ====================
+class AssetPipeline:
+    """Minified, pre-compressed, content-hashed frontend assets served from memory.
+
+    build() minifies CSS/JS/HTML, gives CSS/JS/images content-hash names
+    (css/style.3f9c2a1b7e.css), rewrites the pages' links to them and
+    writes gzip (and, with the brotli package, br) variants plus a
+    manifest to ASSET_BUILD_DIR. Each process loads the build once;
+    send() then answers from memory, picking the encoding the client
+    accepts. Hashed names are cached for a year; pages and unhashed names
+    revalidate by ETag.
+    """
+
+    def __init__(self, app=None):
+        self.lock = threading.Lock()
+        self.signature = None
+        self.urls = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.source_dir = os.path.abspath(app.config['FRONTEND_DIR'])
+        self.build_dir = app.config.get('ASSET_BUILD_DIR') or os.path.join(app.instance_path, 'assets')
+        self.minify = app.config.get('ASSET_MINIFY', True)
+
+    def sources(self):
+        """Relative paths of the frontend files, with a signature of their sizes and mtimes"""
+        paths, digest = [], hashlib.sha1(str(self.minify).encode())
+        for root, dirs, files in os.walk(self.source_dir):
+            dirs.sort()
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                relative = os.path.relpath(path, self.source_dir).replace(os.sep, '/')
+                paths.append(relative)
+                digest.update(f'{relative}:{stat.st_size}:{stat.st_mtime_ns}\n'.encode())
+        return paths, digest.hexdigest()
+
+    def build(self):
+        """Process every frontend file into the build directory; returns the manifest"""
+        try:
+            import brotli  # optional dependency; without it only gzip variants are built
+        except ImportError:
+            brotli = None
+        paths, signature = self.sources()
+        processed = {}
+        for relative in paths:
+            with open(os.path.join(self.source_dir, relative), 'rb') as f:
+                data = f.read()
+            ext = os.path.splitext(relative)[1].lower()
+            if self.minify and ext in MINIFIERS:
+                data = MINIFIERS[ext](data.decode('utf-8')).encode('utf-8')
+            processed[relative] = data
+
+        # Hash assets first so the pages can link to the hashed names
+        files = {}
+        for relative, data in processed.items():
+            digest = hashlib.sha256(data).hexdigest()[:10]
+            stem, ext = os.path.splitext(relative)
+            name = f'{stem}.{digest}{ext}' if ext.lower() in HASHED_EXTENSIONS else relative
+            files[relative] = {'name': name, 'etag': digest}
+        for relative, data in processed.items():
+            if relative.lower().endswith('.html'):
+                text = self.link_hashed(data.decode('utf-8'), files)
+                data = (minify_html(text) if self.minify else text).encode('utf-8')
+                processed[relative] = data
+                files[relative]['etag'] = hashlib.sha256(data).hexdigest()[:10]
+
+        for relative, data in processed.items():
+            entry = files[relative]
+            entry['mimetype'] = mimetypes.guess_type(relative)[0] or 'application/octet-stream'
+            variants = {'': data}
+            if entry['mimetype'].startswith(COMPRESSIBLE_TYPES):
+                variants['gzip'] = gzip.compress(data, 9, mtime=0)
+                if brotli is not None:
+                    variants['br'] = brotli.compress(data, quality=11)
+            entry['encodings'] = [encoding for encoding, body in variants.items()
+                                  if not encoding or len(body) < len(data)]
+            for encoding in entry['encodings']:
+                self.write(self.variant_path(entry['name'], encoding), variants[encoding])
+
+        manifest = {'signature': signature, 'files': files}
+        self.write(os.path.join(self.build_dir, 'manifest.json'), json.dumps(manifest, indent=1).encode())
+        return manifest
+
+    @staticmethod
+    def link_hashed(text, files):
+        """Point href/src attributes at local assets to their hashed names"""
+        def replace(match):
+            path = match.group(3)
+            entry = files.get(path)
+            if entry is None:
+                return match.group(0)
+            return f'{match.group(1)}{match.group(2)}{entry["name"]}{match.group(4)}'
+        return re.sub(r'''((?:href|src)=["'])(/?)([\w./-]+)(["'])''', replace, text)
+
+    def variant_path(self, name, encoding):
+        suffix = {'': '', 'gzip': '.gz', 'br': '.br'}[encoding]
+        return os.path.join(self.build_dir, name + suffix)
+
+    @staticmethod
+    def write(path, data):
+        """Atomic write, so processes building at once never serve a torn file"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def load(self):
+        """Load the build into memory, rebuilding first if the frontend changed since.
+
+        Runs once per process; in debug mode sources are re-checked on
+        every request so edits show up without a restart.
+        """
+        if self.signature is not None and not self.app.debug:
+            return
+        with self.lock:
+            _, signature = self.sources()
+            if signature == self.signature:
+                return
+            manifest = None
+            try:
+                with open(os.path.join(self.build_dir, 'manifest.json')) as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError):
+                pass
+            if manifest is None or manifest.get('signature') != signature:
+                manifest = self.build()
+
+            urls = {}
+            for relative, entry in manifest['files'].items():
+                variants = {}
+                for encoding in entry['encodings']:
+                    with open(self.variant_path(entry['name'], encoding), 'rb') as f:
+                        variants[encoding] = f.read()
+                asset = (entry['mimetype'], entry['etag'], variants)
+                urls[relative] = (asset, False)
+                urls[entry['name']] = (asset, entry['name'] != relative)
+            self.urls = urls
+            self.signature = signature
+
+    def send(self, path):
+        """Response for a frontend file by URL path, or None if there is no such file"""
+        self.load()
+        found = self.urls.get(path)
+        if found is None:
+            return None
+        (mimetype, etag, variants), immutable = found
+        encoding = ''
+        for candidate in ('br', 'gzip'):
+            if candidate in variants and request.accept_encodings[candidate]:
+                encoding = candidate
+                break
+
+        response = self.app.response_class(variants[encoding], mimetype=mimetype)
+        response.set_etag(f'{etag}-{encoding}' if encoding else etag)
+        response.headers['Cache-Control'] = IMMUTABLE if immutable else 'no-cache'
+        if len(variants) > 1:
+            response.vary.add('Accept-Encoding')
+        if encoding:
+            response.content_encoding = encoding
+        return response.make_conditional(request)
@@ -0,0 +1,420 @@
+"""Benchmark the API end to end against a synthetic dataset.
+
+Seeds a throwaway SQLite database, then drives the real Flask app through
+its test client: each scenario is run `--requests` times spread over
+`--concurrency` threads, and per-endpoint latency percentiles, throughput
+and SQL queries per request are reported. Each thread's clients log in, and
+whatever a scenario consumes (listings to update, transactions to pay) is
+created, before its clock starts. The LLM is replaced by a stub
+that answers after `--llm-latency` seconds. Afterwards the order-matching
+engine is driven directly and its trades per second are reported.
+
+    python benchmark.py --out before.json
+    python benchmark.py --out after.json --baseline before.json
+
+With --baseline, endpoints whose p95 got more than --tolerance slower (or
+that issue more queries per request), and matching throughput that dropped
+by more than --tolerance, are listed and the exit status is 1.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+PASSWORD = 'benchmark'
+CROP_NAMES = ['Wheat', 'Rice', 'Cotton', 'Sugarcane', 'Tomato', 'Onion', 'Potato', 'Maize', 'Mustard', 'Soybean']
+CATEGORIES = ['cereal', 'vegetable', 'fibre', 'oilseed', 'pulse']
+LOCATIONS = ['Ludhiana, Punjab', 'Karnal, Haryana', 'Nashik', 'Indore', 'Guntur', 'Jaipur', 'Rajkot', 'Patna']
+QUESTIONS = [
+    'What is the best fertilizer for wheat?', 'When should I sow rice?', 'How do I sell my crop here?',
+    'What is the price of tomato today?', 'How to control pests in cotton?', 'Which crop is good for winter?',
+    'How much water does sugarcane need?', 'How do I check my payment status?',
+]
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def seed(app, db, sizes, rng):
+    """Bulk-insert users, crops, prices and chats; returns ids the scenarios pick from"""
+    from werkzeug.security import generate_password_hash
+    from geo import geocode
+    from models import User, Crop, Price, ChatMessage, rebuild_latest_prices, rebuild_price_rollups
+    password_hash = generate_password_hash(PASSWORD)  # hashing is slow; every user shares one
+    now = datetime.utcnow()
+
+    with app.app_context():
+        db.create_all()
+        users = []
+        for role, count in (('farmer', sizes['farmers']), ('buyer', sizes['buyers'])):
+            for i in range(count):
+                location = rng.choice(LOCATIONS)
+                users.append({
+                    'username': f'{role}{i}', 'email': f'{role}{i}@bench.local', 'password_hash': password_hash,
+                    'role': role, 'location': location,
+                })
+        # Core inserts skip the ORM geocoding hook, so geocode here
+        for user in users:
+            user['latitude'], user['longitude'] = geocode(user['location']) or (None, None)
+        db.session.execute(User.__table__.insert(), users)
+
+        farmer_ids = [row.id for row in db.session.execute(db.select(User.id).where(User.role == 'farmer'))]
+        buyer_ids = [row.id for row in db.session.execute(db.select(User.id).where(User.role == 'buyer'))]
+        crops = []
+        for i in range(sizes['crops']):
+            location = rng.choice(LOCATIONS)
+            lat, lon = geocode(location)
+            crops.append({
+                'farmer_id': rng.choice(farmer_ids), 'crop_name': rng.choice(CROP_NAMES),
+                'category': rng.choice(CATEGORIES), 'quantity': rng.randint(100, 10000), 'unit': 'kg',
+                'price_per_unit': round(rng.uniform(10, 100), 2), 'description': f'Fresh produce lot {i}',
+                'location': location, 'latitude': lat, 'longitude': lon, 'status': 'available',
+                'created_at': now - timedelta(minutes=i),
+            })
+        db.session.execute(Crop.__table__.insert(), crops)
+
+        prices = []
+        days = max(1, sizes['prices'] // (len(CROP_NAMES) * len(LOCATIONS)))
+        for day in range(days):
+            for crop_name in CROP_NAMES:
+                for location in LOCATIONS:
+                    prices.append({
+                        'crop_name': crop_name, 'location': location, 'price': round(rng.uniform(1000, 6000), 2),
+                        'date': now - timedelta(days=day), 'source': 'benchmark',
+                    })
+        db.session.execute(Price.__table__.insert(), prices[:sizes['prices']])
+
+        chats = [{
+            'user_id': rng.choice(farmer_ids), 'user_message': rng.choice(QUESTIONS),
+            'bot_response': 'Seeded answer', 'message_type': 'general', 'created_at': now - timedelta(minutes=i),
+        } for i in range(sizes['chats'])]
+        db.session.execute(ChatMessage.__table__.insert(), chats)
+        db.session.commit()
+
+        rebuild_latest_prices()
+        with db.engine.begin() as connection:
+            rebuild_price_rollups(connection)
+        db.session.execute(db.text('ANALYZE'))
+        db.session.commit()
+        crop_ids = [row.id for row in db.session.execute(db.select(Crop.id))]
+    return {'farmer_ids': farmer_ids, 'buyer_ids': buyer_ids, 'crop_ids': crop_ids}
+
+class QueryCounter:
+    """Counts SQL statements issued by the current thread"""
+
+    def __init__(self, engine, db):
+        self.local = threading.local()
+        db.event.listen(engine, 'before_cursor_execute', self.count)
+
+    def count(self, *args):
+        self.local.queries = getattr(self.local, 'queries', 0) + 1
+
+    def take(self):
+        queries = getattr(self.local, 'queries', 0)
+        self.local.queries = 0
+        return queries
+
+def login(app, username):
+    client = app.test_client()
+    response = client.post('/api/login', json={'username': username, 'password': PASSWORD})
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return client
+
+def scenarios(ids, rng):
+    """name -> (fn(session) returning the response to time, prepare(session, calls) or None).
+
+    A session holds one worker's clients; prepare runs untimed before the
+    timed calls and creates whatever they consume (listings, transactions).
+    """
+    def crop_id():
+        return rng.choice(ids['crop_ids'])
+
+    def signup(s):
+        name = f"bench_{threading.get_ident()}_{time.perf_counter_ns()}"
+        return s['anon'].post('/api/signup', json={'username': name, 'email': name + '@bench.local',
+                                                   'password': PASSWORD, 'role': 'buyer', 'location': 'Nashik'})
+
+    def create_crop(s):
+        response = s['farmer'].post('/api/crops', json={
+            'crop_name': rng.choice(CROP_NAMES), 'category': rng.choice(CATEGORIES),
+            'quantity': 500, 'price_per_unit': 25, 'description': 'Benchmark lot'})
+        s['own_crops'].append(response.get_json().get('crop_id'))
+        return response
+
+    def own_a_crop(s, calls):
+        if not s['own_crops']:
+            create_crop(s).close()
+
+    def update_crop(s):
+        return s['farmer'].put(f"/api/crops/{rng.choice(s['own_crops'])}",
+                               json={'price_per_unit': round(rng.uniform(10, 100), 2)})
+
+    def create_transaction(s):
+        response = s['buyer'].post('/api/transactions', json={'crop_id': crop_id(), 'quantity': 1,
+                                                              'agreement_accepted': True})
+        s['transactions'].append(response.get_json().get('transaction_id'))
+        return response
+
+    def pending_transactions(s, calls):
+        for _ in range(calls - len(s['transactions'])):
+            create_transaction(s).close()
+
+    def pay(s):
+        return s['buyer'].post(f"/api/transactions/{s['transactions'].pop()}/payment",
+                               json={'status': 'completed', 'method': 'upi'})
+
+    return {
+        'POST /api/signup': (signup, None),
+        # A client of its own, so the anonymous one stays logged out
+        'POST /api/login': (lambda s: s['login'].post('/api/login', json={
+            'username': f"buyer{rng.randrange(len(ids['buyer_ids']))}", 'password': PASSWORD}), None),
+        'GET /api/crops?limit': (lambda s: s['anon'].get('/api/crops?limit=50'), None),
+        'GET /api/crops?category&location': (lambda s: s['anon'].get(
+            '/api/crops', query_string={'category': rng.choice(CATEGORIES), 'location': rng.choice(LOCATIONS),
+                                        'limit': 50}), None),
+        'GET /api/crops/search': (lambda s: s['anon'].get(
+            '/api/crops/search', query_string={'q': rng.choice(CROP_NAMES).lower()[:4], 'max_price': 60}), None),
+        'GET /api/crops?near': (lambda s: s['anon'].get('/api/crops?near=30.9,75.85&radius_km=200&limit=50'), None),
+        'GET /api/crops/<id>': (lambda s: s['anon'].get(f'/api/crops/{crop_id()}'), None),
+        'POST /api/crops': (create_crop, None),
+        'PUT /api/crops/<id>': (update_crop, own_a_crop),
+        'POST /api/transactions': (create_transaction, None),
+        'POST /api/transactions/<id>/payment': (pay, pending_transactions),
+        'POST /api/orders': (lambda s: s['buyer'].post('/api/orders', json={
+            'crop_name': rng.choice(CROP_NAMES), 'quantity': rng.randint(1, 50), 'max_price': 60}), None),
+        'GET /api/prices': (lambda s: s['anon'].get('/api/prices'), None),
+        'GET /api/prices/latest': (lambda s: s['anon'].get('/api/prices/latest',
+                                                           query_string={'crop': rng.choice(CROP_NAMES)}), None),
+        'GET /api/prices/history': (lambda s: s['anon'].get('/api/prices/history', query_string={
+            'crop': rng.choice(CROP_NAMES), 'bucket': rng.choice(['day', 'week', 'month'])}), None),
+        'POST /api/chat': (lambda s: s['farmer'].post('/api/chat', json={
+            'message': f'{rng.choice(QUESTIONS)} ({rng.randrange(20)})', 'type': 'general'}), None),
+    }
+
+def matching_benchmark(app, db, ids, rng, orders):
+    """Trades per second through the matching engine, without HTTP.
+
+    First `orders` buy orders sweep the seeded listings, then as many
+    low-priced orders rest in the books and fresh listings fill them.
+    """
+    from models import Crop
+    from matching import MatchingEngine, book_key
+    engine = MatchingEngine(app)
+    results = {}
+    with app.app_context():
+        # Load the books up front, as a running server with demand for every crop already has them
+        engine.refresh()
+        engine.load_asks([book_key(name) for name in CROP_NAMES])
+        started = time.perf_counter()
+        trades = 0
+        for _ in range(orders):
+            _, made = engine.place(rng.choice(ids['buyer_ids']), rng.choice(CROP_NAMES), rng.choice(LOCATIONS),
+                                   rng.randint(100, 5000), 100)
+            trades += len(made)
+        results['orders_taking_listings'] = (trades, time.perf_counter() - started)
+
+        for _ in range(orders):
+            engine.place(rng.choice(ids['buyer_ids']), rng.choice(CROP_NAMES), rng.choice(LOCATIONS + ['']),
+                         rng.randint(10, 100), 5)
+        now = datetime.utcnow()
+        crop_ids = db.session.execute(Crop.__table__.insert().returning(Crop.id, sort_by_parameter_order=True), [{
+            'farmer_id': rng.choice(ids['farmer_ids']), 'crop_name': rng.choice(CROP_NAMES), 'category': 'cereal',
+            'quantity': 500, 'unit': 'kg', 'price_per_unit': 5, 'location': rng.choice(LOCATIONS),
+            'status': 'available', 'created_at': now,
+        } for _ in range(max(1, orders // 10))]).scalars().all()
+        db.session.commit()
+        started = time.perf_counter()
+        trades = len(engine.update_listings(crop_ids))
+        results['listings_filling_orders'] = (trades, time.perf_counter() - started)
+
+    report = {}
+    for name, (trades, seconds) in results.items():
+        report[name] = {'trades': trades, 'seconds': round(seconds, 3),
+                        'matches_per_second': round(trades / seconds, 1) if seconds else 0.0}
+        print(f"matching {name:<31} {trades:>6} trades  {report[name]['matches_per_second']:>10.1f} matches/s",
+              file=sys.stderr)
+    return report
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='kisan_bench_')
+    os.environ.update({
+        'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        'CACHE_BACKEND': args.cache,
+        'OPENAI_API_KEY': 'benchmark',
+        'FLASK_DEBUG': 'false',
+    })
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from app import app, db, llm_client, chat_log
+
+    def stub_create(messages, **kwargs):
+        time.sleep(args.llm_latency)
+        return {'choices': [{'message': {'content': 'Stubbed advice for: ' + messages[-1]['content']}}]}
+    llm_client.create = stub_create
+
+    rng = random.Random(args.seed)
+    sizes = {'farmers': args.farmers, 'buyers': args.buyers, 'crops': args.crops,
+             'prices': args.prices, 'chats': args.chats}
+    started = time.perf_counter()
+    ids = seed(app, db, sizes, rng)
+    seed_seconds = time.perf_counter() - started
+    print(f'Seeded {sizes} in {seed_seconds:.1f}s', file=sys.stderr)
+
+    with app.app_context():
+        counter = QueryCounter(db.engine, db)
+
+    # One session per worker, logged in before anything is timed; clients
+    # aren't thread-safe (cookies are per client), so each worker keeps its own
+    sessions = [{
+        'anon': app.test_client(),
+        'login': app.test_client(),
+        'farmer': login(app, f"farmer{rng.randrange(len(ids['farmer_ids']))}"),
+        'buyer': login(app, f"buyer{rng.randrange(len(ids['buyer_ids']))}"),
+        'own_crops': [], 'transactions': [],
+    } for _ in range(args.concurrency)]
+    shares = [args.requests // args.concurrency + (i < args.requests % args.concurrency)
+              for i in range(args.concurrency)]
+    pool = ThreadPoolExecutor(max_workers=args.concurrency)
+
+    results = {}
+    for name, (scenario, prepare) in scenarios(ids, rng).items():
+        if args.only and not any(part in name for part in args.only):
+            continue
+
+        def calls(s, count):
+            samples = []
+            for _ in range(count):
+                counter.take()
+                start = time.perf_counter()
+                response = scenario(s)
+                elapsed = time.perf_counter() - start
+                response.close()
+                samples.append((elapsed, counter.take(), response.status_code))
+            return samples
+
+        if prepare is not None:
+            for i, s in enumerate(sessions):
+                prepare(s, shares[i] + (args.warmup if i == 0 else 0))
+        calls(sessions[0], args.warmup)
+        wall = time.perf_counter()
+        futures = [pool.submit(calls, s, count) for s, count in zip(sessions, shares)]
+        samples = [sample for future in futures for sample in future.result()]
+        wall = time.perf_counter() - wall
+
+        latencies = sorted(sample[0] * 1000 for sample in samples)
+        results[name] = {
+            'requests': len(samples),
+            'errors': sum(1 for sample in samples if sample[2] >= 400),
+            'throughput_rps': round(len(samples) / wall, 1),
+            'mean_ms': round(sum(latencies) / len(latencies), 3),
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p95_ms': round(percentile(latencies, 95), 3),
+            'p99_ms': round(percentile(latencies, 99), 3),
+            'queries_per_request': round(sum(sample[1] for sample in samples) / len(samples), 2),
+        }
+        row = results[name]
+        print(f"{name:<40} p50 {row['p50_ms']:>8.2f}  p95 {row['p95_ms']:>8.2f}  p99 {row['p99_ms']:>8.2f} ms"
+              f"  {row['throughput_rps']:>8.1f} req/s  {row['queries_per_request']:>5} q/req"
+              + (f"  {row['errors']} errors" if row['errors'] else ''), file=sys.stderr)
+
+    pool.shutdown()
+    matching = matching_benchmark(app, db, ids, rng, args.matching_orders) if args.matching_orders else {}
+
+    chat_log.close()
+    with app.app_context():
+        db.engine.dispose()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+            'python': platform.python_version(),
+            'sizes': sizes,
+            'seed': args.seed,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'cache': args.cache,
+            'llm_latency': args.llm_latency,
+            'seed_seconds': round(seed_seconds, 2),
+        },
+        'endpoints': results,
+        'matching': matching,
+    }
+
+def regressions(report, baseline, tolerance):
+    """Endpoints that got slower at p95 by more than tolerance or issue more queries,
+    and matching throughput that fell by more than tolerance"""
+    found = []
+    for name, row in report['endpoints'].items():
+        old = baseline.get('endpoints', {}).get(name)
+        if old is None:
+            continue
+        if row['p95_ms'] > old['p95_ms'] * (1 + tolerance):
+            found.append(f"{name}: p95 {old['p95_ms']} -> {row['p95_ms']} ms")
+        if row['queries_per_request'] > old['queries_per_request']:
+            found.append(f"{name}: queries/request {old['queries_per_request']} -> {row['queries_per_request']}")
+    for name, row in report.get('matching', {}).items():
+        old = baseline.get('matching', {}).get(name)
+        if old and row['matches_per_second'] < old['matches_per_second'] * (1 - tolerance):
+            found.append(f"matching {name}: {old['matches_per_second']} -> {row['matches_per_second']} matches/s")
+    return found
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--farmers', type=int, default=200)
+    parser.add_argument('--buyers', type=int, default=800)
+    parser.add_argument('--crops', type=int, default=20000)
+    parser.add_argument('--prices', type=int, default=50000)
+    parser.add_argument('--chats', type=int, default=5000)
+    parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint.')
+    parser.add_argument('--concurrency', type=int, default=4, help='Client threads.')
+    parser.add_argument('--warmup', type=int, default=10, help='Untimed requests per endpoint.')
+    parser.add_argument('--cache', choices=['none', 'memory'], default='none',
+                        help='Response cache backend; none measures the database path.')
+    parser.add_argument('--matching-orders', type=int, default=2000,
+                        help='Buy orders for the matching engine benchmark (0 skips it).')
+    parser.add_argument('--llm-latency', type=float, default=0.05, help='Seconds the stub LLM takes.')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--only', nargs='*', help='Run only endpoints whose name contains one of these.')
+    parser.add_argument('--out', help='Write the JSON report here (default stdout).')
+    parser.add_argument('--baseline', help='Earlier JSON report to compare against.')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed p95 slowdown vs the baseline.')
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(report, json.load(f), args.tolerance)
+        for line in found:
+            print('REGRESSION ' + line, file=sys.stderr)
+        return 1 if found else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,204 @@
+import csv
+import io
+from datetime import datetime
+from models import db, Crop, Transaction
+
+# Listing fields a farmer may set, with their max length (None = number)
+EDITABLE_FIELDS = {
+    'crop_name': 100,
+    'category': 50,
+    'quantity': None,
+    'unit': 20,
+    'price_per_unit': None,
+    'description': 10000,
+    'status': 20,
+}
+REQUIRED_FIELDS = ('crop_name', 'category', 'quantity', 'price_per_unit')
+STATUSES = ('available', 'sold', 'pending')
+
+class BulkError(Exception):
+    """The payload itself is unusable (not a list, bad CSV, too many items)"""
+
+def parse_items(request, max_items):
+    """Items from a JSON array ({"crops": [...]} also accepted), a multipart
+    'file' or a text/csv body; CSV cells arrive as strings"""
+    upload = request.files.get('file')
+    if upload is not None or request.mimetype == 'text/csv':
+        stream = upload.stream if upload is not None else request.stream
+        try:
+            items = list(csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')))
+        except (csv.Error, UnicodeDecodeError) as e:
+            raise BulkError(f'Unreadable CSV: {e}')
+        # Empty cells mean "not given", as a missing JSON key would
+        items = [{key.strip(): value for key, value in row.items() if key and value not in (None, '')}
+                 for row in items]
+    else:
+        data = request.get_json(silent=True)
+        items = data.get('crops') if isinstance(data, dict) else data
+        if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            raise BulkError('Expected a JSON array of objects or a CSV file')
+    if not items:
+        raise BulkError('No items given')
+    if len(items) > max_items:
+        raise BulkError(f'At most {max_items} items per request')
+    return items
+
+def clean_number(value):
+    if isinstance(value, bool):
+        raise ValueError
+    number = float(value)
+    if not number > 0:
+        raise ValueError
+    return number
+
+def validate_item(item, partial=False):
+    """Return (values, errors) for one listing; partial allows missing fields (updates)"""
+    values, errors = {}, {}
+    for field, max_length in EDITABLE_FIELDS.items():
+        if field not in item:
+            continue
+        value = item[field]
+        if max_length is None:
+            try:
+                values[field] = clean_number(value)
+            except (TypeError, ValueError):
+                errors[field] = 'Must be a positive number'
+        elif not isinstance(value, str) or not value.strip():
+            errors[field] = 'Must be a non-empty string'
+        elif len(value) > max_length:
+            errors[field] = f'At most {max_length} characters'
+        else:
+            values[field] = value.strip()
+    if 'status' in values and values['status'] not in STATUSES:
+        errors['status'] = 'Must be one of ' + ', '.join(STATUSES)
+    if not partial:
+        for field in REQUIRED_FIELDS:
+            if field not in item:
+                errors[field] = 'Required'
+    return values, errors
+
+def parse_id(item):
+    try:
+        crop_id = item['id']
+        if isinstance(crop_id, bool):
+            raise ValueError
+        return int(crop_id)
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def owned_ids(farmer_id, crop_ids):
+    """The subset of crop_ids listed by farmer_id"""
+    owned = set()
+    ids = list(crop_ids)
+    for start in range(0, len(ids), 500):  # stay under SQLite's bound-parameter limit
+        owned.update(db.session.execute(
+            db.select(Crop.id).where(Crop.id.in_(ids[start:start + 500]), Crop.farmer_id == farmer_id)
+        ).scalars())
+    return owned
+
+def traded_ids(crop_ids):
+    """The subset of crop_ids that some transaction was made against"""
+    traded = set()
+    ids = list(crop_ids)
+    for start in range(0, len(ids), 500):
+        traded.update(db.session.execute(
+            db.select(Transaction.crop_id).where(Transaction.crop_id.in_(ids[start:start + 500])).distinct()
+        ).scalars())
+    return traded
+
+def bulk_create(farmer, items):
+    """Validate every item, then insert them all in one executemany.
+
+    Returns (new ids in item order, errors); nothing is written if any
+    item fails validation.
+    """
+    rows, errors = [], []
+    now = datetime.utcnow()
+    for index, item in enumerate(items):
+        values, item_errors = validate_item(item)
+        if item_errors:
+            errors.append({'index': index, 'errors': item_errors})
+            continue
+        values.setdefault('unit', 'kg')
+        values.setdefault('status', 'available')
+        # Core inserts skip the ORM geocoding hook; listings share the farmer's location
+        rows.append(dict(values, farmer_id=farmer.id, location=farmer.location,
+                         latitude=farmer.latitude, longitude=farmer.longitude, created_at=now))
+    if errors:
+        return [], errors
+
+    table = Crop.__table__
+    ids = db.session.execute(
+        table.insert().returning(table.c.id, sort_by_parameter_order=True), rows
+    ).scalars().all()
+    db.session.commit()
+    return ids, []
+
+def bulk_update(farmer, items):
+    """Apply per-item changes to the farmer's listings in one transaction.
+
+    Items are grouped by the set of fields they change so each group is a
+    single executemany UPDATE. Returns (updated ids, errors).
+    """
+    errors, changes = [], []
+    for index, item in enumerate(items):
+        crop_id = parse_id(item)
+        values, item_errors = validate_item(item, partial=True)
+        if crop_id is None:
+            item_errors['id'] = 'Required'
+        elif not values and not item_errors:
+            item_errors['fields'] = 'Nothing to update'
+        if item_errors:
+            errors.append({'index': index, 'errors': item_errors})
+        else:
+            changes.append((index, crop_id, values))
+
+    owned = owned_ids(farmer.id, {crop_id for _, crop_id, _ in changes})
+    for index, crop_id, _ in changes:
+        if crop_id not in owned:
+            errors.append({'index': index, 'errors': {'id': 'Crop not found'}})
+    if errors:
+        return [], sorted(errors, key=lambda error: error['index'])
+
+    table = Crop.__table__
+    groups = {}
+    for _, crop_id, values in changes:
+        groups.setdefault(tuple(sorted(values)), []).append(dict(values, crop_id=crop_id))
+    for fields, params in groups.items():
+        db.session.execute(
+            table.update()
+            .where(table.c.id == db.bindparam('crop_id'))
+            .values({field: db.bindparam(field) for field in fields}),
+            params
+        )
+    db.session.commit()
+    return list(dict.fromkeys(crop_id for _, crop_id, _ in changes)), []
+
+def bulk_delete(farmer, items):
+    """Delete the farmer's listings named by id; all or nothing. Returns (deleted ids, errors)
+
+    Listings with transactions can't be deleted: the transactions would
+    lose their crop.
+    """
+    errors, ids = [], {}
+    for index, item in enumerate(items):
+        crop_id = parse_id(item)
+        if crop_id is None:
+            errors.append({'index': index, 'errors': {'id': 'Required'}})
+        else:
+            ids[crop_id] = index
+    owned = owned_ids(farmer.id, ids)
+    errors.extend({'index': index, 'errors': {'id': 'Crop not found'}}
+                  for crop_id, index in ids.items() if crop_id not in owned)
+    traded = traded_ids(owned)
+    errors.extend({'index': index, 'errors': {'id': 'Listing has transactions'}}
+                  for crop_id, index in ids.items() if crop_id in traded)
+    if errors:
+        return [], sorted(errors, key=lambda error: error['index'])
+
+    table = Crop.__table__
+    id_list = list(owned)
+    for start in range(0, len(id_list), 500):
+        db.session.execute(table.delete().where(table.c.id.in_(id_list[start:start + 500])))
+    db.session.commit()
+    return id_list, []
@@ -0,0 +1,178 @@
+import hashlib
+import itertools
+import json
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, request
+
+class MemoryCache:
+    """In-process LRU cache with a per-entry TTL.
+
+    Single process only: invalidations never reach other workers or the
+    CLI commands (ingest-prices, forecast-prices), whose writes show up
+    once the TTL expires. Under gunicorn with several workers it is
+    replaced by Redis, or turned off (see ResponseCache.share_between).
+    """
+
+    def __init__(self, max_entries=1024, ttl=30):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.generations = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.entries.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def generation(self, namespace):
+        return self.generations.get(namespace, 0)
+
+    def bump(self, namespace):
+        with self.lock:
+            self.generations[namespace] = self.generations.get(namespace, 0) + 1
+
+class RedisCache:
+    """Cache shared by all workers through a Redis-compatible server"""
+
+    def __init__(self, url, ttl=30, prefix='kisan_mandi'):
+        import redis  # optional dependency, only needed for this backend
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(f'{self.prefix}:{key}')
+        if raw is None:
+            return None
+        meta, body = raw.split(b'\n', 1)
+        meta = json.loads(meta)
+        return body, meta['etag'], meta['mimetype']
+
+    def set(self, key, value):
+        body, etag, mimetype = value
+        meta = json.dumps({'etag': etag, 'mimetype': mimetype}).encode()
+        self.client.setex(f'{self.prefix}:{key}', self.ttl, meta + b'\n' + body)
+
+    def generation(self, namespace):
+        return int(self.client.get(f'{self.prefix}:gen:{namespace}') or 0)
+
+    def bump(self, namespace):
+        self.client.incr(f'{self.prefix}:gen:{namespace}')
+
+class ResponseCache:
+    """Caches JSON GET responses per namespace and answers If-None-Match with 304.
+
+    Keys combine the namespace's generation counter with the request path
+    and sorted query args; invalidate(namespace) bumps the counter so every
+    older entry for it is simply never read again.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.backend = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        backend = app.config.get('CACHE_BACKEND', 'memory')
+        ttl = app.config.get('CACHE_TTL', 30)
+        if backend == 'redis':
+            self.backend = RedisCache(app.config['CACHE_REDIS_URL'], ttl)
+        elif backend == 'memory':
+            self.backend = MemoryCache(app.config.get('CACHE_MAX_ENTRIES', 1024), ttl)
+        else:
+            self.backend = None
+
+    def share_between(self, workers):
+        """Called before forking workers: separate memory caches would keep
+        serving what other workers invalidated, so with several workers use
+        Redis if it answers at CACHE_REDIS_URL and otherwise stop caching"""
+        if workers <= 1 or not isinstance(self.backend, MemoryCache):
+            return
+        try:
+            backend = RedisCache(self.app.config['CACHE_REDIS_URL'], self.app.config.get('CACHE_TTL', 30))
+            backend.client.ping()
+        except Exception:  # redis not installed or not reachable
+            self.app.logger.warning('CACHE_BACKEND=memory is per process; with %d workers and no Redis at '
+                                    'CACHE_REDIS_URL response caching is off', workers)
+            self.backend = None
+            return
+        self.app.logger.warning('CACHE_BACKEND=memory is per process; using Redis for %d workers', workers)
+        self.backend = backend
+
+    def invalidate(self, *namespaces):
+        if self.backend is None:
+            return
+        for namespace in namespaces:
+            self.backend.bump(namespace)
+
+    def make_key(self, namespace):
+        args = '&'.join(f'{k}={v}' for k, v in sorted(request.args.items(multi=True)))
+        return f'{namespace}:{self.backend.generation(namespace)}:{request.path}?{args}'
+
+    def cached(self, namespace):
+        """Decorator for GET views whose output only depends on the URL"""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if self.backend is None:
+                    return view(*args, **kwargs)
+
+                key = self.make_key(namespace)
+                hit = self.backend.get(key)
+                if hit is not None:
+                    return self.build_response(*hit)
+
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+                body = self.read_body(response, current_app.config.get('CACHE_MAX_BODY', 1024 * 1024))
+                if body is None:
+                    return response  # too large to cache; keeps streaming
+                etag = hashlib.sha1(body).hexdigest()
+                self.backend.set(key, (body, etag, response.mimetype))
+                return self.build_response(body, etag, response.mimetype)
+            return wrapper
+        return decorator
+
+    @staticmethod
+    def read_body(response, max_body):
+        """Return the response body, or None if a streamed body exceeds max_body"""
+        if not response.is_streamed:
+            return response.get_data()
+        chunks, size = [], 0
+        stream = response.iter_encoded()
+        for chunk in stream:
+            chunks.append(chunk)
+            size += len(chunk)
+            if size > max_body:
+                response.response = itertools.chain(chunks, stream)
+                return None
+        return b''.join(chunks)
+
+    @staticmethod
+    def build_response(body, etag, mimetype):
+        response = current_app.response_class(body, mimetype=mimetype)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
@@ -0,0 +1,161 @@
+import hashlib
+import re
+import threading
+from collections import Counter, OrderedDict
+
+# Words that don't change what a farmer is asking about. Negations and
+# question words are deliberately kept: "when" vs "what" matters.
+STOPWORDS = frozenset({
+    'a', 'an', 'the', 'to', 'of', 'is', 'are', 'am', 'i', 'my', 'me', 'we', 'our',
+    'should', 'can', 'could', 'would', 'do', 'does', 'please', 'for', 'in', 'on',
+    'at', 'it', 'this', 'that', 'tell', 'about', 'and', 'or', 'you', 'your',
+})
+
+# Crops and places: questions that differ in one of these are different
+# questions however much of the wording they share. The app adds the crop
+# names and markets it knows from its own data on top of these.
+DOMAIN_TERMS = frozenset({
+    'wheat', 'rice', 'paddy', 'maize', 'corn', 'bajra', 'jowar', 'ragi', 'barley', 'millet',
+    'cotton', 'sugarcane', 'jute', 'soybean', 'groundnut', 'mustard', 'sunflower',
+    'gram', 'chana', 'tur', 'arhar', 'moong', 'urad', 'masoor', 'lentil',
+    'tomato', 'onion', 'potato', 'chilli', 'garlic', 'ginger', 'turmeric', 'cabbage',
+    'cauliflower', 'brinjal', 'okra', 'banana', 'mango', 'apple', 'grapes', 'coconut',
+    'tea', 'coffee', 'cardamom', 'pepper', 'cumin', 'coriander',
+    'gehun', 'chawal', 'dhan', 'makka', 'kapas', 'ganna', 'sarson', 'pyaz', 'aloo',
+    'tamatar', 'mirchi', 'haldi', 'lahsun', 'adrak',
+    'punjab', 'haryana', 'rajasthan', 'gujarat', 'maharashtra', 'karnataka', 'kerala',
+    'tamil', 'nadu', 'andhra', 'telangana', 'odisha', 'bihar', 'bengal', 'assam',
+    'uttar', 'madhya', 'pradesh', 'delhi', 'ludhiana', 'amritsar', 'indore', 'nashik',
+    'pune', 'jaipur', 'lucknow', 'patna', 'hyderabad', 'bangalore', 'chennai', 'mumbai',
+})
+
+TOKEN_RE = re.compile(r'\w+')
+
+def normalize(message):
+    """Lowercase, drop punctuation and collapse whitespace"""
+    return ' '.join(TOKEN_RE.findall((message or '').lower()))
+
+def content_tokens(normalized):
+    return frozenset(word for word in normalized.split() if word not in STOPWORDS)
+
+def cache_scope(message_type, context=None):
+    """Answers are only shared between questions of the same type asked with
+    the same data context (e.g. the forecasts quoted to the model)"""
+    if not context:
+        return message_type
+    return (message_type, hashlib.blake2b(context.encode(), digest_size=8).hexdigest())
+
+class ChatResponseCache:
+    """LRU cache of chatbot answers keyed on (scope, normalized message),
+    where scope is the message type plus any context the answer was built on.
+
+    When there is no exact match, a question whose content words overlap a
+    cached one by at least `similarity` (Jaccard) is treated as the same
+    question, provided both name exactly the same crops and places
+    (domain terms). An inverted index from word to cached keys keeps that lookup
+    proportional to the few entries sharing a word with the question,
+    not to the cache size.
+    """
+
+    def __init__(self, app=None):
+        self.entries = OrderedDict()
+        self.index = {}
+        self.lock = threading.Lock()
+        self.warmed = False
+        self.domain_terms = set(DOMAIN_TERMS)
+        self.hits = self.near_hits = self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_entries = app.config.get('CHAT_CACHE_SIZE', 2000)
+        self.similarity = app.config.get('CHAT_CACHE_SIMILARITY', 0.85)
+        self.warm_limit = app.config.get('CHAT_CACHE_WARM', 500)
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def get(self, message, message_type, context=None):
+        normalized = normalize(message)
+        scope = cache_scope(message_type, context)
+        key = (scope, normalized)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            match = self.find_similar(scope, content_tokens(normalized))
+            if match is not None:
+                self.entries.move_to_end(match)
+                self.near_hits += 1
+                return self.entries[match][1]
+            self.misses += 1
+            return None
+
+    def add_domain_terms(self, names):
+        """Treat the words of these names (crops, markets) as domain terms too"""
+        terms = {word for name in names for word in normalize(name).split()} - STOPWORDS
+        with self.lock:
+            self.domain_terms |= terms
+
+    def find_similar(self, scope, tokens):
+        if not tokens or not self.similarity:
+            return None
+        domain = tokens & self.domain_terms
+        overlap = Counter()
+        for token in tokens:
+            for key in self.index.get(token, ()):
+                if key[0] == scope:
+                    overlap[key] += 1
+        best, best_score = None, self.similarity
+        for key, shared in overlap.items():
+            other = self.entries[key][0]
+            if other & self.domain_terms != domain:
+                continue
+            score = shared / (len(tokens) + len(other) - shared)
+            if score >= best_score:
+                best, best_score = key, score
+        return best
+
+    def put(self, message, message_type, bot_response, context=None):
+        normalized = normalize(message)
+        if not normalized:
+            return
+        key = (cache_scope(message_type, context), normalized)
+        tokens = content_tokens(normalized)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+            for token in tokens:
+                self.index.setdefault(token, set()).add(key)
+            self.entries[key] = (tokens, bot_response)
+            while len(self.entries) > self.max_entries:
+                self.evict()
+
+    def evict(self):
+        key, (tokens, _) = self.entries.popitem(last=False)
+        for token in tokens:
+            keys = self.index.get(token)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.index[token]
+
+    def warm(self, rows):
+        """Seed from (user_message, bot_response, message_type) history rows, oldest first"""
+        for user_message, bot_response, message_type in rows:
+            self.put(user_message, message_type or 'general', bot_response)
+        self.warmed = True
+
+    def stats(self):
+        lookups = self.hits + self.near_hits + self.misses
+        return {
+            'size': len(self.entries),
+            'max_size': self.max_entries,
+            'hits': self.hits,
+            'near_hits': self.near_hits,
+            'misses': self.misses,
+            'hit_rate': round((self.hits + self.near_hits) / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,202 @@
+import atexit
+import gzip
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from sqlalchemy.exc import OperationalError
+from models import db, ChatMessage
+
+class ChatLogWriter:
+    """Write-behind queue for ChatMessage rows.
+
+    Requests enqueue their row and return; a background thread inserts
+    queued rows in batches, so chat requests don't each take the SQLite
+    write lock. Pending rows are flushed at interpreter exit. When the
+    queue is full (the database can't keep up) the row is written
+    synchronously instead of being dropped. When a batch insert fails its
+    rows are retried one at a time: a row the database rejects is logged
+    and dropped, and rows that hit a locked or unavailable database are
+    kept for the next flush.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.thread = None
+        self.pid = None
+        self.lock = threading.Lock()
+        self.flushing = threading.Lock()
+        # Rows written but not yet committed, whether queued, failed or mid-insert
+        self.pending = 0
+        self.settled = threading.Condition()
+        self.retry = []
+        self.stopping = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config.get('CHAT_LOG_ASYNC', True)
+        self.batch_size = app.config.get('CHAT_LOG_BATCH', 200)
+        self.interval = app.config.get('CHAT_LOG_FLUSH_INTERVAL', 1.0)
+        self.queue = queue.Queue(maxsize=app.config.get('CHAT_LOG_QUEUE_MAX', 10000))
+        atexit.register(self.close)
+
+    def write(self, user_id, user_message, bot_response, message_type):
+        row = {
+            'user_id': user_id,
+            'user_message': user_message,
+            'bot_response': bot_response,
+            'message_type': message_type,
+            'created_at': datetime.utcnow(),
+        }
+        if not self.enabled or self.stopping.is_set():
+            self.insert([row])
+            return
+        self.ensure_thread()
+        with self.settled:
+            self.pending += 1
+        try:
+            self.queue.put_nowait(row)
+        except queue.Full:
+            self.done(1)
+            self.insert([row])
+
+    def done(self, count):
+        with self.settled:
+            self.pending -= count
+            self.settled.notify_all()
+
+    def ensure_thread(self):
+        # Started lazily, again after a fork (e.g. gunicorn --preload), and
+        # again if the thread ever died
+        if self.thread is not None and self.pid == os.getpid() and self.thread.is_alive():
+            return
+        with self.lock:
+            if self.thread is None or self.pid != os.getpid() or not self.thread.is_alive():
+                self.pid = os.getpid()
+                self.thread = threading.Thread(target=self.run, name='chat-log-writer', daemon=True)
+                self.thread.start()
+
+    def run(self):
+        while not self.stopping.is_set():
+            try:
+                rows = [self.queue.get(timeout=self.interval)]
+            except queue.Empty:
+                rows = []
+            # None only wakes the thread up to notice it is stopping
+            rows = [row for row in rows if row is not None]
+            if not rows and not self.retry:
+                continue
+            try:
+                if not self.flush(rows, wait=False):
+                    time.sleep(self.interval)  # back off while the database is failing
+            except Exception:
+                self.app.logger.exception('Chat log writer error')
+                time.sleep(self.interval)
+
+    def flush(self, rows=None, wait=True):
+        """Insert everything queued so far (plus rows), in batches.
+
+        With wait, also wait (briefly) for a batch the writer thread has
+        already taken off the queue to commit. Returns False if the
+        database was unavailable; those rows are retried on the next flush.
+        """
+        rows = list(rows or [])
+        with self.flushing:
+            rows, self.retry = self.retry + rows, []
+            while True:
+                while len(rows) < self.batch_size:
+                    try:
+                        row = self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if row is not None:
+                        rows.append(row)
+                if not rows:
+                    break
+                try:
+                    self.insert(rows)
+                    self.done(len(rows))
+                except Exception:
+                    self.app.logger.exception('Could not write %d chat messages; trying one at a time', len(rows))
+                    rows = self.insert_each(rows)
+                    if rows:
+                        self.retry = rows
+                        return False
+                rows = []
+        if wait:
+            with self.settled:
+                self.settled.wait_for(lambda: self.pending <= 0 or self.retry, timeout=self.interval * 5)
+        return True
+
+    def insert_each(self, rows):
+        """Insert rows one by one after their batch failed; return the rows to retry.
+
+        Only an OperationalError (locked, busy, disk full) is worth retrying;
+        a row failing any other way would fail every later batch it joined.
+        """
+        for i, row in enumerate(rows):
+            try:
+                self.insert([row])
+            except OperationalError:
+                self.app.logger.exception('Could not write chat messages; will retry')
+                return rows[i:]
+            except Exception:
+                self.app.logger.exception('Dropping chat message that cannot be written: %r', row)
+            self.done(1)
+        return []
+
+    def insert(self, rows):
+        with self.app.app_context():
+            with db.engine.begin() as connection:
+                connection.execute(ChatMessage.__table__.insert(), rows)
+
+    def close(self):
+        """Stop the writer thread and flush whatever is still queued"""
+        self.stopping.set()
+        if self.thread is not None and self.pid == os.getpid() and self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join(timeout=10)
+        self.flush(wait=False)
+
+def archive_chat_messages(before, directory, batch_size=5000):
+    """Move chat messages created before `before` into a gzip JSONL file.
+
+    The archive is written and fsynced completely before anything is
+    deleted, and the delete is bounded by the last id written, so a crash
+    part-way leaves every message either in the database or in a finished
+    archive. Returns (rows archived, archive path or None).
+    """
+    table = ChatMessage.__table__
+    last_id = db.session.execute(
+        db.select(db.func.max(table.c.id)).where(table.c.created_at < before)
+    ).scalar()
+    if last_id is None:
+        return 0, None
+
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"chat_messages_before_{before:%Y%m%d}_{last_id}.jsonl.gz")
+    count, after_id = 0, 0
+    with gzip.open(path, 'wt', encoding='utf-8') as archive:
+        while True:
+            rows = db.session.execute(
+                db.select(table)
+                .where(table.c.created_at < before, table.c.id > after_id, table.c.id <= last_id)
+                .order_by(table.c.id)
+                .limit(batch_size)
+            ).mappings().all()
+            if not rows:
+                break
+            for row in rows:
+                archive.write(json.dumps(dict(row, created_at=str(row['created_at']))) + '\n')
+            count += len(rows)
+            after_id = rows[-1]['id']
+    with open(path, 'rb') as f:
+        os.fsync(f.fileno())
+
+    db.session.execute(table.delete().where(table.c.created_at < before, table.c.id <= last_id))
+    db.session.commit()
+    return count, path
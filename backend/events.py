@@ -0,0 +1,151 @@
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+class EventBroker:
+    """In-process pub/sub for listing and price changes, streamed as Server-Sent Events.
+
+    Published events go into one shared ring buffer of the last
+    EVENTS_BUFFER events, serialized once; a subscriber only remembers the
+    id of the last event it sent, so an idle connection costs no memory
+    beyond its thread. A subscriber that falls further behind than the
+    buffer (or reconnects to a restarted process) gets a 'reset' event
+    telling it to refetch. Like the memory response cache this is per
+    process: with several workers, a client only hears about writes made
+    by the worker it is connected to, so run one worker (more threads, or
+    gevent) where every client must see every change.
+
+    Under gunicorn's gthread workers each open stream pins one of the
+    worker's threads; limit_to_threads() keeps streams from taking them all.
+    """
+
+    def __init__(self, app=None):
+        self.condition = threading.Condition()
+        self.events = deque()
+        self.next_id = 1
+        self.subscribers = 0
+        self.pid = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.events = deque(maxlen=app.config.get('EVENTS_BUFFER', 1000))
+        self.heartbeat = app.config.get('EVENTS_HEARTBEAT', 15)
+        self.max_age = app.config.get('EVENTS_MAX_AGE', 600)
+        self.max_subscribers = app.config.get('EVENTS_MAX_SUBSCRIBERS', 1000)
+
+    @property
+    def epoch(self):
+        """Ids are only meaningful to the process that issued them. Worked out
+        on first use in each process: gunicorn imports the app in the master,
+        and every forked worker needs its own"""
+        pid = os.getpid()
+        if self.pid != pid:
+            self.pid = pid
+            self.process_epoch = f'{pid:x}{time.time_ns():x}'
+        return self.process_epoch
+
+    def limit_to_threads(self, threads):
+        """Keep at least half of a threaded worker's threads free for ordinary requests"""
+        self.max_subscribers = min(self.max_subscribers, threads // 2)
+
+    def check_workers(self, workers):
+        """Called before forking workers: say that streams only carry their own worker's writes"""
+        if workers > 1:
+            self.app.logger.warning('/api/events is per process; with %d workers a stream only sees '
+                                    'changes made through its own worker', workers)
+
+    def publish(self, topic, event_type, data):
+        """Queue an event for every subscriber of topic; never blocks on slow clients"""
+        with self.condition:
+            event_id = self.next_id
+            self.next_id += 1
+            payload = json.dumps(data, default=str, separators=(',', ':'))
+            text = f'id: {self.epoch}.{event_id}\nevent: {event_type}\ndata: {payload}\n\n'
+            self.events.append((event_id, topic, text))
+            self.condition.notify_all()
+
+    def parse_id(self, last_event_id):
+        """Position to resume after for a Last-Event-ID, or None if it is not ours"""
+        epoch, _, number = (last_event_id or '').partition('.')
+        if epoch != self.epoch or not number.isdigit() or int(number) >= self.next_id:
+            return None
+        return int(number)
+
+    def pending(self, last_id):
+        """(events after last_id, whether some were already dropped from the buffer)"""
+        if not self.events:
+            return [], False
+        first = self.events[0][0]
+        if last_id + 1 < first:
+            return list(self.events), True
+        return list(itertools.islice(self.events, last_id + 1 - first, None)), False
+
+    def full(self):
+        return self.subscribers >= self.max_subscribers
+
+    def try_subscribe(self, topics, last_event_id=None):
+        """A Subscription streaming topics, or None if EVENTS_MAX_SUBSCRIBERS are open.
+
+        The check and the slot are taken under one lock, so connections
+        arriving together can't all squeeze past the limit.
+        """
+        with self.condition:
+            if self.full():
+                return None
+            self.subscribers += 1
+        return Subscription(self, self.stream(topics, last_event_id))
+
+    def stream(self, topics, last_event_id=None):
+        """SSE text for one subscriber. Ends after EVENTS_MAX_AGE seconds; the
+        client reconnects with Last-Event-ID and resumes where it left off"""
+        with self.condition:
+            last_id = self.parse_id(last_event_id)
+            reset = last_event_id is not None and last_id is None
+            if last_id is None:
+                last_id = self.next_id - 1
+        yield 'retry: 3000\n\n'
+        if reset:
+            yield f'id: {self.epoch}.{last_id}\nevent: reset\ndata: {{}}\n\n'
+        deadline = time.monotonic() + self.max_age
+        while time.monotonic() < deadline:
+            with self.condition:
+                if not self.events or self.events[-1][0] <= last_id:
+                    self.condition.wait(self.heartbeat)
+                events, dropped = self.pending(last_id)
+            if dropped:
+                last_id = events[-1][0]
+                yield f'id: {self.epoch}.{last_id}\nevent: reset\ndata: {{}}\n\n'
+                continue
+            chunk = [text for _, topic, text in events if topic in topics]
+            if events:
+                last_id = events[-1][0]
+            # A comment line keeps proxies from closing an idle stream and
+            # lets the server notice clients that went away
+            yield ''.join(chunk) if chunk else ': ping\n\n'
+
+class Subscription:
+    """One open stream holding a subscriber slot, used as the response body.
+
+    The WSGI server calls close() when the response ends or the client goes
+    away; that gives the slot back even if the stream never started.
+    """
+
+    def __init__(self, broker, events):
+        self.broker = broker
+        self.events = events
+        self.closed = False
+
+    def __iter__(self):
+        return self.events
+
+    def close(self):
+        self.events.close()
+        with self.broker.condition:
+            if not self.closed:
+                self.closed = True
+                self.broker.subscribers -= 1
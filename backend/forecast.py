@@ -0,0 +1,238 @@
+import re
+import threading
+import time
+from datetime import date, datetime
+import numpy as np
+from models import db, PriceRollup, PriceForecast
+
+SEASON = 12  # monthly prices, yearly cycle
+# Smoothing parameters (level, trend, season) tried for every series; the best in-sample fit wins
+GRID = tuple((alpha, beta, gamma)
+             for alpha in (0.1, 0.3, 0.5, 0.8)
+             for beta in (0.0, 0.1)
+             for gamma in (0.05, 0.2, 0.4))
+DAMPING = 0.9  # trends fade out instead of extrapolating forever
+MONTH_NAMES = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+def month_number(day):
+    return day.year * 12 + day.month - 1
+
+def month_start(number):
+    return date(number // 12, number % 12 + 1, 1)
+
+def load_monthly_prices(history_months):
+    """Average monthly price per (crop_name, location) from the month rollups.
+
+    Returns (keys, first month number, values) where values[i, t] is the
+    average for keys[i] in month first + t, NaN where there were no prices.
+    """
+    table = PriceRollup.__table__
+    last = db.session.execute(db.select(db.func.max(table.c.bucket_start)).where(table.c.bucket == 'month')).scalar()
+    if last is None:
+        return [], 0, np.empty((0, 0))
+    if isinstance(last, str):
+        last = date.fromisoformat(last)
+    first = month_number(last) - history_months + 1
+    rows = db.session.execute(
+        db.select(table.c.crop_name, table.c.location, table.c.bucket_start, table.c.sum_price, table.c.count)
+        .where(table.c.bucket == 'month', table.c.bucket_start >= month_start(first), table.c.count > 0)
+    ).all()
+
+    keys, index = [], {}
+    series, months, prices = [], [], []
+    for crop_name, location, bucket_start, total, count in rows:
+        key = (crop_name, location)
+        if key not in index:
+            index[key] = len(keys)
+            keys.append(key)
+        series.append(index[key])
+        months.append(month_number(bucket_start) - first)
+        prices.append(total / count)
+    values = np.full((len(keys), history_months), np.nan)
+    values[np.array(series, dtype=int), np.array(months, dtype=int)] = prices
+    return keys, first, values
+
+def seasonal_profile(values, first):
+    """Initial seasonal effects: each calendar month's mean deviation from the series mean"""
+    deviation = values - np.nanmean(values, axis=1, keepdims=True)
+    observed = ~np.isnan(deviation)
+    profile = np.zeros((values.shape[0], SEASON))
+    for month in range(SEASON):
+        columns = np.arange((month - first) % SEASON, values.shape[1], SEASON)
+        count = observed[:, columns].sum(axis=1)
+        total = np.where(observed[:, columns], deviation[:, columns], 0.0).sum(axis=1)
+        profile[:, month] = np.divide(total, count, out=np.zeros_like(total), where=count > 0)
+    return profile - profile.mean(axis=1, keepdims=True)
+
+def fit(values, first, horizon, grid=GRID, damping=DAMPING):
+    """Damped additive Holt-Winters for every series and parameter set at once.
+
+    Rows are (series, parameter set) pairs, so each month of history is one
+    vectorized update over all of them; the parameter set with the lowest
+    one-step-ahead squared error is kept per series. Missing months are
+    filled with the model's own prediction. Returns (forecast, stderr),
+    both of shape (series, horizon).
+    """
+    count, months = values.shape
+    k = len(grid)
+    alpha, beta, gamma = (np.tile(column, count) for column in np.array(grid, dtype=float).T)
+    y = np.repeat(values, k, axis=0)
+    season = np.repeat(seasonal_profile(values, first), k, axis=0)
+    level = np.full(count * k, np.nan)
+    trend = np.zeros(count * k)
+    started = np.zeros(count * k, dtype=bool)
+    sse = np.zeros(count * k)
+    seen = np.zeros(count * k)
+
+    for t in range(months):
+        month = (first + t) % SEASON
+        observed = y[:, t]
+        valid = ~np.isnan(observed)
+        effect = season[:, month].copy()
+        predicted = level + damping * trend + effect
+        scored = valid & started
+        sse += np.where(scored, observed - predicted, 0.0) ** 2
+        seen += scored
+        x = np.where(valid, observed, predicted)
+        new_level = alpha * (x - effect) + (1 - alpha) * (level + damping * trend)
+        new_trend = beta * (new_level - level) + (1 - beta) * damping * trend
+        season[:, month] = np.where(started, gamma * (x - new_level) + (1 - gamma) * effect, effect)
+        starting = valid & ~started
+        level = np.where(started, new_level, np.where(starting, observed - effect, level))
+        trend = np.where(started, new_trend, trend)
+        started |= starting
+
+    mse = (sse / np.maximum(seen, 1)).reshape(count, k)
+    best = np.arange(count) * k + mse.argmin(axis=1)
+    steps = np.arange(1, horizon + 1)
+    damped = np.cumsum(damping ** steps)
+    future_months = (first + months - 1 + steps) % SEASON
+    forecast = level[best, None] + damped[None, :] * trend[best, None] + season[best][:, future_months]
+    stderr = np.sqrt(mse.min(axis=1))[:, None] * np.sqrt(steps)[None, :]
+    return forecast, stderr
+
+def run_forecasts(horizon=6, min_months=6, history_months=60):
+    """Refit every (crop_name, location) series and replace the stored forecasts.
+
+    Series with fewer than min_months months of prices, or none in the
+    last year, are left out. Returns a report with counts and timing.
+    """
+    started = time.perf_counter()
+    keys, first, values = load_monthly_prices(history_months)
+    observed = (~np.isnan(values)).sum(axis=1)
+    recent = ~np.isnan(values[:, -SEASON:]).all(axis=1)
+    usable = (observed >= min_months) & recent
+    fitted_at = time.perf_counter()
+
+    rows = []
+    if usable.any():
+        forecast, stderr = fit(values[usable], first, horizon)
+        # 95% interval; prices can't go below zero
+        lower = np.maximum(forecast - 1.96 * stderr, 0.0)
+        upper = forecast + 1.96 * stderr
+        forecast = np.maximum(forecast, 0.0)
+        months = [month_start(first + values.shape[1] + step) for step in range(horizon)]
+        now = datetime.utcnow()
+        for i, (crop_name, location) in enumerate(key for key, keep in zip(keys, usable) if keep):
+            rows.extend({
+                'crop_name': crop_name, 'location': location, 'month': month,
+                'price': float(forecast[i, step]), 'lower': float(lower[i, step]),
+                'upper': float(upper[i, step]), 'generated_at': now,
+            } for step, month in enumerate(months))
+    fit_seconds = time.perf_counter() - fitted_at
+
+    table = PriceForecast.__table__
+    with db.engine.begin() as connection:
+        connection.execute(table.delete())
+        if rows:
+            connection.execute(table.insert(), rows)
+    forecast_index.loaded_at = None
+    return {
+        'series': int(usable.sum()),
+        'skipped': len(keys) - int(usable.sum()),
+        'rows': len(rows),
+        'fit_seconds': round(fit_seconds, 3),
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+
+def price_forecast(crop_name, location=None):
+    """Stored forecasts for a crop, one entry per location, with the best month to sell"""
+    query = PriceForecast.query.filter_by(crop_name=crop_name)
+    if location:
+        query = query.filter_by(location=location)
+    series = {}
+    for row in query.order_by(PriceForecast.location, PriceForecast.month):
+        entry = series.setdefault(row.location, {
+            'location': row.location or None,
+            'generated_at': str(row.generated_at),
+            'forecast': [],
+        })
+        entry['forecast'].append(row.to_dict())
+    for entry in series.values():
+        entry['best_month'] = max(entry['forecast'], key=lambda point: point['price'])['month']
+    return list(series.values())
+
+class ForecastIndex:
+    """Crop names with stored forecasts, for spotting them in chat messages.
+
+    Reloaded from price_forecasts at most every `ttl` seconds (and after
+    run_forecasts in this process).
+    """
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self.loaded_at = None
+        self.pattern = None
+        self.names = {}
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        if self.loaded_at is not None and time.monotonic() - self.loaded_at < self.ttl:
+            return
+        with self.lock:
+            if self.loaded_at is not None and time.monotonic() - self.loaded_at < self.ttl:
+                return
+            names = db.session.execute(db.select(PriceForecast.crop_name).distinct()).scalars()
+            self.names = {name.lower(): name for name in names}
+            # Longest names first so "green chilli" wins over "chilli"
+            alternatives = sorted(self.names, key=len, reverse=True)
+            self.pattern = re.compile(r'\b(' + '|'.join(map(re.escape, alternatives)) + r')\b',
+                                      re.IGNORECASE) if alternatives else None
+            self.loaded_at = time.monotonic()
+
+    def find(self, message):
+        """Crop names (as stored) mentioned in message, in order of appearance"""
+        self.refresh()
+        if self.pattern is None:
+            return []
+        found = [self.names[match.lower()] for match in self.pattern.findall(message or '')]
+        return list(dict.fromkeys(found))
+
+forecast_index = ForecastIndex()
+
+def describe_forecast(crop_name, location=None):
+    """One-paragraph summary of a crop's forecast for chat answers, or None.
+
+    Uses the forecast for location when there is one, else the average
+    over every location forecasting the crop.
+    """
+    table = PriceForecast.__table__
+    query = db.select(table.c.month, db.func.avg(table.c.price)).where(table.c.crop_name == crop_name)
+    place = 'all markets'
+    if location and db.session.execute(
+        db.select(table.c.id).where(table.c.crop_name == crop_name, table.c.location == location).limit(1)
+    ).first():
+        query = query.where(table.c.location == location)
+        place = location
+    points = db.session.execute(query.group_by(table.c.month).order_by(table.c.month)).all()
+    if not points:
+        return None
+
+    def label(month):
+        month = month if isinstance(month, date) else date.fromisoformat(month)
+        return f'{MONTH_NAMES[month.month - 1]} {month.year}'
+
+    best_month, best_price = max(points, key=lambda point: point[1])
+    outlook = ', '.join(f'{label(month)} ₹{price:,.0f}' for month, price in points)
+    return (f'{crop_name} price forecast ({place}): {outlook}. '
+            f'Best month to sell in this period: {label(best_month)} (about ₹{best_price:,.0f}).')
@@ -0,0 +1,85 @@
+import csv
+import math
+import os
+import re
+from functools import lru_cache
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+DISTRICTS_CSV = os.path.join(os.path.dirname(__file__), 'data', 'districts.csv')
+
+# Other spellings people type for places in districts.csv
+ALIASES = {
+    'bangalore': 'bengaluru', 'mysore': 'mysuru', 'belgaum': 'belagavi', 'hubli': 'dharwad',
+    'hubballi': 'dharwad', 'gulbarga': 'kalaburagi', 'shimoga': 'shivamogga',
+    'allahabad': 'prayagraj', 'gurgaon': 'gurugram', 'kochi': 'ernakulam', 'cochin': 'ernakulam',
+    'trivandrum': 'thiruvananthapuram', 'calicut': 'kozhikode', 'trichy': 'tiruchirappalli',
+    'vizag': 'visakhapatnam', 'burdwan': 'bardhaman', 'bhubaneswar': 'khordha',
+    'guwahati': 'kamrup', 'jamshedpur': 'east singhbhum', 'panaji': 'north goa',
+    'ganganagar': 'sri ganganagar', 'baroda': 'vadodara', 'ferozepur': 'firozpur',
+    'rudrapur': 'udham singh nagar', 'kakinada': 'east godavari', 'eluru': 'west godavari',
+    'palanpur': 'banaskantha', 'berhampur': 'ganjam', 'bombay': 'mumbai', 'madras': 'chennai',
+    'calcutta': 'kolkata', 'poona': 'pune', 'new delhi': 'delhi', 'pondicherry': 'puducherry',
+    'orissa': 'odisha', 'himachal': 'himachal pradesh', 'up': 'uttar pradesh',
+    'mp': 'madhya pradesh', 'j&k': 'jammu and kashmir', 'kashmir': 'jammu and kashmir',
+}
+
+def normalize_place(name):
+    """Lowercase, collapse spaces and drop a trailing 'district'/'dist.'"""
+    name = ' '.join(name.lower().split())
+    name = re.sub(r'\s+(district|dist\.?)$', '', name)
+    return ALIASES.get(name, name)
+
+def load_places(path=DISTRICTS_CSV):
+    """Read the shipped table into ({state: (lat, lon)}, {district: [(state, lat, lon)]})"""
+    states, districts = {}, {}
+    with open(path, encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            point = (float(row['latitude']), float(row['longitude']))
+            state = normalize_place(row['state'])
+            if row['district']:
+                districts.setdefault(normalize_place(row['district']), []).append((state,) + point)
+            else:
+                states[state] = point
+    return states, districts
+
+STATES, DISTRICTS = load_places()
+
+@lru_cache(maxsize=4096)
+def geocode(location):
+    """(lat, lon) for a free-text location like 'Ludhiana, Punjab' or 'Punjab'.
+
+    Resolves to the district when one is named (using the state to tell
+    apart districts that share a name), else to the state's centre.
+    Returns None for places the table doesn't know.
+    """
+    parts = [normalize_place(part) for part in re.split(r'[,/]', location or '') if part.strip()]
+    state = next((part for part in parts if part in STATES), None)
+    for part in parts:
+        matches = DISTRICTS.get(part)
+        if matches:
+            for match_state, lat, lon in matches:
+                if state is None or match_state == state:
+                    return lat, lon
+    if state is not None:
+        return STATES[state]
+    return None
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+def bounding_box(lat, lon, radius_km):
+    """(min_lat, max_lat, min_lon, max_lon) enclosing the circle"""
+    dlat = radius_km / KM_PER_DEGREE
+    dlon = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+    return lat - dlat, lat + dlat, lon - dlon, lon + dlon
+
+def parse_point(text):
+    """'lat,lon' -> (lat, lon); raises ValueError"""
+    lat, lon = (float(part) for part in text.split(','))
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError('Coordinates out of range')
+    return lat, lon
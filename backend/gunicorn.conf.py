@@ -0,0 +1,47 @@
+"""Gunicorn settings: gunicorn -c gunicorn.conf.py wsgi:app
+
+Every value can be overridden from the environment.
+"""
+import multiprocessing
+import os
+
+bind = os.getenv('BIND', f"0.0.0.0:{os.getenv('PORT', 5000)}")
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+# Threads let one worker overlap requests waiting on the LLM or the SQLite write lock
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+# Each open /api/events stream holds a gthread thread for up to EVENTS_MAX_AGE,
+# so gthread workers only accept threads // 2 streams each and answer the rest
+# with 503 (pages then poll). For live updates to many clients use
+# GUNICORN_WORKER_CLASS=gevent (pip install gevent), where a stream costs a greenlet.
+# Events are per worker process: a stream only sees writes its own worker made,
+# so set WEB_CONCURRENCY=1 where every client must see every change
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 0))
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-')
+loglevel = os.getenv('LOG_LEVEL', 'info').lower()
+
+def on_starting(server):
+    """Migrate and build the frontend once in the master, so workers don't race
+    each other doing it (forked workers inherit the loaded assets), pick a
+    response cache every worker sees the same invalidations in, and warn that
+    live updates don't cross workers"""
+    from app import app, assets, db, events, prepare_database, response_cache
+    prepare_database()
+    assets.load()
+    response_cache.share_between(server.cfg.workers)
+    events.check_workers(server.cfg.workers)
+    with app.app_context():
+        db.engine.dispose()
+
+def post_fork(server, worker):
+    """Workers must not share the master's pooled database connections, nor
+    let event streams occupy every request thread"""
+    from app import app, db, events
+    with app.app_context():
+        db.engine.dispose(close=False)
+    if server.cfg.worker_class_str == 'gthread':
+        events.limit_to_threads(server.cfg.threads)
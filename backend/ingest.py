@@ -0,0 +1,165 @@
+import csv
+import io
+import json
+import time
+from datetime import datetime
+from functools import lru_cache
+from sqlalchemy.dialects import postgresql, sqlite
+from models import db, Price, upsert_latest_prices, rebuild_price_rollups
+
+# Accepted spellings for each Price column, in order of preference.
+# Covers our own exports plus Agmarknet / data.gov.in daily price dumps.
+COLUMN_ALIASES = {
+    'crop_name': ('crop_name', 'commodity', 'crop'),
+    'location': ('location', 'market', 'district', 'state'),
+    'price': ('price', 'modal_price', 'max_price', 'min_price'),
+    'date': ('date', 'arrival_date', 'price_date'),
+    'source': ('source',),
+}
+
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S')
+
+def normalize_key(key):
+    """'Modal_x0020_Price' / 'Modal Price' -> 'modal_price'"""
+    return key.strip().lower().replace('_x0020_', '_').replace(' ', '_')
+
+@lru_cache(maxsize=256)
+def resolve_columns(keys):
+    """Map each Price column to the raw record keys that can supply it.
+
+    Cached per key tuple: every row of a CSV file, and nearly every line of
+    a JSONL dump, shares the same keys.
+    """
+    normalized = {normalize_key(k): k for k in keys if k}
+    return {
+        column: tuple(normalized[alias] for alias in aliases if alias in normalized)
+        for column, aliases in COLUMN_ALIASES.items()
+    }
+
+@lru_cache(maxsize=65536)
+def parse_date(value):
+    # Price dumps repeat the same few dates across thousands of rows
+    value = value.strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    return datetime.fromisoformat(value)
+
+def pick(record, keys):
+    for key in keys:
+        value = record.get(key)
+        if value not in (None, ''):
+            return value
+    return None
+
+def to_price_row(record, default_source):
+    """Map one raw record to a Price row dict, or None if it is unusable"""
+    columns = resolve_columns(tuple(record))
+    crop_name = pick(record, columns['crop_name'])
+    location = pick(record, columns['location'])
+    price = pick(record, columns['price'])
+    date = pick(record, columns['date'])
+    if not (crop_name and location and price is not None and date):
+        return None
+    try:
+        return {
+            'crop_name': str(crop_name).strip(),
+            'location': str(location).strip(),
+            'price': float(price),
+            'date': parse_date(str(date)),
+            'source': pick(record, columns['source']) or default_source,
+        }
+    except (TypeError, ValueError):
+        return None
+
+def iter_records(stream, fmt):
+    """Yield raw dict records from a text stream, one line at a time"""
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+    elif fmt == 'jsonl':
+        for line in stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                yield {}
+    else:
+        raise ValueError(f'Unsupported format: {fmt}')
+
+def detect_format(filename):
+    if filename and filename.lower().endswith(('.jsonl', '.ndjson', '.json')):
+        return 'jsonl'
+    return 'csv'
+
+def upsert_prices(connection, rows):
+    """Insert a batch of price rows, replacing any existing (crop_name, location, date)"""
+    dialect = postgresql if connection.dialect.name == 'postgresql' else sqlite
+    table = Price.__table__
+    stmt = dialect.insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.crop_name, table.c.location, table.c.date],
+        set_={'price': stmt.excluded.price, 'source': stmt.excluded.source}
+    )
+    connection.execute(stmt, rows)
+
+def ingest_price_stream(stream, fmt='csv', source='agmarknet', batch_size=5000, on_latest=None):
+    """Stream-ingest a CSV/JSONL price dump into the prices table.
+
+    Rows are upserted in batches of batch_size, one transaction per batch,
+    so memory use does not grow with the size of the file. The newest row
+    per (crop_name, location) is tracked as we go and folded into the
+    latest_prices snapshot once at the end, and the week/month rollups
+    covering the file's date range are recomputed. on_latest, if given, is
+    called with those newest rows once they are saved. Returns a report
+    with row counts and throughput.
+    """
+    if not isinstance(stream, io.TextIOBase):
+        stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+    started = time.perf_counter()
+    loaded = skipped = 0
+    batch = {}
+    latest = {}
+    first_date = None
+
+    def flush():
+        with db.engine.begin() as connection:
+            upsert_prices(connection, list(batch.values()))
+        batch.clear()
+
+    for record in iter_records(stream, fmt):
+        row = to_price_row(record, source) if isinstance(record, dict) else None
+        if row is None:
+            skipped += 1
+            continue
+        # Later rows for the same key win, matching what the upsert would do
+        batch[(row['crop_name'], row['location'], row['date'])] = row
+        if first_date is None or row['date'] < first_date:
+            first_date = row['date']
+        key = (row['crop_name'], row['location'])
+        if key not in latest or row['date'] >= latest[key]['date']:
+            latest[key] = row
+        loaded += 1
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    if latest:
+        dates = [row['date'] for row in latest.values()]
+        with db.engine.begin() as connection:
+            upsert_latest_prices(connection, list(latest.values()))
+            rebuild_price_rollups(connection, first_date, max(dates))
+        if on_latest is not None:
+            on_latest(list(latest.values()))
+
+    elapsed = time.perf_counter() - started
+    return {
+        'rows': loaded,
+        'skipped': skipped,
+        'seconds': round(elapsed, 3),
+        'rows_per_sec': round(loaded / elapsed) if elapsed else loaded,
+    }
@@ -0,0 +1,164 @@
+import re
+import time
+from config import Config
+
+# Keyword groups the intents are built from, per language code in
+# Config.LANGUAGES. Keywords match at the start of a word ("farm" matches
+# "farmer" but "rate" no longer matches "moderate"), case-insensitively.
+# Hindi covers Devanagari and the common romanized spellings. 'mandi' is
+# left out: it is in the app's own name, so "what is Kisan Mandi" would read
+# as a price question.
+KEYWORDS = {
+    'en': {
+        'selling': ['sell', 'price', 'market', 'best time', 'when', 'weather'],
+        'weather': ['weather', 'rain', 'season', 'monsoon', 'summer', 'winter'],
+        'price': ['price', 'rate', 'market', 'profit'],
+        'farming': ['plant', 'grow', 'farm', 'crop', 'seed', 'soil', 'fertilizer'],
+        'marketplace': ['sell', 'list', 'buyer', 'marketplace', 'trade'],
+        'cost': ['price', 'rate', 'cost', 'expensive', 'cheap'],
+    },
+    'hi': {
+        'selling': ['bech', 'daam', 'bhav', 'kab', 'mausam',
+                    'बेच', 'कीमत', 'दाम', 'भाव', 'बाजार', 'कब', 'मौसम'],
+        'weather': ['mausam', 'barish', 'baarish', 'garmi', 'sardi',
+                    'मौसम', 'बारिश', 'मानसून', 'गर्मी', 'सर्दी'],
+        'price': ['daam', 'bhav', 'munafa',
+                  'कीमत', 'दाम', 'भाव', 'बाजार', 'मुनाफा'],
+        'farming': ['kheti', 'fasal', 'beej', 'mitti', 'khad', 'ugana',
+                    'खेती', 'फसल', 'बीज', 'मिट्टी', 'खाद', 'उर्वरक', 'उगा'],
+        'marketplace': ['bech', 'kharidar', 'vyapar',
+                        'बेच', 'खरीदार', 'व्यापार'],
+        'cost': ['daam', 'bhav', 'keemat', 'kimat', 'lagat', 'sasta', 'mehnga', 'mahanga',
+                 'कीमत', 'दाम', 'भाव', 'लागत', 'सस्ता', 'महंगा'],
+    },
+}
+
+def keyword_groups(languages):
+    """Merge the keyword tables of the given languages into one group -> keywords map"""
+    groups = {}
+    for language in languages:
+        for group, keywords in KEYWORDS.get(language, {}).items():
+            groups.setdefault(group, []).extend(keywords)
+    return groups
+
+# (intent, keyword groups that must all be present, priority). The highest
+# priority satisfied intent wins; ties go to the one with more keyword hits.
+INTENTS = [
+    ('sell_timing', ('selling', 'weather', 'price'), 50),
+    ('weather_selling', ('selling', 'weather'), 40),
+    ('best_prices', ('selling', 'price'), 30),
+    ('farming', ('farming',), 20),
+    ('marketplace', ('marketplace',), 10),
+    ('prices', ('cost',), 5),
+]
+
+DEFAULT_INTENT = 'greeting'
+
+FALLBACK_RESPONSES = {
+    'sell_timing': " To decide when to sell your crop:\n\n1. **Monitor Weather**: Check monsoon timings, rainfall patterns, and temperature forecasts. Good harvest weather = better quality = higher prices.\n\n2. **Check Market Prices**: Use our Prices section to track commodity rates. Sell when prices are high.\n\n3. **Timing Strategy**: Name your crop (e.g. \"when should I sell wheat?\") and I'll show its price forecast for the coming months from recent mandi prices.\n\n4. **Use Kisan Mandi**: List your crops when prices are favorable and weather is stable.\n\nWould you like specific advice for a particular crop?",
+    'weather_selling': " **Weather & Crop Selling**:\n\nGood weather conditions = Better crop quality = Higher market value\n\nCheck our Prices page to see current market rates and list your crops when conditions are optimal. Use the Marketplace to connect directly with buyers!",
+    'best_prices': " **Getting Best Prices**:\n\n1. Visit our Prices page to check current market rates\n2. Harvest crops when market demand is high\n3. List on our marketplace with your best price\n4. Direct buyer connection = No middlemen cost\n\nWhat crop are you planning to sell?",
+    'farming': " **Farming & Crop Advice**:\n\nFor best results:\n\n1. **Soil Preparation**: Test soil pH before planting\n2. **Organic Methods**: Use natural fertilizers (compost, vermicompost)\n3. **Water Management**: Proper irrigation based on weather and crop type\n4. **Pest Control**: Use integrated pest management techniques\n5. **Timing**: Plant according to your region's crop season\n\nWhich crop would you like guidance on? (Wheat, Rice, Cotton, etc.)",
+    'marketplace': " **Selling on Kisan Mandi Marketplace**:\n\n1. **Create Listing**: Add crop details, quantity, quality grade\n2. **Upload Photos**: Show your produce clearly\n3. **Set Your Price**: You control pricing - no middlemen\n4. **Connect with Buyers**: Buyers browse and contact directly\n5. **Payment**: Secure payment through our platform\n\nReady to list your crops? Go to Marketplace → Add New Listing!",
+    'prices': " **Current Market Prices**:\n\nVisit our Prices page to see live commodity rates for:\n- Wheat\n- Rice\n- Cotton\n- Sugarcane\n- Tomato\n- And more!\n\nPrices vary by location and season. Check regularly to time your sales optimally!",
+    'greeting': " I'm your Kisan Mandi Agricultural Advisor! I can help you with:\n\n **Selling Tips**: When & how to sell crops for best prices\n🌾 **Farming Advice**: Crop growing, soil care, pest management\n💰 **Market Prices**: Current rates for all crops\n🏪 **Marketplace Guide**: How to use our platform\n🌤️ **Weather Impact**: How weather affects crop price & quality\n\nWhat would you like to know?",
+}
+
+# Characters that count as part of a word, including Devanagari vowel signs
+# (which str.isalnum() and therefore \w do not cover)
+WORD_CHARS = r'\wऀ-ॿ'
+
+def trie_pattern(words):
+    """Build a regex alternation shaped like a prefix trie.
+
+    re tries alternatives one by one, so a flat 'a|b|c|...' costs more with
+    every keyword added; factoring common prefixes means each position in
+    the message only walks the branch matching its next character.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def render(node):
+        end = '' in node
+        branches = [re.escape(char) + render(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if end:
+            body = '(?:' + body + ')?'
+        return body
+
+    return render(trie)
+
+class IntentMatcher:
+    """Classifies a message into an intent with one compiled regex pass.
+
+    All keywords from every group are compiled into a single trie-shaped
+    pattern anchored at word starts; each hit is mapped back to its groups
+    through a dict, and only intents that need one of the groups hit are
+    scored, so the cost tracks the message rather than the intent table.
+    """
+
+    def __init__(self, groups, intents=INTENTS, default=DEFAULT_INTENT):
+        self.groups_by_keyword = {}
+        for group, keywords in groups.items():
+            for keyword in keywords:
+                self.groups_by_keyword.setdefault(keyword.casefold(), set()).add(group)
+        self.pattern = re.compile(
+            rf'(?<![{WORD_CHARS}])' + trie_pattern(self.groups_by_keyword),
+            re.IGNORECASE
+        )
+        self.intents_by_group = {}
+        for intent in intents:
+            for group in intent[1]:
+                self.intents_by_group.setdefault(group, []).append(intent)
+        self.default = default
+
+    def match_groups(self, message):
+        """Count keyword hits per group"""
+        hits = {}
+        for match in self.pattern.finditer(message or ''):
+            # re.IGNORECASE also matches characters whose lowercase differs from the
+            # keyword's (e.g. 'ſ' for 's'); casefold maps most back, .get skips the rest
+            for group in self.groups_by_keyword.get(match.group(0).casefold(), ()):
+                hits[group] = hits.get(group, 0) + 1
+        return hits
+
+    def classify(self, message):
+        hits = self.match_groups(message)
+        best, best_score = self.default, None
+        for group in hits:
+            for name, required, priority in self.intents_by_group.get(group, ()):
+                if all(g in hits for g in required):
+                    score = (priority, sum(hits[g] for g in required))
+                    if best_score is None or score > best_score:
+                        best, best_score = name, score
+        return best
+
+intent_matcher = IntentMatcher(keyword_groups(Config.LANGUAGES))
+
+def benchmark(messages=10000, sizes=(6, 60, 600, 6000)):
+    """Per-message classify() cost as the number of intents grows"""
+    sample = ['When is the best time to sell wheat before the monsoon?', 'how do I grow tomatoes',
+              'kya rate hai aaj', 'गेहूं का भाव क्या है', 'hello there']
+    results = {}
+    for size in sizes:
+        groups = keyword_groups(Config.LANGUAGES)
+        intents = list(INTENTS)
+        for i in range(size - len(INTENTS)):
+            groups[f'synthetic{i}'] = [f'kw{i}x{j}' for j in range(5)]
+            intents.append((f'synthetic{i}', (f'synthetic{i}',), 1))
+        matcher = IntentMatcher(groups, intents)
+        started = time.perf_counter()
+        for i in range(messages):
+            matcher.classify(sample[i % len(sample)])
+        results[size] = (time.perf_counter() - started) / messages * 1e6
+    return results
+
+if __name__ == '__main__':
+    for size, micros in benchmark().items():
+        print(f'{size:>6} intents: {micros:.1f} us/message')
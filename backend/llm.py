@@ -0,0 +1,228 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+import openai
+
+# Context-aware system prompts, keyed by chat message type
+SYSTEM_PROMPTS = {
+    'agronomy': 'You are an expert agricultural advisor for Indian farmers. Provide practical farming advice considering Indian climate and crops. Keep responses concise and actionable.',
+    'marketplace': 'You are a helpful guide for an agricultural marketplace platform. Help users understand how to buy and sell crops, pricing, and platform features.',
+    'general': 'You are a helpful agricultural assistant for farmers in India. You can answer questions about farming practices, crop prices, market trends, and our Kisan Mandi platform. Keep responses concise and practical.'
+}
+
+class LLMUnavailable(Exception):
+    """The LLM could not answer in time; callers should use the fallback"""
+
+class LLMAuthError(Exception):
+    """The configured API key was rejected"""
+
+def classify_error(error):
+    """Map an OpenAI client error onto LLMAuthError / LLMUnavailable"""
+    error_str = str(error)
+    if (isinstance(error, openai.error.AuthenticationError)
+            or 'Authentication' in error_str or 'unauthorized' in error_str or 'api_key' in error_str):
+        return LLMAuthError(error_str)
+    return LLMUnavailable(error_str)
+
+def extract_content(response):
+    """Pull the reply text out of a ChatCompletion response"""
+    try:
+        return dict(response)['choices'][0]['message']['content'].strip()  # type: ignore
+    except (KeyError, IndexError, TypeError, ValueError):
+        try:
+            return response['choices'][0]['message']['content'].strip()  # type: ignore
+        except Exception:
+            raise LLMUnavailable('Malformed response')
+
+class CircuitBreaker:
+    """Stops calling a failing upstream for reset_timeout seconds.
+
+    Opens after `threshold` consecutive failures; once the timeout has
+    passed a single trial call is let through (half-open) and its outcome
+    decides whether the circuit closes again.
+    """
+
+    def __init__(self, threshold=5, reset_timeout=30):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        with self.lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.opened_at is not None or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+    def record_neutral(self):
+        """End a call that says nothing about upstream health (a rejected
+        key, a caller hanging up) so a half-open circuit can try again"""
+        with self.lock:
+            self.trial_running = False
+
+class LLMClient:
+    """Runs OpenAI chat calls on a bounded worker pool.
+
+    Request threads wait at most `timeout` seconds for an answer. When every
+    slot is busy, or the circuit breaker is open, calls fail immediately
+    with LLMUnavailable so the caller can answer from the fallback instead
+    of queueing behind a slow upstream.
+    """
+
+    def __init__(self, app=None):
+        self.executor = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.api_key = app.config['OPENAI_API_KEY']
+        self.model = app.config.get('LLM_MODEL', 'gpt-3.5-turbo')
+        self.timeout = app.config.get('LLM_TIMEOUT', 15)
+        max_concurrency = app.config.get('LLM_MAX_CONCURRENCY', 8)
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='llm')
+        self.breaker = CircuitBreaker(app.config.get('LLM_BREAKER_THRESHOLD', 5),
+                                      app.config.get('LLM_BREAKER_RESET', 30))
+
+    @property
+    def enabled(self):
+        return bool(self.api_key)
+
+    def build_messages(self, message, message_type, context=None):
+        """context: facts from our own data (e.g. price forecasts) the answer should use"""
+        messages = [{"role": "system", "content": SYSTEM_PROMPTS.get(message_type, SYSTEM_PROMPTS['general'])}]
+        if context:
+            messages.append({"role": "system", "content": "Kisan Mandi data relevant to this question:\n" + context})
+        messages.append({"role": "user", "content": message})
+        return messages
+
+    def create(self, messages, **kwargs):
+        return openai.ChatCompletion.create(
+            model=self.model,
+            messages=messages,
+            temperature=0.7,
+            max_tokens=500,
+            request_timeout=self.timeout,
+            **kwargs
+        )
+
+    def submit(self, fn, *args):
+        """Run fn on the pool, or raise LLMUnavailable if it can't take more work"""
+        if not self.breaker.allow():
+            raise LLMUnavailable('Circuit open')
+        if not self.slots.acquire(blocking=False):
+            self.breaker.record_neutral()
+            raise LLMUnavailable('All LLM slots busy')
+        try:
+            future = self.executor.submit(fn, *args)
+        except RuntimeError:
+            self.slots.release()
+            self.breaker.record_neutral()
+            raise LLMUnavailable('Executor shut down')
+        # Free the slot when the upstream call really ends, not when we stop waiting
+        future.add_done_callback(lambda f: self.slots.release())
+        return future
+
+    def complete(self, message, message_type='general', context=None):
+        """Return the model's reply, raising LLMUnavailable or LLMAuthError"""
+        future = self.submit(self.create, self.build_messages(message, message_type, context))
+        # Every path settles the breaker, so a half-open trial is never left running
+        outcome = self.breaker.record_neutral
+        try:
+            response = future.result(timeout=self.timeout)
+            bot_response = extract_content(response)
+            outcome = self.breaker.record_success
+            return bot_response
+        except FutureTimeout:
+            outcome = self.breaker.record_failure
+            raise LLMUnavailable('Timed out')
+        except LLMUnavailable:
+            outcome = self.breaker.record_failure
+            raise
+        except Exception as e:
+            error = classify_error(e)
+            if isinstance(error, LLMUnavailable):
+                outcome = self.breaker.record_failure
+            raise error
+        finally:
+            outcome()
+
+    def stream(self, message, message_type='general', context=None):
+        """Yield reply fragments as they arrive.
+
+        Raises LLMUnavailable/LLMAuthError if nothing could be produced; if the
+        upstream stalls for longer than the timeout mid-answer the stream just
+        ends with what was received.
+        """
+        chunks = queue.Queue()
+        done = object()
+
+        def worker(messages):
+            try:
+                for chunk in self.create(messages, stream=True):
+                    delta = chunk['choices'][0].get('delta', {}).get('content')
+                    if delta:
+                        chunks.put(delta)
+            except Exception as e:
+                chunks.put(e)
+            finally:
+                chunks.put(done)
+
+        self.submit(worker, self.build_messages(message, message_type, context))
+        # Settled in finally, which also runs when the caller closes the
+        # generator (GeneratorExit) mid-answer
+        outcome = self.breaker.record_neutral
+        received = False
+        try:
+            while True:
+                try:
+                    item = chunks.get(timeout=self.timeout)
+                except queue.Empty:
+                    outcome = self.breaker.record_failure
+                    if received:
+                        return
+                    raise LLMUnavailable('Timed out')
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    error = classify_error(item)
+                    if isinstance(error, LLMUnavailable):
+                        outcome = self.breaker.record_failure
+                    if received:
+                        return
+                    raise error
+                # The upstream is answering; a caller hanging up now doesn't count against it
+                received = True
+                outcome = self.breaker.record_success
+                yield item
+            outcome = self.breaker.record_success
+        finally:
+            outcome()
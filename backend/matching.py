@@ -0,0 +1,345 @@
+import heapq
+import itertools
+import threading
+import time
+from datetime import datetime
+from models import db, Crop, BuyOrder, Transaction
+
+EPSILON = 1e-9  # quantities are floats; less than this left over counts as nothing
+RETRIES = 3  # re-plans of one sweep after finding a listing or order changed underneath it
+
+# Statements are built once and run with executemany: a sweep costs the same
+# three round trips however many trades it makes
+crops = Crop.__table__
+orders = BuyOrder.__table__
+# decrement_stock() for many listings, which must also still be on offer at the matched price
+TAKE_STOCK = crops.update().where(
+    crops.c.id == db.bindparam('listing_id'),
+    crops.c.status == 'available',
+    crops.c.price_per_unit == db.bindparam('price'),
+    crops.c.quantity >= db.bindparam('taken'),
+).values(
+    quantity=crops.c.quantity - db.bindparam('taken'),
+    status=db.case((crops.c.quantity - db.bindparam('taken') <= EPSILON, 'sold'), else_=crops.c.status),
+)
+FILL_ORDER = orders.update().where(
+    orders.c.id == db.bindparam('order_id'),
+    orders.c.status == 'open',
+    orders.c.quantity - orders.c.filled >= db.bindparam('taken') - EPSILON,
+).values(
+    filled=orders.c.filled + db.bindparam('taken'),
+    status=db.case((orders.c.filled + db.bindparam('taken') >= orders.c.quantity - EPSILON, 'filled'),
+                   else_=orders.c.status),
+)
+NEW_ORDER = orders.insert().returning(orders.c.id)
+NEW_TRANSACTIONS = Transaction.__table__.insert().returning(Transaction.__table__.c.id,
+                                                            sort_by_parameter_order=True)
+
+def execute_all(connection, statement, params):
+    """Run statement once per params dict; returns the rows changed in total"""
+    if not params:
+        return 0
+    if connection.dialect.supports_sane_multi_rowcount:
+        return connection.execute(statement, params).rowcount
+    return sum(connection.execute(statement, row).rowcount for row in params)
+
+def book_key(value):
+    return (value or '').strip().lower()
+
+class Resting:
+    """A listing (ask) or open buy order (bid) waiting in a book.
+
+    price is the listing's price or the order's max price; version changes
+    whenever the entry is replaced, so heap entries of older versions are
+    recognised as stale and skipped.
+    """
+    __slots__ = ('id', 'owner_id', 'crop', 'location', 'price', 'quantity', 'version')
+
+    def __init__(self, id, owner_id, crop, location, price, quantity, version):
+        self.id = id
+        self.owner_id = owner_id
+        self.crop = book_key(crop)
+        self.location = book_key(location)
+        self.price = price
+        self.quantity = quantity
+        self.version = version
+
+class MatchingEngine:
+    """Price-time matching of buyers' demand orders against available listings.
+
+    Every (crop, location) has two books in memory: listings in a heap by
+    (price, id) and open buy orders by (-max price, id), so the best
+    counterparty is always on top. A new order takes the cheapest listings
+    it can afford; a new or changed listing fills the highest bids at or
+    above its price. Orders without a location match listings anywhere.
+    Trades happen at the listing's price, and each sweep commits as one
+    database transaction: conditional stock decrements, order fills and
+    the new Transaction rows land together or not at all.
+
+    The books are per process and rebuilt from the database every
+    MATCHING_RELOAD seconds (which also drops heap entries made stale by
+    edits). Only open orders are loaded up front, with the listings of the
+    crops they bid on; a crop nobody bids on has its listings loaded when
+    the first order for it arrives. The database stays the source of truth: an entry another
+    worker changed fails its conditional UPDATE, is reloaded and the sweep
+    re-planned, so listings are never oversold nor orders overfilled.
+    """
+
+    def __init__(self, app=None):
+        self.lock = threading.Lock()
+        self.versions = itertools.count(1)
+        self.loaded_at = None
+        self.ttl = 60
+        self.clear()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.get('MATCHING_RELOAD', 60)
+
+    def clear(self):
+        self.listings, self.orders = {}, {}
+        self.asks, self.bids = {}, {}  # crop -> location -> heap; '' in bids = any location
+        self.loaded_crops = set()  # crops whose available listings are all in asks
+
+    # ==================== BOOKS ====================
+    @staticmethod
+    def listing_rows(*conditions):
+        return db.session.execute(
+            db.select(Crop.id, Crop.farmer_id, Crop.crop_name, Crop.location, Crop.price_per_unit, Crop.quantity)
+            .where(Crop.status == 'available', Crop.quantity > EPSILON, Crop.price_per_unit > 0, *conditions)
+        )
+
+    @staticmethod
+    def order_rows(*conditions):
+        return db.session.execute(
+            db.select(BuyOrder.id, BuyOrder.buyer_id, BuyOrder.crop_name, BuyOrder.location,
+                      BuyOrder.max_price, BuyOrder.quantity - BuyOrder.filled)
+            .where(BuyOrder.status == 'open', *conditions)
+        )
+
+    def refresh(self):
+        if self.loaded_at is not None and time.monotonic() - self.loaded_at < self.ttl:
+            return
+        self.clear()
+        for row in self.order_rows():
+            self.add_order(Resting(*row, next(self.versions)))
+        self.load_asks(self.bids)
+        self.loaded_at = time.monotonic()
+
+    def load_asks(self, crops):
+        """Load the available listings of those crops (book keys) not loaded yet"""
+        crops = [crop for crop in crops if crop not in self.loaded_crops]
+        for start in range(0, len(crops), 500):  # stay under SQLite's bound-parameter limit
+            chunk = crops[start:start + 500]
+            for row in self.listing_rows(db.func.lower(db.func.trim(Crop.crop_name)).in_(chunk)):
+                self.add_listing(Resting(*row, next(self.versions)))
+            self.loaded_crops.update(chunk)
+
+    def add_listing(self, listing):
+        self.listings[listing.id] = listing
+        heap = self.asks.setdefault(listing.crop, {}).setdefault(listing.location, [])
+        heapq.heappush(heap, (listing.price, listing.id, listing.version))
+
+    def add_order(self, order):
+        self.orders[order.id] = order
+        heap = self.bids.setdefault(order.crop, {}).setdefault(order.location, [])
+        heapq.heappush(heap, (-order.price, order.id, order.version))
+
+    def ask_heaps(self, order):
+        books = self.asks.get(order.crop, {})
+        if order.location:
+            return [books[order.location]] if order.location in books else []
+        return list(books.values())
+
+    def bid_heaps(self, listing):
+        books = self.bids.get(listing.crop, {})
+        locations = {listing.location, ''}
+        return [books[location] for location in locations if location in books]
+
+    def reload_listings(self, crop_ids):
+        """Replace listings' entries with their current database rows, dropping
+        those no longer available"""
+        ids = list(crop_ids)
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            for crop_id in chunk:
+                self.listings.pop(crop_id, None)
+            for row in self.listing_rows(Crop.id.in_(chunk)):
+                self.add_listing(Resting(*row, next(self.versions)))
+
+    def reload_orders(self, order_ids):
+        ids = list(order_ids)
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            for order_id in chunk:
+                self.orders.pop(order_id, None)
+            for row in self.order_rows(BuyOrder.id.in_(chunk)):
+                self.add_order(Resting(*row, next(self.versions)))
+
+    # ==================== MATCHING ====================
+    @staticmethod
+    def sweep(heaps, table, crosses, quantity):
+        """Pop the best live entries across heaps while crosses(their sort key).
+
+        Returns [(heap, entry, resting, quantity taken)]; nothing is changed
+        until apply(), and restore() puts the entries back.
+        """
+        fills = []
+        while quantity > EPSILON:
+            best = None
+            for heap in heaps:
+                while heap:
+                    resting = table.get(heap[0][1])
+                    if resting is not None and resting.version == heap[0][2]:
+                        break
+                    heapq.heappop(heap)
+                if heap and (best is None or heap[0] < best[0]):
+                    best = heap
+            if best is None or not crosses(best[0][0]):
+                break
+            entry = heapq.heappop(best)
+            resting = table[entry[1]]
+            taken = min(quantity, resting.quantity)
+            fills.append((best, entry, resting, taken))
+            quantity -= taken
+        return fills
+
+    @staticmethod
+    def restore(fills):
+        for heap, entry, _, _ in fills:
+            heapq.heappush(heap, entry)
+
+    @staticmethod
+    def apply(fills, table):
+        for heap, entry, resting, taken in fills:
+            resting.quantity -= taken
+            if resting.quantity > EPSILON:
+                heapq.heappush(heap, entry)
+            elif table.get(resting.id) is resting:
+                del table[resting.id]
+
+    def persist(self, trades, new_order=None):
+        """Write [(bid, ask, quantity)] in the current session.
+
+        new_order is (bid, row) for an order placed by this sweep: its row is
+        inserted already filled, and bid gets the new id. Returns (None,
+        trade dicts), or (kind, ids) of the listings or orders when one of
+        their rows no longer allows its trade; the caller rolls back.
+        """
+        connection = db.session.connection()
+        by_listing, by_order = {}, {}
+        for bid, ask, quantity in trades:
+            by_listing[ask] = by_listing.get(ask, 0) + quantity
+            by_order[bid] = by_order.get(bid, 0) + quantity
+        if new_order is not None:
+            bid, row = new_order
+            filled = by_order.pop(bid, 0)
+            bid.id = connection.execute(NEW_ORDER, dict(
+                row, filled=filled, status='filled' if filled >= row['quantity'] - EPSILON else 'open'
+            )).scalar_one()
+        taken = [{'listing_id': ask.id, 'price': ask.price, 'taken': quantity} for ask, quantity in by_listing.items()]
+        if execute_all(connection, TAKE_STOCK, taken) != len(taken):
+            return 'listing', [ask.id for ask in by_listing]
+        filled = [{'order_id': bid.id, 'taken': quantity} for bid, quantity in by_order.items()]
+        if execute_all(connection, FILL_ORDER, filled) != len(filled):
+            return 'order', [bid.id for bid in by_order]
+        if not trades:
+            return None, []
+
+        now = datetime.utcnow()
+        rows = [{
+            'buyer_id': bid.owner_id, 'crop_id': ask.id, 'buy_order_id': bid.id,
+            'quantity': quantity, 'total_price': quantity * ask.price,
+            # Posting the order is the buyer's agreement to buy at up to its max price
+            'payment_status': 'pending', 'delivery_status': 'pending', 'agreement_accepted': True,
+            'stock_held': True, 'created_at': now, 'updated_at': now,
+        } for bid, ask, quantity in trades]
+        ids = connection.execute(NEW_TRANSACTIONS, rows).scalars().all()
+        return None, [{
+            'transaction_id': transaction_id, 'buy_order_id': row['buy_order_id'], 'crop_id': row['crop_id'],
+            'quantity': row['quantity'], 'price': ask.price, 'total_price': row['total_price'],
+        } for transaction_id, row, (_, ask, _) in zip(ids, rows, trades)]
+
+    def commit(self, trades, fills, new_order=None):
+        """Persist and commit trades; when a row was stale roll back, reload
+        the rows involved and return their (kind, ids) so the caller can re-plan"""
+        try:
+            stale, made = self.persist(trades, new_order) if trades or new_order else (None, [])
+        except Exception:
+            db.session.rollback()
+            self.restore(fills)
+            raise
+        if stale is None:
+            db.session.commit()
+            return None, made
+        db.session.rollback()
+        self.restore(fills)
+        if stale == 'listing':
+            self.reload_listings(made)
+        else:
+            self.reload_orders(made)
+        return (stale, made), []
+
+    def place(self, buyer_id, crop_name, location, quantity, max_price):
+        """Record a buy order and fill what it can from the book right away.
+
+        Returns (order id, trades); any unfilled remainder rests in the book
+        until a listing at or below max_price shows up.
+        """
+        with self.lock:
+            self.refresh()
+            self.load_asks([book_key(crop_name)])
+            row = {'buyer_id': buyer_id, 'crop_name': crop_name, 'location': location or None,
+                   'quantity': quantity, 'max_price': max_price}
+            for attempt in range(RETRIES + 1):
+                bid = Resting(None, buyer_id, crop_name, location, max_price, quantity, next(self.versions))
+                # The last attempt gives up matching and just records the order
+                fills = self.sweep(self.ask_heaps(bid), self.listings,
+                                   lambda price: price <= max_price, quantity) if attempt < RETRIES else []
+                stale, trades = self.commit([(bid, ask, taken) for _, _, ask, taken in fills], fills, (bid, row))
+                if stale is None:
+                    break
+            self.apply(fills, self.listings)
+            bid.quantity -= sum(taken for *_, taken in fills)
+            if bid.quantity > EPSILON:
+                self.add_order(bid)
+            return bid.id, trades
+
+    def update_listings(self, crop_ids):
+        """Re-read listings after they were created or changed and fill
+        resting orders they now satisfy. Returns the trades made."""
+        trades = []
+        with self.lock:
+            self.refresh()
+            self.reload_listings(crop_ids)
+            for crop_id in crop_ids:
+                for attempt in range(RETRIES):
+                    listing = self.listings.get(crop_id)
+                    if listing is None:
+                        break
+                    fills = self.sweep(self.bid_heaps(listing), self.orders,
+                                       lambda key: -key >= listing.price, listing.quantity)
+                    if not fills:
+                        break
+                    stale, made = self.commit([(bid, listing, taken) for _, _, bid, taken in fills], fills)
+                    if stale is None:
+                        self.apply(fills, self.orders)
+                        listing.quantity -= sum(taken for *_, taken in fills)
+                        if listing.quantity <= EPSILON:
+                            del self.listings[listing.id]
+                        trades.extend(made)
+                        break
+        return trades
+
+    def remove_listings(self, crop_ids):
+        with self.lock:
+            for crop_id in crop_ids:
+                self.listings.pop(crop_id, None)
+
+    def cancel(self, order_id):
+        with self.lock:
+            self.orders.pop(order_id, None)
+
+    def stats(self):
+        return {'listings': len(self.listings), 'open_orders': len(self.orders)}
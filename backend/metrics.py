@@ -0,0 +1,150 @@
+import bisect
+import threading
+import time
+from flask import g, has_request_context, request
+from sqlalchemy.engine import Engine
+from models import db
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(labels):
+    """(('route', '/api/x'), ...) -> {route="/api/x",...}"""
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in labels) + '}'
+
+class Histogram:
+    """Cumulative-bucket histogram per label set, Prometheus style"""
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for labels, (counts, total) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{format_labels(labels + (("le", bound),))} {cumulative}')
+            lines.append(f'{self.name}_sum{format_labels(labels)} {total}')
+            lines.append(f'{self.name}_count{format_labels(labels)} {cumulative}')
+        return lines
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.series = {}
+
+    def inc(self, labels, amount=1):
+        self.series[labels] = self.series.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        lines.extend(f'{self.name}{format_labels(labels)} {value}' for labels, value in sorted(self.series.items()))
+        return lines
+
+class Metrics:
+    """Per-request timing and SQL accounting, rendered in Prometheus text format.
+
+    Every request records its latency by route, the number of SQL
+    statements it ran and the time spent in them. When SLOW_REQUEST_MS is
+    set, requests slower than that are logged with their SQL statements.
+    Figures are per process; scrape each worker separately.
+    """
+
+    def __init__(self, app=None):
+        self.lock = threading.Lock()
+        self.gauges = []
+        self.requests = Counter('kisan_http_requests_total', 'HTTP requests by route and status.')
+        self.latency = Histogram('kisan_http_request_duration_seconds', 'Time to build the response.', LATENCY_BUCKETS)
+        self.queries = Histogram('kisan_db_queries_per_request', 'SQL statements run per request.', QUERY_BUCKETS)
+        self.db_time = Counter('kisan_db_seconds_total', 'Time spent executing SQL, by route.')
+        self.llm_latency = Histogram('kisan_llm_request_duration_seconds', 'LLM call latency by source.', LATENCY_BUCKETS)
+        self.llm_requests = Counter('kisan_llm_requests_total',
+                                    'Chat answers by source: llm, cache, fallback or auth_error.')
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.slow_ms = app.config.get('SLOW_REQUEST_MS', 0)
+        self.max_statements = app.config.get('SLOW_REQUEST_MAX_STATEMENTS', 50)
+        app.before_request(self.start_request)
+        app.after_request(self.end_request)
+        db.event.listen(Engine, 'before_cursor_execute', self.before_execute)
+        db.event.listen(Engine, 'after_cursor_execute', self.after_execute)
+
+    def add_gauge(self, name, help_text, fn):
+        """Expose the number fn() returns on each scrape"""
+        self.gauges.append((name, help_text, fn))
+
+    def start_request(self):
+        g.metrics_start = time.perf_counter()
+        g.sql_count = 0
+        g.sql_seconds = 0.0
+        g.sql_statements = [] if self.slow_ms else None
+
+    def before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    def after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start'].pop()
+        # Background threads (chat log writer) have no request to charge this to
+        if not has_request_context() or 'sql_count' not in g:
+            return
+        g.sql_count += 1
+        g.sql_seconds += elapsed
+        if g.sql_statements is not None and len(g.sql_statements) < self.max_statements:
+            g.sql_statements.append((elapsed, statement))
+
+    def end_request(self, response):
+        if 'metrics_start' not in g:
+            return response
+        elapsed = time.perf_counter() - g.metrics_start
+        route = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+        labels = (('method', request.method), ('route', route))
+        with self.lock:
+            self.requests.inc(labels + (('status', response.status_code),))
+            self.latency.observe(labels, elapsed)
+            self.queries.observe(labels, g.sql_count)
+            self.db_time.inc(labels, g.sql_seconds)
+        if self.slow_ms and elapsed * 1000 >= self.slow_ms:
+            statements = '\n'.join(f'  {seconds * 1000:.1f} ms  {" ".join(sql.split())}'
+                                   for seconds, sql in g.sql_statements)
+            self.app.logger.warning('Slow request %s %s: %.0f ms, %d queries (%.0f ms in SQL)\n%s',
+                                    request.method, request.full_path.rstrip('?'), elapsed * 1000,
+                                    g.sql_count, g.sql_seconds * 1000, statements)
+        return response
+
+    def observe_llm(self, source, seconds=None):
+        """Count a chat answer by source; seconds is the LLM wait, if one was made"""
+        with self.lock:
+            self.llm_requests.inc((('source', source),))
+            if seconds is not None:
+                self.llm_latency.observe((('source', source),), seconds)
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for metric in (self.requests, self.latency, self.queries, self.db_time,
+                           self.llm_requests, self.llm_latency):
+                lines.extend(metric.render())
+        for name, help_text, fn in self.gauges:
+            lines.extend([f'# HELP {name} {help_text}', f'# TYPE {name} gauge'])
+            lines.append(f'{name} {fn()}')
+        return '\n'.join(lines) + '\n'
@@ -1,10 +1,31 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.engine import Engine
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
+from sqlalchemy.dialects import postgresql, sqlite
+from config import Config
+from geo import geocode, bounding_box, haversine_km, KM_PER_DEGREE
+from datetime import datetime, timedelta
+import math
+import sqlite3
 
 db = SQLAlchemy()
 
+@db.event.listens_for(Engine, 'connect')
+def configure_sqlite(dbapi_connection, connection_record):
+    """WAL lets readers run alongside the single writer; busy_timeout makes
+    concurrent writers queue for the lock instead of failing at once, and
+    synchronous=NORMAL skips the fsync on every commit (WAL stays consistent)"""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f'PRAGMA journal_mode={Config.SQLITE_JOURNAL_MODE}')
+        cursor.execute(f'PRAGMA synchronous={Config.SQLITE_SYNCHRONOUS}')
+        cursor.execute(f'PRAGMA busy_timeout={int(Config.SQLITE_BUSY_TIMEOUT)}')
+        cursor.close()
+        # Exact great-circle distance for "near me" queries
+        dbapi_connection.create_function(
+            'haversine_km', 4, lambda *args: None if None in args else haversine_km(*args), deterministic=True)
+
 class User(UserMixin, db.Model):
     """User model for Farmer, Buyer, and Admin"""
     __tablename__ = 'users'
@@ -19,6 +40,8 @@ class User(UserMixin, db.Model):
     phone = db.Column(db.String(20))
     address = db.Column(db.String(255))
     location = db.Column(db.String(100))
+    latitude = db.Column(db.Float)  # geocoded from location
+    longitude = db.Column(db.Float)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     crops = db.relationship('Crop', backref='seller', lazy=True, foreign_keys='Crop.farmer_id')
@@ -43,6 +66,20 @@ class User(UserMixin, db.Model):
 class Crop(db.Model):
     """Crop/Product listing for marketplace"""
     __tablename__ = 'crops'
+    __table_args__ = (
+        db.Index('ix_crops_status_category_location_created', 'status', 'category', 'location', 'created_at'),
+        db.Index('ix_crops_status_created', 'status', 'created_at'),
+        db.Index('ix_crops_status_category_created', 'status', 'category', 'created_at'),
+        db.Index('ix_crops_status_location_created', 'status', 'location', 'created_at'),
+        # One per /api/crops sort key; SQLite appends the rowid (Crop.id) to
+        # every index, so these also cover the id tie-break without a temp sort
+        db.Index('ix_crops_status_price', 'status', 'price_per_unit'),
+        db.Index('ix_crops_status_quantity', 'status', 'quantity'),
+        db.Index('ix_crops_status_category_price', 'status', 'category', 'price_per_unit'),
+        db.Index('ix_crops_status_category_quantity', 'status', 'category', 'quantity'),
+        db.Index('ix_crops_farmer_id', 'farmer_id'),
+        db.Index('ix_crops_latitude_longitude', 'latitude', 'longitude'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     farmer_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -53,14 +90,20 @@ class Crop(db.Model):
     price_per_unit = db.Column(db.Float, nullable=False)
     description = db.Column(db.Text)
     location = db.Column(db.String(100))
+    latitude = db.Column(db.Float)  # geocoded from location
+    longitude = db.Column(db.Float)
     image_url = db.Column(db.String(255))
     status = db.Column(db.String(20), default='available')  # 'available', 'sold', 'pending'
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     transactions = db.relationship('Transaction', backref='crop', lazy=True)
     
-    def to_dict(self):
-        return {
+    # Keys exposed by to_dict(), in order; used to validate ?fields= projections
+    FIELDS = ('id', 'crop_name', 'category', 'quantity', 'unit',
+              'price_per_unit', 'location', 'latitude', 'longitude', 'status', 'seller')
+    
+    def to_dict(self, fields=None):
+        data = {
             'id': self.id,
             'crop_name': self.crop_name,
             'category': self.category,
@@ -68,13 +111,27 @@ class Crop(db.Model):
             'unit': self.unit,
             'price_per_unit': self.price_per_unit,
             'location': self.location,
-            'status': self.status,
-            'seller': self.seller.to_dict()
+            'latitude': self.latitude,
+            'longitude': self.longitude,
+            'status': self.status
         }
+        # Only touch the seller relationship when it is actually wanted
+        if fields is None or 'seller' in fields:
+            data['seller'] = self.seller.to_dict()
+        if fields is not None:
+            data = {key: data[key] for key in fields}
+        return data
 
 class Transaction(db.Model):
     """Transaction/Purchase records"""
     __tablename__ = 'transactions'
+    __table_args__ = (
+        # Covers a buyer's ledger in created_at order without a sort
+        db.Index('ix_transactions_buyer_id_created_at', 'buyer_id', 'created_at'),
+        db.Index('ix_transactions_crop_id', 'crop_id'),
+        # One Razorpay order pays for exactly one transaction
+        db.Index('uq_transactions_razorpay_order_id', 'razorpay_order_id', unique=True),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     buyer_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -86,12 +143,19 @@ class Transaction(db.Model):
     razorpay_order_id = db.Column(db.String(100))
     delivery_status = db.Column(db.String(20), default='pending')  # 'pending', 'shipped', 'delivered'
     agreement_accepted = db.Column(db.Boolean, default=False)
+    # Set when the matching engine made the sale
+    buy_order_id = db.Column(db.Integer, db.ForeignKey('buy_orders.id'))
+    # True while the quantity is held off the listing for this (matched, still
+    # pending) sale; cleared when it completes or the stock goes back
+    stock_held = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     def to_dict(self):
         return {
             'id': self.id,
+            'buyer_id': self.buyer_id,
+            'buy_order_id': self.buy_order_id,
             'crop': self.crop.to_dict(),
             'quantity': self.quantity,
             'total_price': self.total_price,
@@ -100,9 +164,50 @@ class Transaction(db.Model):
             'created_at': str(self.created_at)
         }
 
+class BuyOrder(db.Model):
+    """A buyer's standing demand, filled from listings by the matching engine"""
+    __tablename__ = 'buy_orders'
+    __table_args__ = (
+        db.Index('ix_buy_orders_buyer_id_created_at', 'buyer_id', 'created_at'),
+        # Open orders are loaded into the order books at startup
+        db.Index('ix_buy_orders_status', 'status'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    buyer_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    crop_name = db.Column(db.String(100), nullable=False)
+    location = db.Column(db.String(100))  # None = any market
+    quantity = db.Column(db.Float, nullable=False)
+    filled = db.Column(db.Float, nullable=False, default=0)
+    max_price = db.Column(db.Float, nullable=False)  # per unit
+    status = db.Column(db.String(20), default='open')  # 'open', 'filled', 'cancelled'
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    transactions = db.relationship('Transaction', backref='buy_order', lazy=True)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'buyer_id': self.buyer_id,
+            'crop_name': self.crop_name,
+            'location': self.location,
+            'quantity': self.quantity,
+            'filled': self.filled,
+            'remaining': max(self.quantity - self.filled, 0),
+            'max_price': self.max_price,
+            'status': self.status,
+            'created_at': str(self.created_at)
+        }
+
 class Price(db.Model):
     """Real-time crop prices"""
     __tablename__ = 'prices'
+    __table_args__ = (
+        # Unique so bulk ingest can upsert on (crop_name, location, date)
+        db.Index('uq_prices_crop_location_date', 'crop_name', 'location', 'date', unique=True),
+        db.Index('ix_prices_date', 'date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     crop_name = db.Column(db.String(100), nullable=False)
@@ -119,9 +224,93 @@ class Price(db.Model):
             'date': str(self.date)
         }
 
+class LatestPrice(db.Model):
+    """Snapshot of the most recent Price per (crop_name, location)"""
+    __tablename__ = 'latest_prices'
+    __table_args__ = (
+        db.UniqueConstraint('crop_name', 'location', name='uq_latest_prices_crop_location'),
+        db.Index('ix_latest_prices_location', 'location'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    crop_name = db.Column(db.String(100), nullable=False)
+    location = db.Column(db.String(100), nullable=False, default='')  # '' stands in for NULL so the key stays unique
+    price = db.Column(db.Float)
+    date = db.Column(db.DateTime)
+    source = db.Column(db.String(50))
+    
+    def to_dict(self):
+        return {
+            'crop_name': self.crop_name,
+            'location': self.location or None,
+            'price': self.price,
+            'date': str(self.date)
+        }
+
+class PriceRollup(db.Model):
+    """Weekly/monthly price aggregates per (crop_name, location) for history charts"""
+    __tablename__ = 'price_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('bucket', 'crop_name', 'location', 'bucket_start', name='uq_price_rollups_key'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    bucket = db.Column(db.String(10), nullable=False)  # 'week', 'month'
+    crop_name = db.Column(db.String(100), nullable=False)
+    location = db.Column(db.String(100), nullable=False, default='')
+    bucket_start = db.Column(db.Date, nullable=False)
+    min_price = db.Column(db.Float)
+    max_price = db.Column(db.Float)
+    sum_price = db.Column(db.Float)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    last_price = db.Column(db.Float)
+    last_date = db.Column(db.DateTime)
+
+class PriceForecast(db.Model):
+    """Forecast monthly price per (crop_name, location), refreshed by `flask forecast-prices`"""
+    __tablename__ = 'price_forecasts'
+    __table_args__ = (
+        db.UniqueConstraint('crop_name', 'location', 'month', name='uq_price_forecasts_key'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    crop_name = db.Column(db.String(100), nullable=False)
+    location = db.Column(db.String(100), nullable=False, default='')
+    month = db.Column(db.Date, nullable=False)
+    price = db.Column(db.Float, nullable=False)
+    lower = db.Column(db.Float)
+    upper = db.Column(db.Float)
+    generated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'month': self.month.strftime('%Y-%m'),
+            'price': round(self.price, 2),
+            'lower': round(self.lower, 2) if self.lower is not None else None,
+            'upper': round(self.upper, 2) if self.upper is not None else None,
+        }
+
+class SalesRollup(db.Model):
+    """Completed sales per (farmer, crop_name, month) for the analytics dashboard"""
+    __tablename__ = 'sales_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('farmer_id', 'crop_name', 'month', name='uq_sales_rollups_key'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    farmer_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    crop_name = db.Column(db.String(100), nullable=False)
+    month = db.Column(db.Date, nullable=False)
+    quantity = db.Column(db.Float, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+
 class ChatMessage(db.Model):
     """Store chat history with AI"""
     __tablename__ = 'chat_messages'
+    __table_args__ = (
+        db.Index('ix_chat_messages_user_created', 'user_id', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -129,3 +318,580 @@ class ChatMessage(db.Model):
     bot_response = db.Column(db.Text, nullable=False)
     message_type = db.Column(db.String(50))  # 'agronomy', 'marketplace', 'general'
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'user_message': self.user_message,
+            'bot_response': self.bot_response,
+            'message_type': self.message_type,
+            'created_at': str(self.created_at)
+        }
+
+
+def decrement_stock(crop_id, quantity):
+    """Atomically take quantity off a listing, marking it sold when it runs out.
+
+    A single conditional UPDATE, so concurrent buyers can never drive the
+    quantity below zero: the row is only changed if the listing is still
+    on offer with enough stock left at the moment the database applies it.
+    Returns False when it is not.
+    """
+    remaining = Crop.quantity - quantity
+    result = db.session.execute(
+        db.update(Crop)
+        .where(Crop.id == crop_id, Crop.status == 'available', Crop.quantity >= quantity)
+        .values(quantity=remaining, status=db.case((remaining <= 0, 'sold'), else_=Crop.status))
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+def release_stock(crop_id, quantity):
+    """Put quantity back on a listing (a matched sale whose payment failed)"""
+    db.session.execute(
+        db.update(Crop)
+        .where(Crop.id == crop_id)
+        .values(quantity=Crop.quantity + quantity,
+                status=db.case((Crop.status == 'sold', 'available'), else_=Crop.status))
+        .execution_options(synchronize_session=False)
+    )
+
+def upsert_latest_prices(connection, rows):
+    """Fold price rows (dicts with Price columns) into the latest_prices snapshot.
+
+    Rows older than the snapshot entry for their key are ignored, so prices
+    can be inserted in any order.
+    """
+    latest = {}
+    for row in rows:
+        key = (row['crop_name'], row.get('location') or '')
+        if key not in latest or row['date'] >= latest[key]['date']:
+            latest[key] = {
+                'crop_name': key[0],
+                'location': key[1],
+                'price': row.get('price'),
+                'date': row['date'],
+                'source': row.get('source'),
+            }
+    if not latest:
+        return
+    
+    dialect = postgresql if connection.dialect.name == 'postgresql' else sqlite
+    table = LatestPrice.__table__
+    stmt = dialect.insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.crop_name, table.c.location],
+        set_={
+            'price': stmt.excluded.price,
+            'date': stmt.excluded.date,
+            'source': stmt.excluded.source,
+        },
+        where=stmt.excluded.date >= table.c.date
+    )
+    connection.execute(stmt, list(latest.values()))
+
+@db.event.listens_for(Price, 'after_insert')
+def update_latest_price(mapper, connection, target):
+    """Keep the snapshot current for prices added through the ORM"""
+    upsert_latest_prices(connection, [{
+        'crop_name': target.crop_name,
+        'location': target.location,
+        'price': target.price,
+        'date': target.date,
+        'source': target.source,
+    }])
+
+# History buckets; the coarse ones are served from price_rollups
+PRICE_BUCKETS = ('day', 'week', 'month')
+ROLLUP_BUCKETS = ('week', 'month')
+
+def bucket_start(value, bucket):
+    """Python twin of price_bucket() for a single datetime"""
+    day = value.date() if isinstance(value, datetime) else value
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day
+
+def price_bucket(column, bucket, dialect_name):
+    """SQL expression truncating a datetime column to its bucket's first day (weeks start Monday)"""
+    if dialect_name == 'postgresql':
+        return db.cast(db.func.date_trunc(bucket, column), db.Date)
+    if bucket == 'week':
+        offset = (db.cast(db.func.strftime('%w', column), db.Integer) + 6) % 7
+        return db.func.date(column, db.func.printf('-%d days', offset))
+    if bucket == 'month':
+        return db.func.strftime('%Y-%m-01', column)
+    return db.func.date(column)
+
+@db.event.listens_for(Price, 'after_insert')
+def update_price_rollups(mapper, connection, target):
+    """Fold a price added through the ORM into its week and month rollups"""
+    if target.price is None:
+        return
+    dialect = postgresql if connection.dialect.name == 'postgresql' else sqlite
+    table = PriceRollup.__table__
+    stmt = dialect.insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.bucket, table.c.crop_name, table.c.location, table.c.bucket_start],
+        set_={
+            'min_price': db.case((stmt.excluded.min_price < table.c.min_price, stmt.excluded.min_price),
+                                 else_=table.c.min_price),
+            'max_price': db.case((stmt.excluded.max_price > table.c.max_price, stmt.excluded.max_price),
+                                 else_=table.c.max_price),
+            'sum_price': table.c.sum_price + stmt.excluded.sum_price,
+            'count': table.c.count + 1,
+            'last_price': db.case((stmt.excluded.last_date >= table.c.last_date, stmt.excluded.last_price),
+                                  else_=table.c.last_price),
+            'last_date': db.case((stmt.excluded.last_date >= table.c.last_date, stmt.excluded.last_date),
+                                 else_=table.c.last_date),
+        }
+    )
+    connection.execute(stmt, [{
+        'bucket': bucket,
+        'crop_name': target.crop_name,
+        'location': target.location or '',
+        'bucket_start': bucket_start(target.date, bucket),
+        'min_price': target.price,
+        'max_price': target.price,
+        'sum_price': target.price,
+        'count': 1,
+        'last_price': target.price,
+        'last_date': target.date,
+    } for bucket in ROLLUP_BUCKETS])
+
+def rebuild_price_rollups(connection, start=None, end=None):
+    """Recompute rollups for every bucket overlapping [start, end] (all of history by default)"""
+    table = PriceRollup.__table__
+    prices = Price.__table__
+    for bucket in ROLLUP_BUCKETS:
+        delete = table.delete().where(table.c.bucket == bucket)
+        source = db.select(
+            db.literal(bucket).label('bucket'),
+            prices.c.crop_name,
+            db.func.coalesce(prices.c.location, '').label('location'),
+            price_bucket(prices.c.date, bucket, connection.dialect.name).label('bucket_start'),
+            prices.c.price,
+            prices.c.date,
+            db.func.row_number().over(
+                partition_by=[prices.c.crop_name, db.func.coalesce(prices.c.location, ''),
+                              price_bucket(prices.c.date, bucket, connection.dialect.name)],
+                order_by=[prices.c.date.desc(), prices.c.id.desc()]
+            ).label('rn')
+        ).where(prices.c.price.isnot(None))
+        if start is not None:
+            first = bucket_start(start, bucket)
+            delete = delete.where(table.c.bucket_start >= first)
+            source = source.where(prices.c.date >= datetime.combine(first, datetime.min.time()))
+        if end is not None:
+            delete = delete.where(table.c.bucket_start <= bucket_start(end, bucket))
+            # Whole buckets are rebuilt, so read to the end of the last one
+            last = bucket_start(end, bucket)
+            stop = last + timedelta(days=7) if bucket == 'week' else (last + timedelta(days=32)).replace(day=1)
+            source = source.where(prices.c.date < datetime.combine(stop, datetime.min.time()))
+        
+        ranked = source.subquery()
+        last_price = db.func.max(db.case((ranked.c.rn == 1, ranked.c.price)))
+        last_date = db.func.max(db.case((ranked.c.rn == 1, ranked.c.date)))
+        grouped = db.select(
+            ranked.c.bucket, ranked.c.crop_name, ranked.c.location, ranked.c.bucket_start,
+            db.func.min(ranked.c.price), db.func.max(ranked.c.price), db.func.sum(ranked.c.price),
+            db.func.count(ranked.c.price), last_price, last_date
+        ).group_by(ranked.c.bucket, ranked.c.crop_name, ranked.c.location, ranked.c.bucket_start)
+        
+        connection.execute(delete)
+        connection.execute(table.insert().from_select(
+            ['bucket', 'crop_name', 'location', 'bucket_start', 'min_price', 'max_price',
+             'sum_price', 'count', 'last_price', 'last_date'],
+            grouped
+        ))
+
+def price_history(crop_name, location=None, bucket='day', start=None, end=None):
+    """min/max/avg/last price per bucket for one crop, oldest bucket first.
+
+    Day buckets are aggregated from the prices table; week and month
+    buckets are read from price_rollups. Without a location, every
+    location of the crop is combined.
+    """
+    dialect_name = db.engine.dialect.name
+    if bucket in ROLLUP_BUCKETS:
+        table = PriceRollup.__table__
+        source = db.select(
+            table.c.bucket_start.label('bucket_start'),
+            table.c.min_price.label('low'),
+            table.c.max_price.label('high'),
+            table.c.sum_price.label('total'),
+            table.c.count.label('count'),
+            table.c.last_price.label('price'),
+            db.func.row_number().over(
+                partition_by=table.c.bucket_start,
+                order_by=table.c.last_date.desc()
+            ).label('rn')
+        ).where(table.c.bucket == bucket, table.c.crop_name == crop_name)
+        if location:
+            source = source.where(table.c.location == location)
+        if start is not None:
+            source = source.where(table.c.bucket_start >= bucket_start(start, bucket))
+        if end is not None:
+            source = source.where(table.c.bucket_start <= end)
+        ranked = source.subquery()
+        total, count = db.func.sum(ranked.c.total), db.func.sum(ranked.c.count)
+    else:
+        table = Price.__table__
+        day = price_bucket(table.c.date, bucket, dialect_name)
+        source = db.select(
+            day.label('bucket_start'),
+            table.c.price.label('low'),
+            table.c.price.label('high'),
+            table.c.price.label('price'),
+            db.func.row_number().over(
+                partition_by=day,
+                order_by=[table.c.date.desc(), table.c.id.desc()]
+            ).label('rn')
+        ).where(table.c.crop_name == crop_name, table.c.price.isnot(None))
+        if location:
+            source = source.where(table.c.location == location)
+        if start is not None:
+            source = source.where(table.c.date >= datetime.combine(start, datetime.min.time()))
+        if end is not None:
+            source = source.where(table.c.date < datetime.combine(end + timedelta(days=1), datetime.min.time()))
+        ranked = source.subquery()
+        total, count = db.func.sum(ranked.c.price), db.func.count(ranked.c.price)
+    
+    query = db.select(
+        ranked.c.bucket_start,
+        db.func.min(ranked.c.low),
+        db.func.max(ranked.c.high),
+        total,
+        count,
+        db.func.max(db.case((ranked.c.rn == 1, ranked.c.price)))
+    ).group_by(ranked.c.bucket_start).order_by(ranked.c.bucket_start)
+    
+    return [{
+        'bucket_start': str(row[0]),
+        'min': row[1],
+        'max': row[2],
+        'avg': row[3] / row[4] if row[4] else None,
+        'last': row[5],
+        'count': row[4],
+    } for row in db.session.execute(query)]
+
+def record_sale(connection, transaction):
+    """Fold a just-completed transaction into its farmer's monthly sales rollup"""
+    crop = transaction.crop
+    dialect = postgresql if connection.dialect.name == 'postgresql' else sqlite
+    table = SalesRollup.__table__
+    stmt = dialect.insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.farmer_id, table.c.crop_name, table.c.month],
+        set_={
+            'quantity': table.c.quantity + stmt.excluded.quantity,
+            'revenue': table.c.revenue + stmt.excluded.revenue,
+            'orders': table.c.orders + 1,
+        }
+    )
+    connection.execute(stmt, {
+        'farmer_id': crop.farmer_id,
+        'crop_name': crop.crop_name,
+        'month': bucket_start(transaction.created_at, 'month'),
+        'quantity': transaction.quantity,
+        'revenue': transaction.total_price,
+        'orders': 1,
+    })
+
+def completed_sales(dialect_name):
+    """Completed transactions in the shape of sales_rollups rows, one per order"""
+    transactions = Transaction.__table__
+    crops = Crop.__table__
+    return db.select(
+        crops.c.farmer_id,
+        crops.c.crop_name,
+        price_bucket(transactions.c.created_at, 'month', dialect_name).label('month'),
+        transactions.c.quantity,
+        transactions.c.total_price.label('revenue'),
+        db.literal(1).label('orders')
+    ).select_from(transactions.join(crops, crops.c.id == transactions.c.crop_id)) \
+        .where(transactions.c.payment_status == 'completed')
+
+def rebuild_sales_rollups(connection):
+    """Recompute every sales rollup from the completed transactions"""
+    table = SalesRollup.__table__
+    sales = completed_sales(connection.dialect.name).subquery()
+    connection.execute(table.delete())
+    connection.execute(table.insert().from_select(
+        ['farmer_id', 'crop_name', 'month', 'quantity', 'revenue', 'orders'],
+        db.select(
+            sales.c.farmer_id, sales.c.crop_name, sales.c.month,
+            db.func.sum(sales.c.quantity), db.func.sum(sales.c.revenue), db.func.count()
+        ).group_by(sales.c.farmer_id, sales.c.crop_name, sales.c.month)
+    ))
+
+def sales_summary(farmer_id=None, buyer_id=None, start=None, end=None, top=20):
+    """Revenue, volume and order counts of completed sales: totals, top
+    farmers, by crop and by month (oldest first).
+
+    Sales are read from sales_rollups, optionally for one farmer; a buyer's
+    purchases are aggregated from their transactions instead, since
+    rollups don't keep the buyer. start/end are dates, matched by month.
+    """
+    if buyer_id is not None:
+        source = completed_sales(db.engine.dialect.name).where(Transaction.__table__.c.buyer_id == buyer_id)
+    else:
+        table = SalesRollup.__table__
+        source = db.select(table.c.farmer_id, table.c.crop_name, table.c.month,
+                           table.c.quantity, table.c.revenue, table.c.orders)
+        if farmer_id is not None:
+            source = source.where(table.c.farmer_id == farmer_id)
+    sales = source.subquery()
+    if start is not None:
+        sales = db.select(sales).where(sales.c.month >= bucket_start(start, 'month')).subquery()
+    if end is not None:
+        sales = db.select(sales).where(sales.c.month <= bucket_start(end, 'month')).subquery()
+    
+    quantity = db.func.coalesce(db.func.sum(sales.c.quantity), 0).label('quantity')
+    revenue = db.func.coalesce(db.func.sum(sales.c.revenue), 0).label('revenue')
+    orders = db.func.coalesce(db.func.sum(sales.c.orders), 0).label('orders')
+    
+    def figures(row):
+        return {'quantity': row.quantity, 'revenue': row.revenue, 'orders': row.orders}
+    
+    totals = db.session.execute(db.select(quantity, revenue, orders)).one()
+    farmers = db.session.execute(
+        db.select(sales.c.farmer_id, User.username, quantity, revenue, orders)
+        .join(User, User.id == sales.c.farmer_id)
+        .group_by(sales.c.farmer_id, User.username)
+        .order_by(revenue.desc()).limit(top)
+    )
+    crops = db.session.execute(
+        db.select(sales.c.crop_name, quantity, revenue, orders)
+        .group_by(sales.c.crop_name).order_by(revenue.desc())
+    )
+    months = db.session.execute(
+        db.select(sales.c.month, quantity, revenue, orders)
+        .group_by(sales.c.month).order_by(sales.c.month)
+    )
+    return {
+        'totals': figures(totals),
+        'by_farmer': [dict(figures(row), farmer_id=row.farmer_id, username=row.username) for row in farmers],
+        'by_crop': [dict(figures(row), crop_name=row.crop_name) for row in crops],
+        'by_month': [dict(figures(row), month=str(row.month)[:7]) for row in months],
+    }
+
+def rebuild_latest_prices():
+    """Recompute the latest_prices snapshot from the full price history"""
+    with db.engine.begin() as connection:
+        connection.execute(LatestPrice.__table__.delete())
+        connection.execute(db.text("""
+            INSERT INTO latest_prices (crop_name, location, price, date, source)
+            SELECT crop_name, location, price, date, source FROM (
+                SELECT crop_name, COALESCE(location, '') AS location, price, date, source,
+                       ROW_NUMBER() OVER (
+                           PARTITION BY crop_name, COALESCE(location, '')
+                           ORDER BY date DESC, id DESC
+                       ) AS rn
+                FROM prices
+            ) ranked
+            WHERE rn = 1
+        """))
+
+# SQLite FTS5 index over crop listings. It is an external-content table
+# (the text lives only in crops); triggers keep it in sync with every
+# insert, delete and name/description edit, whichever code path makes them.
+CROP_SEARCH_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS crops_fts USING fts5(
+        crop_name, description, content='crops', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    # Distinct indexed terms, used for typo correction
+    "CREATE VIRTUAL TABLE IF NOT EXISTS crops_fts_vocab USING fts5vocab(crops_fts, 'row')",
+    """CREATE TRIGGER IF NOT EXISTS crops_fts_ai AFTER INSERT ON crops BEGIN
+        INSERT INTO crops_fts(rowid, crop_name, description) VALUES (new.id, new.crop_name, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS crops_fts_ad AFTER DELETE ON crops BEGIN
+        INSERT INTO crops_fts(crops_fts, rowid, crop_name, description)
+        VALUES ('delete', old.id, old.crop_name, old.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS crops_fts_au AFTER UPDATE OF crop_name, description ON crops BEGIN
+        INSERT INTO crops_fts(crops_fts, rowid, crop_name, description)
+        VALUES ('delete', old.id, old.crop_name, old.description);
+        INSERT INTO crops_fts(rowid, crop_name, description) VALUES (new.id, new.crop_name, new.description);
+    END""",
+    # Rank crop_name matches well above description matches
+    "INSERT INTO crops_fts(crops_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0)')",
+    "INSERT INTO crops_fts(crops_fts) VALUES ('rebuild')",
+]
+
+def install_crop_search(connection):
+    """Create (or rebuild) the crop full-text index; SQLite only"""
+    if connection.dialect.name != 'sqlite':
+        return
+    for statement in CROP_SEARCH_DDL:
+        connection.exec_driver_sql(statement)
+
+@db.event.listens_for(Crop.__table__, 'after_create')
+def create_crop_search(target, connection, **kw):
+    install_crop_search(connection)
+
+def set_coordinates(mapper, connection, target):
+    """Geocode users and listings whenever their location is set or changed"""
+    if db.inspect(target).attrs.location.history.has_changes():
+        target.latitude, target.longitude = geocode(target.location) or (None, None)
+
+for model in (User, Crop):
+    db.event.listen(model, 'before_insert', set_coordinates)
+    db.event.listen(model, 'before_update', set_coordinates)
+
+# SQLite R-tree over listing coordinates, kept in sync by triggers. Each
+# listing is a zero-size box, so a bounding-box query only visits the
+# tree nodes that overlap it.
+CROP_GEO_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS crops_geo USING rtree(id, min_lat, max_lat, min_lon, max_lon)",
+    """CREATE TRIGGER IF NOT EXISTS crops_geo_ai AFTER INSERT ON crops WHEN new.latitude IS NOT NULL BEGIN
+        INSERT INTO crops_geo VALUES (new.id, new.latitude, new.latitude, new.longitude, new.longitude);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS crops_geo_ad AFTER DELETE ON crops BEGIN
+        DELETE FROM crops_geo WHERE id = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS crops_geo_au AFTER UPDATE OF latitude, longitude ON crops BEGIN
+        DELETE FROM crops_geo WHERE id = old.id;
+        INSERT INTO crops_geo SELECT new.id, new.latitude, new.latitude, new.longitude, new.longitude
+        WHERE new.latitude IS NOT NULL;
+    END""",
+    """INSERT OR REPLACE INTO crops_geo
+        SELECT id, latitude, latitude, longitude, longitude FROM crops WHERE latitude IS NOT NULL""",
+]
+
+crops_geo = db.table('crops_geo', db.column('id'), db.column('min_lat'), db.column('max_lat'),
+                     db.column('min_lon'), db.column('max_lon'))
+
+def install_crop_geo(connection):
+    """Create (or refill) the listing R-tree; SQLite only"""
+    if connection.dialect.name != 'sqlite':
+        return
+    for statement in CROP_GEO_DDL:
+        connection.exec_driver_sql(statement)
+
+@db.event.listens_for(Crop.__table__, 'after_create')
+def create_crop_geo(target, connection, **kw):
+    install_crop_geo(connection)
+
+def backfill_coordinates(model):
+    """Geocode rows whose location predates the coordinate columns"""
+    table = model.__table__
+    locations = db.session.execute(
+        db.select(table.c.location).distinct()
+        .where(table.c.latitude.is_(None), table.c.location.isnot(None))
+    ).scalars().all()
+    for location in locations:
+        point = geocode(location)
+        if point is not None:
+            db.session.execute(
+                table.update()
+                .where(table.c.location == location, table.c.latitude.is_(None))
+                .values(latitude=point[0], longitude=point[1])
+            )
+    db.session.commit()
+
+def crops_near(query, lat, lon, radius_km, limit):
+    """Narrow a Crop query to listings within radius_km of (lat, lon).
+
+    Candidates come from the R-tree (or the latitude/longitude index on
+    other databases), so only listings inside the bounding box are ever
+    measured. Returns [(crop, distance_km)], nearest first.
+    """
+    min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius_km)
+    if db.engine.dialect.name == 'sqlite':
+        query = query.filter(Crop.id.in_(
+            db.select(crops_geo.c.id).where(
+                crops_geo.c.max_lat >= min_lat, crops_geo.c.min_lat <= max_lat,
+                crops_geo.c.max_lon >= min_lon, crops_geo.c.min_lon <= max_lon)
+        ))
+        distance = db.func.haversine_km(lat, lon, Crop.latitude, Crop.longitude)
+    else:
+        query = query.filter(Crop.latitude.between(min_lat, max_lat),
+                             Crop.longitude.between(min_lon, max_lon))
+        # Flat-earth distance; close enough to rank, the exact figure is computed below
+        dy = Crop.latitude - lat
+        dx = (Crop.longitude - lon) * math.cos(math.radians(lat))
+        distance = db.func.sqrt(dx * dx + dy * dy) * KM_PER_DEGREE
+    rows = query.add_columns(distance).filter(distance <= radius_km * 1.01) \
+        .order_by(distance, Crop.id).limit(limit).all()
+
+    results = []
+    for crop, _ in rows:
+        exact = haversine_km(lat, lon, crop.latitude, crop.longitude)
+        if exact <= radius_km:
+            results.append((crop, round(exact, 2)))
+    return results
+
+# Indexes replaced by later ones: the unique (crop_name, location, date)
+# index and the (buyer_id, created_at) composite
+STALE_INDEXES = ('ix_prices_crop_location_date', 'ix_transactions_buyer_id')
+
+def upgrade_schema():
+    """Bring an existing database up to date with the models.
+
+    create_all() skips tables that already exist, so databases created by
+    older versions never pick up columns or indexes added since; add those
+    here (new columns must be nullable), and backfill derived tables and
+    values that did not exist before.
+    """
+    inspector = db.inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    added_columns = set()
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            present = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in present:
+                    column_type = column.type.compile(dialect=connection.dialect)
+                    connection.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}')
+                    added_columns.add((table.name, column.name))
+        for name in STALE_INDEXES:
+            connection.exec_driver_sql(f'DROP INDEX IF EXISTS {name}')
+        if 'prices' in existing_tables and 'uq_prices_crop_location_date' not in \
+                {index['name'] for index in inspector.get_indexes('prices')}:
+            # Older databases may hold repeated (crop_name, location, date)
+            # rows; keep the last one written, as an upsert would have
+            connection.exec_driver_sql(
+                'DELETE FROM prices WHERE id NOT IN '
+                '(SELECT MAX(id) FROM prices GROUP BY crop_name, location, date)'
+            )
+    db.create_all()
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+    
+    if existing_tables and LatestPrice.__tablename__ not in existing_tables:
+        rebuild_latest_prices()
+    if existing_tables and PriceRollup.__tablename__ not in existing_tables:
+        with db.engine.begin() as connection:
+            rebuild_price_rollups(connection)
+    if existing_tables and SalesRollup.__tablename__ not in existing_tables:
+        with db.engine.begin() as connection:
+            rebuild_sales_rollups(connection)
+    if existing_tables and 'crops_fts' not in existing_tables:
+        with db.engine.begin() as connection:
+            install_crop_search(connection)
+    if ('transactions', 'stock_held') in added_columns:
+        # Matched sales still pending were holding their stock
+        with db.engine.begin() as connection:
+            connection.execute(
+                db.update(Transaction)
+                .where(Transaction.buy_order_id.isnot(None), Transaction.payment_status == 'pending')
+                .values(stock_held=True)
+            )
+    for model in (User, Crop):
+        if (model.__tablename__, 'latitude') in added_columns:
+            backfill_coordinates(model)
+    if existing_tables and 'crops_geo' not in existing_tables:
+        with db.engine.begin() as connection:
+            install_crop_geo(connection)
+    if db.engine.dialect.name == 'sqlite':
+        # Without statistics SQLite assumes status = ? is selective and scans
+        # that index instead of probing the R-tree / FTS results
+        with db.engine.begin() as connection:
+            connection.exec_driver_sql('ANALYZE')
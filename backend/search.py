@@ -0,0 +1,124 @@
+import re
+import threading
+import time
+from models import db, Crop
+
+TOKEN_RE = re.compile(r'\w+')
+
+# Lightweight handle on the FTS5 table so it can be joined like any other
+crops_fts = db.table('crops_fts', db.column('rowid'), db.column('rank'))
+
+def deletes(term):
+    """Every string one deleted character away from term"""
+    return {term[:i] + term[i + 1:] for i in range(len(term))}
+
+def within_one_edit(a, b):
+    """Damerau-Levenshtein distance <= 1 (one insert, delete, substitute or swap)"""
+    if a == b:
+        return True
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) == len(b):
+        diff = [i for i in range(len(a)) if a[i] != b[i]]
+        if len(diff) == 1:
+            return True
+        return len(diff) == 2 and diff[1] == diff[0] + 1 and a[diff[0]] == b[diff[1]] and a[diff[1]] == b[diff[0]]
+    if len(a) > len(b):
+        a, b = b, a
+    return a in deletes(b)
+
+class Vocabulary:
+    """Indexed search terms with a symmetric-delete index for spelling fixes.
+
+    Every term is filed under itself and each of its one-character deletions,
+    so candidates for a misspelt word come from a handful of dict lookups
+    rather than a scan over the whole vocabulary. Reloaded from the
+    crops_fts_vocab table at most every `ttl` seconds.
+    """
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self.loaded_at = None
+        self.terms = set()
+        self.index = {}
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        if self.loaded_at is not None and time.monotonic() - self.loaded_at < self.ttl:
+            return
+        with self.lock:
+            if self.loaded_at is not None and time.monotonic() - self.loaded_at < self.ttl:
+                return
+            terms = set(db.session.execute(db.text('SELECT term FROM crops_fts_vocab')).scalars())
+            index = {}
+            for term in terms:
+                for key in deletes(term) | {term}:
+                    index.setdefault(key, []).append(term)
+            self.terms, self.index = terms, index
+            self.loaded_at = time.monotonic()
+
+    def corrections(self, word):
+        """Indexed terms within one edit of word (empty if word is itself indexed)"""
+        if word in self.terms or len(word) < 4:
+            return []
+        candidates = set()
+        for key in deletes(word) | {word}:
+            candidates.update(self.index.get(key, ()))
+        return sorted(term for term in candidates if within_one_edit(word, term))
+
+vocabulary = Vocabulary()
+
+def build_match(words):
+    """FTS5 MATCH expression: every word must match as a prefix or a close spelling.
+
+    Returns (expression, {word: [corrections]}).
+    """
+    clauses, corrected = [], {}
+    vocabulary.refresh()
+    for word in words:
+        options = [f'"{word}"*']
+        fixes = vocabulary.corrections(word)
+        if fixes:
+            corrected[word] = fixes
+            options.extend(f'"{fix}"' for fix in fixes)
+        clauses.append(options[0] if len(options) == 1 else '(' + ' OR '.join(options) + ')')
+    return ' AND '.join(clauses), corrected
+
+def search_crops(text, filters, limit):
+    """Available crops matching text, best match first.
+
+    filters may hold min_price, max_price, min_quantity, max_quantity,
+    category and location. Returns (crops, corrections).
+    """
+    words = [word.lower() for word in TOKEN_RE.findall(text or '')][:8]
+    query = Crop.query.options(db.joinedload(Crop.seller)).filter(Crop.status == 'available')
+    corrected = {}
+
+    if words and db.engine.dialect.name == 'sqlite':
+        match, corrected = build_match(words)
+        query = query.join(crops_fts, crops_fts.c.rowid == Crop.id) \
+            .filter(db.text('crops_fts MATCH :match').bindparams(match=match)) \
+            .order_by(crops_fts.c.rank)
+    elif words:
+        # No FTS5 (e.g. Postgres): plain substring match, newest first
+        for word in words:
+            pattern = f'%{word}%'
+            query = query.filter(db.or_(Crop.crop_name.ilike(pattern), Crop.description.ilike(pattern)))
+        query = query.order_by(Crop.created_at.desc())
+    else:
+        query = query.order_by(Crop.created_at.desc())
+
+    if filters.get('min_price') is not None:
+        query = query.filter(Crop.price_per_unit >= filters['min_price'])
+    if filters.get('max_price') is not None:
+        query = query.filter(Crop.price_per_unit <= filters['max_price'])
+    if filters.get('min_quantity') is not None:
+        query = query.filter(Crop.quantity >= filters['min_quantity'])
+    if filters.get('max_quantity') is not None:
+        query = query.filter(Crop.quantity <= filters['max_quantity'])
+    if filters.get('category'):
+        query = query.filter(Crop.category == filters['category'])
+    if filters.get('location'):
+        query = query.filter(Crop.location == filters['location'])
+
+    return query.limit(limit).all(), corrected
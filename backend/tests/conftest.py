@@ -0,0 +1,98 @@
+import os
+import sys
+import tempfile
+import pytest
+
+# Config reads the environment at import, so point it at a throwaway database first
+WORKDIR = tempfile.mkdtemp(prefix='kisan_test_')
+os.environ.update({
+    'DATABASE_URL': f"sqlite:///{os.path.join(WORKDIR, 'test.db')}",
+    'CACHE_BACKEND': 'none',
+    'CHAT_LOG_ASYNC': 'false',
+    'FLASK_DEBUG': 'false',
+    'OPENAI_API_KEY': '',
+    'ASSET_BUILD_DIR': os.path.join(WORKDIR, 'assets'),
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+from app import app as flask_app, db, matching_engine, create_admin
+from models import upgrade_schema
+from search import vocabulary
+
+PASSWORD = 'test-password'
+
+@pytest.fixture
+def app():
+    """The app with an empty, fully migrated database"""
+    flask_app.config['TESTING'] = True
+    with flask_app.app_context():
+        db.session.remove()
+        db.drop_all()
+        with db.engine.begin() as connection:
+            for table in ('crops_fts_vocab', 'crops_fts', 'crops_geo'):
+                connection.exec_driver_sql(f'DROP TABLE IF EXISTS {table}')
+        upgrade_schema()
+    matching_engine.loaded_at = None
+    vocabulary.loaded_at = None
+    yield flask_app
+    with flask_app.app_context():
+        db.session.remove()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def make_user(app):
+    """make_user(username, role, location) -> a test client logged in as that new user"""
+    def make(username, role='farmer', location='Ludhiana, Punjab'):
+        client = app.test_client()
+        response = client.post('/api/signup', json={'username': username, 'email': f'{username}@test.local',
+                                                     'password': PASSWORD, 'role': role, 'location': location})
+        assert response.status_code == 201, response.get_json()
+        response = client.post('/api/login', json={'username': username, 'password': PASSWORD})
+        assert response.status_code == 200, response.get_json()
+        return client
+    return make
+
+def same_session(app, client):
+    """Another test client logged in as the same user (a client is not safe to share between threads)"""
+    other = app.test_client()
+    other.set_cookie('session', client.get_cookie('session').value)
+    return other
+
+def admin_client(app):
+    """A test client logged in as a new admin, made the way operators make one"""
+    result = app.test_cli_runner().invoke(create_admin, ['admin', '--email', 'admin@test.local',
+                                                         '--password', PASSWORD])
+    assert result.exit_code == 0, result.output
+    client = app.test_client()
+    assert client.post('/api/login', json={'username': 'admin', 'password': PASSWORD}).status_code == 200
+    return client
+
+class QueryCounter:
+    """Records the SQL statements (and their parameters) run inside a with block"""
+
+    def __init__(self, app):
+        with app.app_context():
+            self.engine = db.engine
+        self.statements = []
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self.record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self.record)
+
+    def record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append((statement, parameters))
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+@pytest.fixture
+def count_queries(app):
+    return lambda: QueryCounter(app)
@@ -0,0 +1,36 @@
+import gzip
+import importlib.util
+import re
+import pytest
+
+HAS_BROTLI = importlib.util.find_spec('brotli') is not None
+
+@pytest.mark.parametrize('accept, encoding', [
+    ('br, gzip', 'br' if HAS_BROTLI else 'gzip'),
+    ('gzip', 'gzip'),
+    ('br', 'br' if HAS_BROTLI else None),
+    ('', None),
+])
+def test_page_is_sent_in_the_best_accepted_encoding(client, accept, encoding):
+    response = client.get('/', headers={'Accept-Encoding': accept})
+    assert response.status_code == 200
+    assert response.content_encoding == encoding
+    assert 'Accept-Encoding' in response.vary
+    body = gzip.decompress(response.data) if encoding == 'gzip' else response.data
+    if encoding != 'br':
+        assert b'<form' in body
+
+def test_etag_revalidation_and_cache_lifetimes(client):
+    page = client.get('/', headers={'Accept-Encoding': 'gzip'})
+    assert page.headers['Cache-Control'] == 'no-cache'
+    again = client.get('/', headers={'Accept-Encoding': 'gzip', 'If-None-Match': page.headers['ETag']})
+    assert again.status_code == 304 and again.data == b''
+    # Each encoding has its own ETag, so a cached gzip body never answers an identity request
+    assert client.get('/', headers={'If-None-Match': page.headers['ETag']}).status_code == 200
+
+    stylesheet = re.search(r'href="(css/style\.[0-9a-f]{10}\.css)"', gzip.decompress(page.data).decode()).group(1)
+    hashed = client.get('/' + stylesheet)
+    assert hashed.status_code == 200
+    assert hashed.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+    assert client.get('/css/style.css').headers['Cache-Control'] == 'no-cache'
+    assert client.get('/css/missing.css').status_code == 404
@@ -0,0 +1,19 @@
+from app import response_cache
+from cache import MemoryCache, ResponseCache
+
+def test_cached_listings_are_invalidated_by_writes(client, make_user, monkeypatch):
+    monkeypatch.setattr(response_cache, 'backend', MemoryCache())
+    farmer = make_user('farmer')
+    assert client.get('/api/crops?limit=5').get_json()['crops'] == []
+    farmer.post('/api/crops', json={'crop_name': 'Wheat', 'category': 'cereal', 'quantity': 5, 'price_per_unit': 20})
+    assert len(client.get('/api/crops?limit=5').get_json()['crops']) == 1
+
+def test_memory_cache_is_not_shared_between_workers(app, monkeypatch):
+    cache = ResponseCache()
+    cache.init_app(app)
+    cache.backend = MemoryCache()
+    cache.share_between(1)
+    assert isinstance(cache.backend, MemoryCache)
+    monkeypatch.setitem(app.config, 'CACHE_REDIS_URL', 'redis://127.0.0.1:1/0')  # nothing listens here
+    cache.share_between(4)
+    assert cache.backend is None
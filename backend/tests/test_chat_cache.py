@@ -0,0 +1,34 @@
+import types
+import pytest
+from chat_cache import ChatResponseCache
+
+@pytest.fixture
+def cache():
+    return ChatResponseCache(types.SimpleNamespace(config={'CHAT_CACHE_SIMILARITY': 0.6}))
+
+def test_near_duplicate_question_is_a_hit(cache):
+    cache.put('When is the best time to sell wheat in Punjab?', 'general', 'answer')
+    assert cache.get('best time to sell wheat in Punjab', 'general') == 'answer'
+
+@pytest.mark.parametrize('question', [
+    'When is the best time to sell rice in Punjab?',
+    'When is the best time to sell wheat in Haryana?',
+    'When is the best time to sell wheat?',
+])
+def test_different_crop_or_region_is_a_miss(cache, question):
+    cache.put('When is the best time to sell wheat in Punjab?', 'general', 'answer')
+    assert cache.get(question, 'general') is None
+
+def test_learned_domain_terms(cache):
+    cache.put('price of kinnow in Abohar market today', 'general', 'answer')
+    assert cache.get('price of kinnow in Fazilka market today', 'general') == 'answer'
+    cache.add_domain_terms(['Abohar', 'Fazilka'])
+    assert cache.get('price of kinnow in Fazilka market today', 'general') is None
+
+def test_answers_are_scoped_to_their_forecast_context(cache):
+    question = 'When should I sell wheat?'
+    cache.put(question, 'general', 'sell in March', context='Wheat at Punjab: peaks in March')
+    assert cache.get(question, 'general', context='Wheat at Punjab: peaks in March') == 'sell in March'
+    assert cache.get(question, 'general', context='Wheat at Punjab: peaks in June') is None
+    assert cache.get(question, 'general') is None
+    assert cache.get('when to sell wheat', 'general', context='Wheat at Punjab: peaks in June') is None
@@ -0,0 +1,81 @@
+import threading
+import pytest
+from chat_log import ChatLogWriter
+from models import db, ChatMessage
+
+@pytest.fixture
+def writer(app):
+    writer = ChatLogWriter()
+    writer.init_app(app)
+    writer.enabled = True
+    writer.interval = 0.05
+    yield writer
+    writer.close()
+
+def stored(app):
+    with app.app_context():
+        return [message.user_message for message in ChatMessage.query.order_by(ChatMessage.id)]
+
+def test_flush_waits_for_the_batch_in_flight(app, writer):
+    inserting, release = threading.Event(), threading.Event()
+    insert = writer.insert
+
+    def slow_insert(rows):
+        inserting.set()
+        release.wait(5)
+        insert(rows)
+    writer.insert = slow_insert
+    writer.write(1, 'first', 'answer', 'general')
+    assert inserting.wait(5)
+    # The writer thread has dequeued the row but not committed it yet
+    threading.Timer(0.1, release.set).start()
+    writer.flush()
+    assert stored(app) == ['first']
+
+def test_failed_batch_is_retried(app, writer):
+    failures = iter([True])
+    insert = writer.insert
+
+    def flaky_insert(rows):
+        if next(failures, False):
+            raise RuntimeError('database is locked')
+        insert(rows)
+    writer.insert = flaky_insert
+    writer.write(1, 'kept', 'answer', 'general')
+    writer.flush()
+    writer.flush()
+    assert stored(app) == ['kept']
+    assert writer.thread.is_alive()
+
+def test_dead_writer_thread_is_restarted(app, writer):
+    writer.write(1, 'one', 'answer', 'general')
+    writer.flush()
+    writer.thread = threading.Thread(target=lambda: None)
+    writer.thread.start()
+    writer.thread.join()
+    writer.write(1, 'two', 'answer', 'general')
+    assert writer.thread.is_alive()
+    writer.flush()
+    assert stored(app) == ['one', 'two']
+
+def test_close_flushes_and_stops_promptly(app, writer):
+    writer.write(1, 'last', 'answer', 'general')
+    writer.close()
+    assert not writer.thread.is_alive()
+    assert stored(app) == ['last']
+
+def test_rejected_row_does_not_hold_up_later_ones(app, writer):
+    writer.write(1, None, 'answer', 'general')  # user_message is NOT NULL
+    writer.write(1, 'after', 'answer', 'general')
+    writer.flush()
+    writer.write(1, 'later', 'answer', 'general')
+    writer.flush()
+    assert stored(app) == ['after', 'later']
+    assert writer.retry == [] and writer.pending == 0
+
+@pytest.mark.parametrize('path', ['/api/chat', '/api/chat/stream'])
+@pytest.mark.parametrize('body', [{}, {'message': ''}, {'message': '  '}, {'message': ['hi']}])
+def test_chat_needs_a_message(make_user, path, body):
+    farmer = make_user('farmer')
+    response = farmer.post(path, json=body)
+    assert response.status_code == 400
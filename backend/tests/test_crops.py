@@ -0,0 +1,87 @@
+def list_crops(farmer, count, name='Wheat'):
+    for i in range(count):
+        response = farmer.post('/api/crops', json={'crop_name': name, 'category': 'cereal', 'quantity': 100 + i,
+                                                   'price_per_unit': 20 + i})
+        assert response.status_code == 201
+
+def test_crop_page_query_count_is_constant(app, client, make_user, count_queries):
+    for i in range(4):
+        list_crops(make_user(f'farmer{i}'), 15)
+
+    counts = {}
+    for limit in (5, 20, 60):
+        with count_queries() as counter:
+            response = client.get(f'/api/crops?limit={limit}')
+        assert response.status_code == 200
+        assert len(response.get_json()['crops']) == limit
+        counts[limit] = counter.count
+    # Sellers come in the same SELECT: no query per row
+    assert len(set(counts.values())) == 1, counts
+    assert counts[5] == 1
+
+def test_crop_pages_follow_cursor(client, make_user):
+    list_crops(make_user('farmer'), 7)
+    seen, cursor = [], None
+    while True:
+        response = client.get('/api/crops', query_string={'limit': 3, 'sort': 'price_per_unit', 'order': 'asc',
+                                                          **({'cursor': cursor} if cursor else {})})
+        body = response.get_json()
+        seen.extend(crop['price_per_unit'] for crop in body['crops'])
+        cursor = body['next_cursor']
+        if cursor is None:
+            break
+    assert seen == sorted(seen) and len(seen) == 7
+
+def test_search_matches_prefixes_and_fixes_typos(client, make_user):
+    farmer = make_user('farmer')
+    ids = {}
+    for name, description, price in [('Tomato', 'Fresh red hybrid tomatoes', 30), ('Wheat', 'Sharbati wheat', 25),
+                                      ('Rice', 'Aged basmati', 60), ('Wheat', 'Old stock', 20)]:
+        response = farmer.post('/api/crops', json={'crop_name': name, 'category': 'cereal', 'quantity': 100,
+                                                   'price_per_unit': price, 'description': description})
+        ids.setdefault(name, []).append(response.get_json()['crop_id'])
+    farmer.put(f"/api/crops/{ids['Wheat'][1]}", json={'status': 'withdrawn'})
+
+    def search(**params):
+        body = client.get('/api/crops/search', query_string=params).get_json()
+        return [crop['crop_name'] for crop in body['crops']], body['corrected']
+
+    assert search(q='toma') == (['Tomato'], {})
+    assert search(q='basmati') == (['Rice'], {})
+    # Withdrawn listings are not found; a close misspelling is corrected
+    assert search(q='wheet') == (['Wheat'], {'wheet': ['wheat']})
+    assert search(q='sharbati whaet') == (['Wheat'], {'whaet': ['wheat']})
+    assert search(q='tomato', max_price=20) == ([], {})
+    assert search(q='zzzz') == ([], {})
+
+def test_near_returns_listings_within_radius_nearest_first(client, make_user):
+    for place in ('Amritsar, Punjab', 'Pune, Maharashtra', 'Jalandhar, Punjab', 'Ludhiana, Punjab', 'Atlantis'):
+        list_crops(make_user(place.split(',')[0].lower(), location=place), 1)
+
+    def near(radius_km):
+        response = client.get('/api/crops', query_string={'near': '30.9010,75.8573', 'radius_km': radius_km})
+        assert response.status_code == 200
+        return [(crop['location'], crop['distance_km']) for crop in response.get_json()['crops']]
+
+    places = near(100)
+    assert [place for place, _ in places] == ['Ludhiana, Punjab', 'Jalandhar, Punjab']
+    assert places[0][1] < 1 and 40 < places[1][1] < 60
+    assert [place for place, _ in near(200)] == ['Ludhiana, Punjab', 'Jalandhar, Punjab', 'Amritsar, Punjab']
+    assert client.get('/api/crops?near=north').status_code == 400
+
+def test_listings_with_transactions_are_not_deleted(make_user):
+    farmer, buyer = make_user('farmer'), make_user('buyer', role='buyer')
+    traded, untraded = (farmer.post('/api/crops', json={'crop_name': 'Wheat', 'category': 'cereal', 'quantity': 10,
+                                                         'price_per_unit': 20}).get_json()['crop_id']
+                        for _ in range(2))
+    assert buyer.post('/api/transactions', json={'crop_id': traded, 'quantity': 2}).status_code == 201
+
+    response = farmer.delete('/api/crops/bulk', json=[{'id': traded}, {'id': untraded}])
+    assert response.status_code == 400
+    assert response.get_json()['errors'] == [{'index': 0, 'errors': {'id': 'Listing has transactions'}}]
+    assert farmer.get(f'/api/crops/{untraded}').status_code == 200
+    assert farmer.delete(f'/api/crops/{traded}').status_code == 409
+
+    assert farmer.delete('/api/crops/bulk', json=[{'id': untraded}]).get_json()['deleted'] == 1
+    response = buyer.get('/api/transactions')
+    assert response.status_code == 200 and len(response.get_json()['transactions']) == 1
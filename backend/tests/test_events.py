@@ -0,0 +1,53 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from events import EventBroker
+
+def test_epoch_follows_the_process(monkeypatch):
+    broker = EventBroker()
+    broker.publish('crops', 'crop.created', {'id': 1})
+    master = broker.epoch
+    assert broker.parse_id(f'{master}.1') == 1
+    monkeypatch.setattr(os, 'getpid', lambda: 999999)
+    worker = broker.epoch
+    assert worker != master
+    assert broker.parse_id(f'{master}.1') is None
+
+def test_threaded_workers_keep_threads_for_requests(app):
+    broker = EventBroker(app)
+    broker.limit_to_threads(4)
+    assert broker.max_subscribers == 2
+    streams = [broker.try_subscribe({'crops'}) for _ in range(2)]
+    assert broker.full() and broker.try_subscribe({'crops'}) is None
+    next(iter(streams[0]))
+    streams[0].close()
+    streams[1].close()  # never started, still gives its slot back
+    streams[1].close()
+    assert broker.subscribers == 0
+
+def test_connections_arriving_together_respect_the_limit(app):
+    broker = EventBroker(app)
+    broker.max_subscribers = 5
+    barrier = threading.Barrier(40)
+
+    def connect(_):
+        barrier.wait()
+        return broker.try_subscribe({'crops'})
+
+    with ThreadPoolExecutor(max_workers=40) as pool:
+        streams = [stream for stream in pool.map(connect, range(40)) if stream is not None]
+    assert len(streams) == 5 and broker.subscribers == 5
+
+def test_event_stream_answers_503_when_full(app, client, monkeypatch):
+    from app import events
+    monkeypatch.setattr(events, 'max_subscribers', 0)
+    response = client.get('/api/events')
+    assert response.status_code == 503 and response.headers['Retry-After'] == '30'
+
+def test_closing_the_response_frees_the_slot(app, client):
+    from app import events
+    response = client.get('/api/events', buffered=False)
+    assert next(response.response).startswith(b'retry:')
+    assert events.subscribers == 1
+    response.close()
+    assert events.subscribers == 0
@@ -0,0 +1,23 @@
+import pytest
+from intents import intent_matcher
+
+@pytest.mark.parametrize('message, intent', [
+    ('When is the best time to sell wheat before the monsoon?', 'weather_selling'),
+    ('HOW DO I GROW TOMATOES', 'farming'),
+    ('गेहूं का भाव क्या है', 'best_prices'),
+    ('hello there', 'greeting'),
+    ('what is kisan mandi', 'greeting'),
+    ('किसान मंडी क्या है', 'greeting'),
+    ('mandi mein gehun ka bhav kya hai', 'best_prices'),
+])
+def test_classify(message, intent):
+    assert intent_matcher.classify(message) == intent
+
+@pytest.mark.parametrize('message', ['ſell my crop', 'ſeed', 'KKisan rate', 'ﬅ', 'İ'])
+def test_case_folding_characters_do_not_raise(message):
+    intent_matcher.classify(message)
+
+def test_chat_with_long_s_answers(make_user):
+    farmer = make_user('farmer')
+    response = farmer.post('/api/chat', json={'message': 'ſell ſeed'})
+    assert response.status_code == 200
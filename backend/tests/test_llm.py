@@ -0,0 +1,121 @@
+import json
+import threading
+import time
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import openai
+import pytest
+from llm import LLMClient, LLMAuthError, LLMUnavailable
+
+@pytest.fixture
+def llm():
+    client = LLMClient(types.SimpleNamespace(config={
+        'OPENAI_API_KEY': 'sk-test', 'LLM_TIMEOUT': 2, 'LLM_MAX_CONCURRENCY': 2,
+        'LLM_BREAKER_THRESHOLD': 1, 'LLM_BREAKER_RESET': 0,
+    }))
+    yield client
+    client.executor.shutdown(wait=True)
+
+def half_open(llm):
+    llm.breaker.record_failure()
+    assert llm.breaker.state == 'half-open'
+
+def fail(exception):
+    def create(messages, **kwargs):
+        raise exception
+    return create
+
+def test_auth_error_on_trial_lets_the_next_call_through(llm):
+    half_open(llm)
+    llm.create = fail(Exception('Incorrect api_key provided'))
+    with pytest.raises(LLMAuthError):
+        llm.complete('hello')
+    assert not llm.breaker.trial_running
+    llm.create = fail(Exception('upstream 503'))
+    with pytest.raises(LLMUnavailable, match='upstream 503'):
+        llm.complete('hello')
+
+def test_closing_a_stream_mid_answer_settles_the_trial(llm):
+    half_open(llm)
+    llm.create = lambda messages, **kwargs: iter([{'choices': [{'delta': {'content': part}}]} for part in ('a', 'b')])
+    stream = llm.stream('hello')
+    assert next(stream) == 'a'
+    stream.close()
+    assert not llm.breaker.trial_running
+    assert llm.breaker.state == 'closed'
+
+def test_closing_a_stream_before_any_answer_is_neutral(llm):
+    half_open(llm)
+    llm.create = lambda messages, **kwargs: iter(())
+    stream = llm.stream('hello')
+    stream.close()  # never started: nothing was submitted
+    assert llm.breaker.allow()
+    llm.breaker.record_neutral()
+    assert llm.breaker.state == 'half-open' and llm.breaker.allow()
+
+def test_busy_slots_do_not_hold_the_trial(llm):
+    half_open(llm)
+    for _ in range(2):
+        llm.slots.acquire()
+    with pytest.raises(LLMUnavailable, match='slots busy'):
+        llm.complete('hello')
+    assert not llm.breaker.trial_running
+
+class StubOpenAI(BaseHTTPRequestHandler):
+    """/v1/chat/completions that answers after server.delay seconds"""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        time.sleep(self.server.delay)
+        body = json.dumps({'object': 'chat.completion',
+                           'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': 'stub reply'}}]})
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body.encode())
+        except OSError:
+            pass  # the client gave up waiting
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def stub_server(monkeypatch):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubOpenAI)
+    server.daemon_threads = True
+    server.delay = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(openai, 'api_key', 'sk-test')
+    monkeypatch.setattr(openai, 'api_base', f'http://127.0.0.1:{server.server_address[1]}/v1')
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def test_slow_upstream_times_out_and_breaker_recovers(stub_server):
+    llm = LLMClient(types.SimpleNamespace(config={
+        'OPENAI_API_KEY': 'sk-test', 'LLM_TIMEOUT': 0.5, 'LLM_MAX_CONCURRENCY': 1,
+        'LLM_BREAKER_THRESHOLD': 1, 'LLM_BREAKER_RESET': 1,
+    }))
+    try:
+        stub_server.delay = 3
+        started = time.monotonic()
+        with pytest.raises(LLMUnavailable):
+            llm.complete('hello')
+        assert time.monotonic() - started < 2
+        assert llm.breaker.state == 'open'
+        with pytest.raises(LLMUnavailable, match='Circuit open'):
+            llm.complete('hello')
+
+        # The upstream call gives up on its own timeout too, freeing its worker
+        assert llm.slots.acquire(timeout=2)
+        llm.slots.release()
+
+        stub_server.delay = 0
+        time.sleep(1)
+        assert llm.breaker.state == 'half-open'
+        assert llm.complete('hello') == 'stub reply'
+        assert llm.breaker.state == 'closed'
+    finally:
+        llm.executor.shutdown(wait=True)
@@ -0,0 +1,34 @@
+from app import matching_engine
+
+def list_crop(farmer, name, quantity, price):
+    response = farmer.post('/api/crops', json={'crop_name': name, 'category': 'cereal', 'quantity': quantity,
+                                               'price_per_unit': price})
+    assert response.status_code == 201
+    return response.get_json()['crop_id']
+
+def place_order(buyer, name, quantity, max_price):
+    response = buyer.post('/api/orders', json={'crop_name': name, 'quantity': quantity, 'max_price': max_price})
+    assert response.status_code == 201
+    return response.get_json()
+
+def test_books_load_only_crops_with_demand(app, make_user):
+    farmer = make_user('farmer')
+    list_crop(farmer, 'Wheat', 10, 20)
+    rice_id = list_crop(farmer, 'Rice', 10, 30)
+    buyer = make_user('buyer', role='buyer')
+
+    matching_engine.loaded_at = None
+    assert place_order(buyer, 'Rice', 5, 25)['matches'] == []
+    assert matching_engine.loaded_crops == {'rice'}
+    assert matching_engine.stats() == {'listings': 1, 'open_orders': 1}
+
+    # A reload keeps the crop that has resting demand
+    matching_engine.loaded_at = None
+    matches = place_order(buyer, 'wheat', 4, 25)['matches']
+    assert [match['quantity'] for match in matches] == [4]
+    assert matching_engine.loaded_crops == {'rice', 'wheat'}
+
+    # Repricing under the resting bid fills it
+    assert farmer.put(f'/api/crops/{rice_id}', json={'price_per_unit': 24}).status_code == 200
+    orders = buyer.get('/api/orders').get_json()['orders']
+    assert {order['crop_name']: order['status'] for order in orders} == {'Rice': 'filled', 'wheat': 'filled'}
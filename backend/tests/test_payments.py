@@ -0,0 +1,142 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from conftest import admin_client, same_session
+from models import db, Crop, Transaction
+
+def run_concurrently(calls):
+    """Run each zero-argument callable on its own pool thread, all released at the same moment"""
+    barrier = threading.Barrier(len(calls))
+
+    def run(call):
+        barrier.wait()
+        return call()
+
+    with ThreadPoolExecutor(max_workers=len(calls)) as pool:
+        return list(pool.map(run, calls))
+
+def sold_quantity(crop_id):
+    return sum(t.quantity for t in Transaction.query.filter_by(crop_id=crop_id, payment_status='completed'))
+
+def held_quantity(crop_id):
+    return sum(t.quantity for t in Transaction.query.filter_by(crop_id=crop_id, stock_held=True))
+
+def list_crop(farmer, quantity):
+    response = farmer.post('/api/crops', json={'crop_name': 'Wheat', 'category': 'cereal', 'quantity': quantity,
+                                               'price_per_unit': 20})
+    assert response.status_code == 201
+    return response.get_json()['crop_id']
+
+def place_order(buyer, quantity):
+    """A buy order that matches at once; returns its (held) transaction ids"""
+    response = buyer.post('/api/orders', json={'crop_name': 'Wheat', 'quantity': quantity, 'max_price': 25})
+    assert response.status_code == 201
+    return [trade['transaction_id'] for trade in response.get_json()['matches']]
+
+def pay(client, transaction_id, status='completed'):
+    return client.post(f'/api/transactions/{transaction_id}/payment', json={'status': status}).status_code
+
+def test_concurrent_payments_never_oversell(app, make_user):
+    crop_id = list_crop(make_user('farmer'), 10)
+    buyer = make_user('buyer', role='buyer')
+    payments = []
+    for _ in range(48):
+        response = buyer.post('/api/transactions', json={'crop_id': crop_id, 'quantity': 3})
+        assert response.status_code == 201
+        client = same_session(app, buyer)
+        payments.append(lambda client=client, transaction_id=response.get_json()['transaction_id']:
+                        pay(client, transaction_id))
+
+    statuses = run_concurrently(payments)
+
+    assert sorted(statuses) == [200] * 3 + [409] * 45
+    with app.app_context():
+        crop = db.session.get(Crop, crop_id)
+        assert crop.quantity == 1
+        assert sold_quantity(crop_id) == 9
+
+def test_withdrawn_listing_is_not_sold(app, make_user):
+    farmer = make_user('farmer')
+    crop_id = list_crop(farmer, 10)
+    buyer = make_user('buyer', role='buyer')
+    transaction_id = buyer.post('/api/transactions', json={'crop_id': crop_id, 'quantity': 2}).get_json()['transaction_id']
+    assert farmer.put(f'/api/crops/{crop_id}', json={'status': 'withdrawn'}).status_code == 200
+
+    assert pay(buyer, transaction_id) == 409
+    with app.app_context():
+        assert db.session.get(Crop, crop_id).quantity == 10
+        assert sold_quantity(crop_id) == 0
+
+def test_matched_sale_cannot_sell_released_stock_twice(app, make_user):
+    crop_id = list_crop(make_user('farmer'), 10)
+    first = make_user('first', role='buyer')
+    [matched] = place_order(first, 10)
+    assert pay(first, matched, 'failed') == 200  # stock goes back on the listing
+
+    second = make_user('second', role='buyer')
+    [resold] = place_order(second, 10)
+    assert pay(second, resold) == 200
+
+    assert pay(first, matched, 'pending') == 200
+    assert pay(first, matched) == 409
+    with app.app_context():
+        assert db.session.get(Crop, crop_id).quantity == 0
+        assert sold_quantity(crop_id) == 10
+
+def test_concurrent_matched_and_direct_payments_conserve_stock(app, make_user):
+    crop_id = list_crop(make_user('farmer'), 10)
+    payments = []
+    for i, status in enumerate(('completed', 'failed', 'completed')):
+        buyer = make_user(f'matched{i}', role='buyer')
+        [transaction_id] = place_order(buyer, 2)
+        payments.append(lambda buyer=buyer, transaction_id=transaction_id, status=status:
+                        pay(buyer, transaction_id, status))
+    for i in range(5):
+        buyer = make_user(f'direct{i}', role='buyer')
+        response = buyer.post('/api/transactions', json={'crop_id': crop_id, 'quantity': 2})
+        assert response.status_code == 201
+        payments.append(lambda buyer=buyer, transaction_id=response.get_json()['transaction_id']:
+                        pay(buyer, transaction_id))
+
+    run_concurrently(payments)
+
+    with app.app_context():
+        crop = db.session.get(Crop, crop_id)
+        assert crop.quantity >= 0
+        assert sold_quantity(crop_id) <= 10
+        assert crop.quantity + sold_quantity(crop_id) + held_quantity(crop_id) == 10
+        assert held_quantity(crop_id) == 0
+
+def test_sales_analytics_aggregate_completed_sales(app, make_user):
+    wheat_farmer, rice_farmer = make_user('wheatgrower'), make_user('ricegrower')
+    buyer, other_buyer = make_user('buyer', role='buyer'), make_user('other', role='buyer')
+    wheat = list_crop(wheat_farmer, 10)
+    rice = rice_farmer.post('/api/crops', json={'crop_name': 'Rice', 'category': 'cereal', 'quantity': 10,
+                                                'price_per_unit': 50}).get_json()['crop_id']
+
+    def buy(client, crop_id, quantity, status='completed'):
+        transaction_id = client.post('/api/transactions', json={'crop_id': crop_id, 'quantity': quantity}) \
+            .get_json()['transaction_id']
+        assert pay(client, transaction_id, status) == 200
+    buy(buyer, wheat, 3)
+    buy(buyer, rice, 4)
+    buy(other_buyer, wheat, 1)
+    buy(buyer, wheat, 2, status='failed')  # not a sale
+
+    def summary(client, **params):
+        response = client.get('/api/analytics/sales', query_string=params)
+        assert response.status_code == 200
+        return response.get_json()
+
+    everyone = summary(admin_client(app))
+    assert everyone['totals'] == {'quantity': 8, 'revenue': 280, 'orders': 3}
+    assert [(row['username'], row['revenue']) for row in everyone['by_farmer']] == [('ricegrower', 200),
+                                                                                    ('wheatgrower', 80)]
+    assert [(row['crop_name'], row['quantity']) for row in everyone['by_crop']] == [('Rice', 4), ('Wheat', 4)]
+    this_month = datetime.utcnow().strftime('%Y-%m')
+    assert [(row['month'], row['orders']) for row in everyone['by_month']] == [(this_month, 3)]
+
+    assert summary(wheat_farmer)['totals'] == {'quantity': 4, 'revenue': 80, 'orders': 2}
+    assert summary(buyer)['totals'] == {'quantity': 7, 'revenue': 260, 'orders': 2}
+    next_year = f'{datetime.utcnow().year + 1}-01-01'
+    assert summary(buyer, **{'from': next_year})['totals'] == {'quantity': 0, 'revenue': 0, 'orders': 0}
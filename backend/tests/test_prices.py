@@ -0,0 +1,54 @@
+import io
+from conftest import PASSWORD, admin_client
+from forecast import run_forecasts
+
+PRICES_CSV = (
+    'commodity,market,modal_price,arrival_date\n'
+    'Wheat,Punjab,2200,2026-10-01\n'
+    'Wheat,Punjab,2250,2026-10-02\n'
+    'Rice,Karnataka,3500,2026-10-02\n'
+)
+
+def ingest(client, body=PRICES_CSV):
+    return client.post('/api/admin/prices/ingest?format=csv', data=io.BytesIO(body.encode()),
+                       content_type='text/csv')
+
+def test_signup_cannot_grant_admin(client):
+    response = client.post('/api/signup', json={'username': 'mallory', 'email': 'm@test.local',
+                                                'password': PASSWORD, 'role': 'admin'})
+    assert response.status_code == 400
+    assert client.post('/api/login', json={'username': 'mallory', 'password': PASSWORD}).status_code == 401
+
+def test_only_admins_ingest_prices(app, make_user):
+    assert ingest(make_user('farmer')).status_code == 403
+    assert ingest(make_user('buyer', role='buyer')).status_code == 403
+
+def test_admin_ingest_loads_latest_prices(app, client):
+    response = ingest(admin_client(app))
+    assert response.status_code == 200
+    assert response.get_json()['rows'] == 3
+    latest = client.get('/api/prices/latest').get_json()
+    assert [(p['crop_name'], p['location'], p['price']) for p in latest] == [
+        ('Rice', 'Karnataka', 3500), ('Wheat', 'Punjab', 2250)]
+
+def test_forecasts_are_fitted_and_served(app, client):
+    # Two years of Wheat prices peaking every March, and too little Rice history to fit
+    lines = ['commodity,market,modal_price,arrival_date']
+    for year in (2024, 2025):
+        for month in range(1, 13):
+            lines.append(f'Wheat,Punjab,{2600 if month == 3 else 2000 + 10 * month},{year}-{month:02d}-15')
+    lines += [f'Rice,Karnataka,3500,2025-{month:02d}-15' for month in (10, 11, 12)]
+    assert ingest(admin_client(app), '\n'.join(lines) + '\n').status_code == 200
+
+    with app.app_context():
+        report = run_forecasts(horizon=6, min_months=6)
+    assert (report['series'], report['skipped'], report['rows']) == (1, 1, 6)
+
+    body = client.get('/api/prices/forecast?crop=Wheat').get_json()
+    [series] = body['series']
+    assert series['location'] == 'Punjab'
+    assert [point['month'] for point in series['forecast']] == [f'2026-{month:02d}' for month in range(1, 7)]
+    assert all(point['lower'] <= point['price'] <= point['upper'] for point in series['forecast'])
+    assert series['best_month'] == '2026-03'
+    assert client.get('/api/prices/forecast?crop=Rice').get_json()['series'] == []
+    assert client.get('/api/prices/forecast').status_code == 400
@@ -0,0 +1,94 @@
+import pytest
+from models import db
+from test_crops import list_crops
+
+def query_plans(app, statements, table):
+    """EXPLAIN QUERY PLAN details for each captured SELECT that reads table"""
+    plans = []
+    with app.app_context():
+        connection = db.session.connection()
+        for statement, parameters in statements:
+            if statement.lstrip().upper().startswith('SELECT') and f'FROM {table}' in statement:
+                rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).all()
+                plans.append([row[3] for row in rows])
+    return plans
+
+def assert_indexed(plans, table, columns=(), sorts=False):
+    """Every plan searches table through an index on all of columns, with no
+    scan, and no temp sort unless sorts (window functions, cross-table orders)"""
+    assert plans, f'no query on {table} was captured'
+    for plan in plans:
+        text = ' | '.join(plan)
+        assert f'SEARCH {table} USING' in text, text
+        for column in columns:
+            assert f'{column}=?' in text, text
+        assert f'SCAN {table}' not in text, text
+        if not sorts:
+            assert 'TEMP B-TREE' not in text, text
+
+CROP_LISTINGS = [
+    {'limit': 10},
+    {'limit': 10, 'category': 'cereal'},
+    {'limit': 10, 'location': 'Ludhiana, Punjab'},
+    {'limit': 10, 'category': 'cereal', 'location': 'Ludhiana, Punjab'},
+    {'limit': 10, 'sort': 'price_per_unit', 'order': 'asc'},
+    {'limit': 10, 'sort': 'price_per_unit', 'category': 'cereal'},
+    {'limit': 10, 'sort': 'quantity'},
+    {'limit': 10, 'sort': 'quantity', 'order': 'asc', 'category': 'cereal'},
+]
+
+@pytest.mark.parametrize('args', CROP_LISTINGS)
+def test_crop_listing_plans_use_an_index(app, client, make_user, count_queries, args):
+    list_crops(make_user('farmer'), 12)
+    first = client.get('/api/crops', query_string=args).get_json()
+    with count_queries() as counter:
+        response = client.get('/api/crops', query_string=dict(args, cursor=first['next_cursor']))
+    assert response.status_code == 200
+    filters = [column for column in ('category', 'location') if column in args]
+    assert_indexed(query_plans(app, counter.statements, 'crops'), 'crops', ['status'] + filters)
+
+def test_transaction_and_chat_history_plans_use_an_index(app, make_user, count_queries):
+    farmer = make_user('farmer')
+    list_crops(farmer, 2)
+    buyer = make_user('buyer', role='buyer')
+    crop_id = buyer.get('/api/crops?limit=1').get_json()['crops'][0]['id']
+    assert buyer.post('/api/transactions', json={'crop_id': crop_id, 'quantity': 1}).status_code == 201
+
+    with count_queries() as counter:
+        assert buyer.get('/api/transactions?limit=5').status_code == 200
+        assert buyer.get('/api/chat/history?limit=5').status_code == 200
+    assert_indexed(query_plans(app, counter.statements, 'transactions'), 'transactions', ['buyer_id'])
+    assert_indexed(query_plans(app, counter.statements, 'chat_messages'), 'chat_messages', ['user_id'])
+
+def test_ledger_order_and_price_plans_use_an_index(app, make_user, count_queries):
+    farmer = make_user('farmer')
+    list_crops(farmer, 2)
+    buyer = make_user('buyer', role='buyer')
+    crop_id = buyer.get('/api/crops?limit=1').get_json()['crops'][0]['id']
+    assert buyer.post('/api/transactions', json={'crop_id': crop_id, 'quantity': 1}).status_code == 201
+    assert buyer.post('/api/orders', json={'crop_name': 'Rice', 'quantity': 5, 'max_price': 1}).status_code == 201
+
+    with count_queries() as ledger:
+        assert farmer.get('/api/transactions?role=seller&limit=5').status_code == 200
+    with count_queries() as orders:
+        assert buyer.get('/api/orders?limit=5').status_code == 200
+    with count_queries() as latest_by_crop:
+        assert buyer.get('/api/prices/latest?crop=Wheat').status_code == 200
+    with count_queries() as latest_by_location:
+        assert buyer.get('/api/prices/latest?location=Punjab').status_code == 200
+    with count_queries() as daily:
+        assert buyer.get('/api/prices/history?crop=Wheat&location=Punjab').status_code == 200
+    with count_queries() as monthly:
+        assert buyer.get('/api/prices/history?crop=Wheat&bucket=month').status_code == 200
+
+    # The seller's ledger is found through their listings, then sorted by date
+    assert_indexed(query_plans(app, ledger.statements, 'transactions'), 'crops', ['farmer_id'], sorts=True)
+    assert_indexed(query_plans(app, ledger.statements, 'transactions'), 'transactions', ['crop_id'], sorts=True)
+    assert_indexed(query_plans(app, orders.statements, 'buy_orders'), 'buy_orders', ['buyer_id'])
+    assert_indexed(query_plans(app, latest_by_crop.statements, 'latest_prices'), 'latest_prices', ['crop_name'])
+    assert_indexed(query_plans(app, latest_by_location.statements, 'latest_prices'), 'latest_prices',
+                   ['location'], sorts=True)
+    # History buckets are ranked with window functions, which always sort
+    assert_indexed(query_plans(app, daily.statements, 'prices'), 'prices', ['crop_name', 'location'], sorts=True)
+    assert_indexed(query_plans(app, monthly.statements, 'price_rollups'), 'price_rollups',
+                   ['bucket', 'crop_name'], sorts=True)
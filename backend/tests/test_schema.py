@@ -0,0 +1,26 @@
+from models import db, upgrade_schema
+
+def index_names(table):
+    return {index['name'] for index in db.inspect(db.engine).get_indexes(table)}
+
+def test_upgrade_drops_stale_indexes_and_duplicate_prices(app):
+    with app.app_context():
+        # The layout an older release left behind
+        with db.engine.begin() as connection:
+            connection.exec_driver_sql('DROP INDEX uq_prices_crop_location_date')
+            connection.exec_driver_sql('CREATE INDEX ix_prices_crop_location_date ON prices (crop_name, location, date)')
+            connection.exec_driver_sql('CREATE INDEX ix_transactions_buyer_id ON transactions (buyer_id)')
+            for price in (2000, 2100, 2200):
+                connection.exec_driver_sql(
+                    "INSERT INTO prices (crop_name, location, price, date) VALUES ('Wheat', 'Punjab', ?, '2026-10-01 00:00:00')",
+                    (price,))
+            connection.exec_driver_sql(
+                "INSERT INTO prices (crop_name, location, price, date) VALUES ('Rice', 'Punjab', 3500, '2026-10-01 00:00:00')")
+
+        upgrade_schema()
+
+        assert 'uq_prices_crop_location_date' in index_names('prices')
+        assert 'ix_prices_crop_location_date' not in index_names('prices')
+        assert 'ix_transactions_buyer_id' not in index_names('transactions')
+        rows = db.session.execute(db.text('SELECT crop_name, price FROM prices ORDER BY crop_name')).all()
+        assert [tuple(row) for row in rows] == [('Rice', 3500), ('Wheat', 2200)]
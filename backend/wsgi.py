@@ -0,0 +1,18 @@
+"""Production entry point.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+    uvicorn --factory wsgi:create_asgi_app --workers 4   (needs asgiref)
+
+The schema is migrated once by the gunicorn master (see gunicorn.conf.py);
+with other servers run `flask --app app migrate-db` before starting.
+"""
+from app import app
+
+def create_app():
+    """App factory for servers that take one, e.g. gunicorn 'wsgi:create_app()'"""
+    return app
+
+def create_asgi_app():
+    """The same app behind an ASGI adapter, for uvicorn/hypercorn"""
+    from asgiref.wsgi import WsgiToAsgi  # optional dependency, only needed under ASGI servers
+    return WsgiToAsgi(create_app())